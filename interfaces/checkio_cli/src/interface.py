@@ -2,6 +2,9 @@ import os
 from datetime import datetime
 import json
 import atexit
+import gzip
+import zlib
+from base64 import b64decode
 
 from handlers.base import BaseHandler
 from server import TCPConsoleServer
@@ -14,7 +17,12 @@ MAP_BUILDING = 1
 # TODO: out current lap
 
 LOG_DIRNAME = "log"
+BINARY_LOG_EXTENSION = ".cbl"
 ERR_LOG_FILE_OPEN = "Cann't open log file for writing - {}"
+DECOMPRESSORS = {
+    'zlib': zlib.decompress,
+    'gzip': gzip.decompress,
+}
 
 
 class FightHandler(BaseHandler):
@@ -28,6 +36,7 @@ class FightHandler(BaseHandler):
             global MAP_X
             MAP_X = gg['MAP_X']
         self.ROUTING['battle'] = 'handler_battle'
+        self.log_chunks = []
         if not os.path.exists(LOG_DIRNAME):
             os.mkdir(LOG_DIRNAME)
         log_filename = "battle_log_{}.json".format(str(datetime.now()))
@@ -45,8 +54,30 @@ class FightHandler(BaseHandler):
         self.log_file.close()
 
     def write_log(self, data):
+        if 'chunk' in data:
+            self.write_log_chunk(data)
+            return
         self.log_file.write(json.dumps(data))
 
+    def write_log_chunk(self, data):
+        self.log_chunks.append(data)
+        if len(self.log_chunks) < data['chunks']:
+            return
+        self.log_chunks.sort(key=lambda chunk: chunk['chunk'])
+        log_data = b64decode(''.join(chunk['data'] for chunk in self.log_chunks))
+        self.log_chunks = []
+        if data['compression']:
+            log_data = DECOMPRESSORS[data['compression']](log_data)
+        if data['format'] == 'binary':
+            self.write_binary_log(log_data)
+        else:
+            self.log_file.write(log_data.decode('utf-8'))
+
+    def write_binary_log(self, log_data):
+        log_filename = os.path.splitext(self.log_file.name)[0] + BINARY_LOG_EXTENSION
+        with open(log_filename, "wb") as log_file:
+            log_file.write(log_data)
+
     def handler_battle(self, data, request_id, stream_r):
         if not data.get("is_stream") and self.log_file:
             self.write_log(data)
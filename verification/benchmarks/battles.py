@@ -0,0 +1,303 @@
+"""
+Run synthetic battles headlessly and measure the referee.
+
+    python benchmarks/battles.py [--scenarios small towers] [--initial sleeping_items=true]
+                                 [--json result.json] [--compare baseline.json]
+
+Battles of benchmarks/scenarios.py are run by FightHandler in the headless mode,
+the codes of the players are played in the process by bots which send the same
+messages through FightItem.handle_result, events are handled between frames.
+Frames per second, route planning, event dispatch and peak memory are reported,
+with --compare changes against a previous --json result are printed.
+
+The referee module needs checkio_referee (see requirements.txt) and settings_env.
+Install the requirements, benchmarks/settings_env.py without environments
+is found first as the directory of the script is the first in sys.path:
+
+    pip install -r requirements.txt
+    python benchmarks/battles.py
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from tornado.ioloop import IOLoop
+
+from referee import FightHandler
+from tools import ROLE, INITIAL
+from scenarios import generate_battle_info
+
+SCENARIOS = {
+    'small': {'map_size': 40},
+    'dense': {'map_size': 40, 'buildings': 0.2},
+    'towers': {'map_size': 40, 'towers': 16},
+    'horde': {'map_size': 60, 'units': 48},
+    'cluttered': {'map_size': 60, 'obstacles': 0.15},
+    'large': {'map_size': 100, 'buildings': 0.1, 'towers': 12, 'units': 36, 'obstacles': 0.05},
+}
+
+
+class BotEnvironment(object):
+    """
+    The environment of an item in the process, it has the interface of
+    BattleEnvironmentClient which FightItem uses.
+    """
+
+    def __init__(self, item):
+        self.item = item
+        self.result = None
+        self.callbacks = {}  # lookup key -> callback
+        self.events = []
+
+    def select_result(self, data):
+        self.result = data
+
+    def confirm(self):
+        pass
+
+    def bad_action(self, error=None):
+        pass
+
+    def send_action_error(self, action, data, error):
+        pass
+
+    def set_wire_format(self, formats):
+        pass
+
+    def send_event(self, lookup_key, data, frame=None):
+        self.events.append((lookup_key, data))
+
+    def send_world_state(self, data):
+        pass
+
+    def request(self, method, **data):
+        self.item.handle_result(dict(data, method=method))
+        return self.result
+
+    def select(self, field):
+        return self.request('select', fields=[{'field': field, 'data': {'id': self.item.id}}])[0]
+
+    def subscribe(self, event, callback, data=None):
+        lookup_key = len(self.callbacks)
+        self.callbacks[lookup_key] = callback
+        self.request('subscribe', event=event, lookup_key=lookup_key, data=data)
+
+    def attack(self, item_id):
+        self.request('set_action', action='attack', data={'id': item_id})
+
+    def handle_events(self):
+        events, self.events = self.events, []
+        for lookup_key, data in events:
+            self.callbacks.pop(lookup_key)(data)
+
+
+class TowerBot(BotEnvironment):
+    """
+    the code of towers from benchmarks/scenarios.py
+    """
+
+    def start(self):
+        self.subscribe('enemy_in_my_firing_range', self.unit_in_firing_range)
+
+    def unit_in_firing_range(self, data):
+        self.attack(data['id'])
+        self.subscribe('im_idle', self.search_next_target, {})
+
+    def search_next_target(self, data):
+        enemies = self.select('enemy_items_in_my_firing_range')
+        if enemies:
+            self.unit_in_firing_range(enemies[0])
+        else:
+            self.subscribe('enemy_in_my_firing_range', self.unit_in_firing_range)
+
+
+class UnitBot(BotEnvironment):
+    """
+    the code of units from benchmarks/scenarios.py
+    """
+
+    def start(self):
+        self.search_and_destroy()
+
+    def search_and_destroy(self, data=None):
+        enemy = self.select('nearest_enemy')
+        if enemy is None:
+            return
+        self.attack(enemy['id'])
+        self.subscribe('death', self.search_and_destroy, {'id': enemy['id']})
+
+
+class EditorClient(object):
+
+    def __init__(self):
+        self.messages = 0
+
+    def send_battle(self, data):
+        self.messages += 1
+
+
+class BenchmarkFightHandler(FightHandler):
+    """
+    FightHandler with bots instead of environments and timers of route planning
+    and event dispatch
+    """
+
+    def __init__(self, battle_info):
+        super().__init__({'battle_info': battle_info}, EditorClient(), None)
+        self.bots = []
+        self.timings = {'route_s': 0, 'routes': 0, 'events_s': 0, 'events': 0}
+
+    def start_bots(self):
+        for item in self.fighters.values():
+            if item.is_executable:
+                bot = UnitBot(item) if item.role == ROLE.UNIT else TowerBot(item)
+                item._env = bot
+                self.bots.append(bot)
+        for bot in self.bots:
+            bot.start()
+
+    def compute_frame(self):
+        # messages of environments come between frames
+        for bot in self.bots:
+            if not bot.item.is_dead:
+                bot.handle_events()
+        super().compute_frame()
+
+    def get_route(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().get_route(*args, **kwargs)
+        finally:
+            self.timings['route_s'] += time.perf_counter() - started
+            self.timings['routes'] += 1
+
+    def _send_event(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super()._send_event(*args, **kwargs)
+        finally:
+            self.timings['events_s'] += time.perf_counter() - started
+            self.timings['events'] += 1
+
+    def stop(self):
+        IOLoop.current().stop()
+
+
+def run_battle(battle_info, initial, seed):
+    """
+    :return: the finished BenchmarkFightHandler and seconds of the battle
+    """
+    battle_info = json.loads(json.dumps(battle_info))  # items are changed by the referee
+    battle_info.update({INITIAL.HEADLESS: True, INITIAL.IS_STREAM: False}, **initial)
+    random.seed(seed)
+    handler = BenchmarkFightHandler(battle_info)
+    started = time.perf_counter()
+    handler.start()
+    handler.start_bots()
+    IOLoop.current().start()
+    return handler, time.perf_counter() - started
+
+
+def measure(name, params, initial, seed=1):
+    battle_info = generate_battle_info(seed=seed, **params)
+    handler, elapsed = run_battle(battle_info, initial, seed)
+    frames = handler.current_frame
+    timings = handler.timings
+
+    tracemalloc.start()
+    run_battle(battle_info, initial, seed)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'scenario': name,
+        'params': params,
+        'items': len(handler.fighters),
+        'frames': frames,
+        'seconds': round(elapsed, 4),
+        'frames_per_second': round(frames / elapsed, 1) if elapsed else 0,
+        'route_ms': round(timings['route_s'] * 1000, 2),
+        'routes': timings['routes'],
+        'route_share': round(timings['route_s'] / elapsed, 3) if elapsed else 0,
+        'event_dispatch_ms': round(timings['events_s'] * 1000, 2),
+        'event_dispatches': timings['events'],
+        'event_dispatch_us_per_frame': round(timings['events_s'] / max(frames, 1) * 1e6, 1),
+        'peak_memory_bytes': peak_memory,
+        'winner': handler.battle_log['result'].get('winner'),
+        'stats': handler.get_stats(),
+    }
+
+
+def parse_initial(values):
+    """
+    key=value pairs of initial data, values are JSON
+    """
+    initial = {}
+    for value in values:
+        key, _, data = value.partition('=')
+        try:
+            initial[key] = json.loads(data)
+        except ValueError:
+            initial[key] = data
+    return initial
+
+
+def compare(result, baseline_path):
+    with open(baseline_path) as baseline_file:
+        baseline = {row['scenario']: row for row in json.load(baseline_file)['results']}
+    print('\nchanges against {}'.format(baseline_path))
+    print('{:>10}{:>12}{:>12}{:>12}{:>12}'.format(
+        'scenario', 'frames/s', 'route, ms', 'events, ms', 'memory'))
+    for row in result:
+        old = baseline.get(row['scenario'])
+        if old is None:
+            continue
+        changes = [row[key] / old[key] - 1 if old[key] else 0
+                   for key in ('frames_per_second', 'route_ms', 'event_dispatch_ms',
+                               'peak_memory_bytes')]
+        print('{:>10}'.format(row['scenario']) +
+              ''.join('{:>+11.1%} '.format(change) for change in changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS),
+                        default=sorted(SCENARIOS))
+    parser.add_argument('--initial', nargs='*', default=[],
+                        help='flags of the initial data as key=value, for instance '
+                             'sleeping_items=true route_landmarks=4')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='write results to the file')
+    parser.add_argument('--compare', help='a result of --json to compare with')
+    args = parser.parse_args()
+
+    initial = dict(parse_initial(args.initial), **{INITIAL.COLLECT_STATS: True})
+    result = [measure(name, SCENARIOS[name], initial, args.seed) for name in args.scenarios]
+    print('{:>10}{:>8}{:>8}{:>10}{:>12}{:>12}{:>14}{:>12}'.format(
+        'scenario', 'items', 'frames', 'frames/s', 'route, ms', 'events, ms',
+        'events, us/fr', 'memory, MB'))
+    for row in result:
+        print('{scenario:>10}{items:>8}{frames:>8}{frames_per_second:>10}{route_ms:>12}'
+              '{event_dispatch_ms:>12}{event_dispatch_us_per_frame:>14}{memory_mb:>12}'.format(
+                  memory_mb=round(row['peak_memory_bytes'] / 2 ** 20, 2), **row))
+    if args.compare:
+        compare(result, args.compare)
+    if args.json:
+        with open(args.json, 'w') as result_file:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'seed': args.seed,
+                'initial': initial,
+                'results': result
+            }, result_file, indent=2, default=str)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Measure building and memory of the route graph on large maps.
+
+    python benchmarks/route_graph.py [--sizes 40 100 200] [--searches 20] [--json result.json]
+
+A map of the size (in tiles) is filled with random buildings like create_map does,
+then the graph is built with grid_to_graph and routes between random cells are searched.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from tools import fill_square, grid_to_graph, find_route
+
+GRID_SCALE = 2
+
+
+def build_grid(map_size, seed):
+    rnd = random.Random(seed)
+    size = map_size * GRID_SCALE
+    grid = [[1] * size for _ in range(size)]
+    for _ in range(size * size // 200):
+        fill_square(grid, rnd.randrange(size), rnd.randrange(size), rnd.choice([2, 4, 6]), 0)
+    return grid
+
+
+def measure(map_size, searches, seed=1):
+    grid = build_grid(map_size, seed)
+    started = time.perf_counter()
+    grid_to_graph(grid)
+    build_time = time.perf_counter() - started
+
+    tracemalloc.start()
+    graph = grid_to_graph(grid)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    rnd = random.Random(seed)
+    free = [(i, j) for i, row in enumerate(grid) for j, el in enumerate(row) if el]
+    pairs = [(rnd.choice(free), rnd.choice(free)) for _ in range(searches)]
+    started = time.perf_counter()
+    for start_cell, end_cell in pairs:
+        find_route(grid, graph, start_cell, end_cell)
+    search_time = time.perf_counter() - started
+    return {
+        'map_size': map_size,
+        'cells': len(grid) * len(grid[0]),
+        'edges': graph.edges_count,
+        'build_s': round(build_time, 4),
+        'memory_bytes': memory,
+        'bytes_per_edge': round(memory / max(graph.edges_count, 1), 1),
+        'search_ms': round(search_time / max(searches, 1) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[40, 100, 200])
+    parser.add_argument('--searches', type=int, default=20)
+    parser.add_argument('--json', help='write results to the file')
+    args = parser.parse_args()
+
+    result = [measure(map_size, args.searches) for map_size in args.sizes]
+    print('{:>8}{:>10}{:>10}{:>10}{:>12}{:>8}{:>12}'.format(
+        'map', 'cells', 'edges', 'build, s', 'memory, MB', 'B/edge', 'search, ms'))
+    for row in result:
+        print('{map_size:>8}{cells:>10}{edges:>10}{build_s:>10}{memory_mb:>12}'
+              '{bytes_per_edge:>8}{search_ms:>12}'.format(
+                  memory_mb=round(row['memory_bytes'] / 2 ** 20, 2), **row))
+    if args.json:
+        with open(args.json, 'w') as result_file:
+            json.dump({'searches': args.searches, 'results': result}, result_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,355 @@
+"""
+Time and verify route functions on the corpus of grids with golden routes.
+
+    python benchmarks/routes.py [--repeat 3] [--json result.json]
+    python benchmarks/routes.py --update
+
+The corpus (benchmarks/route_corpus.json) has open fields, mazes, building clusters
+like the real maps, blocked and unreachable goals. For every grid grid_to_graph,
+find_route, straighten_route and cell_visibility are timed and checked against the
+golden data: the same graph, routes of the same cost which are valid on the grid,
+straightened routes of the same length and the same visibility.
+--update builds the corpus again with the current functions, do it only when
+a change of routes is intended.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from tools import fill_square, grid_to_graph, find_route, straighten_route
+from tools.grid import cell_visibility, SQRT_2
+from tools.distances import euclidean_distance
+from scenarios import generate_battle_info
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'route_corpus.json')
+GRID_SCALE = 2  # FightHandler.GRID_SCALE
+CUT_FROM_BUILDING = 1  # see referee.py
+FREE, BLOCKED = '.', '#'
+EPSILON = 1e-6
+
+
+def open_field(size, seed):
+    return [[1] * size for _ in range(size)]
+
+
+def scattered(size, seed, share=0.08):
+    rnd = random.Random(seed)
+    return [[0 if rnd.random() < share else 1 for _ in range(size)] for _ in range(size)]
+
+
+def maze(size, seed):
+    """
+    a maze of one cell corridors by the randomized depth-first search, size is odd
+    """
+    rnd = random.Random(seed)
+    grid = [[0] * size for _ in range(size)]
+    grid[1][1] = 1
+    stack = [(1, 1)]
+    while stack:
+        i, j = stack[-1]
+        steps = [(di, dj) for di, dj in ((-2, 0), (2, 0), (0, -2), (0, 2))
+                 if 0 < i + di < size - 1 and 0 < j + dj < size - 1 and not grid[i + di][j + dj]]
+        if not steps:
+            stack.pop()
+            continue
+        di, dj = rnd.choice(steps)
+        grid[i + di // 2][j + dj // 2] = grid[i + di][j + dj] = 1
+        stack.append((i + di, j + dj))
+    return grid
+
+
+def battle_map(size, seed, **params):
+    """
+    the grid of a generated battle as FightHandler.create_map makes it
+    """
+    battle_info = generate_battle_info(map_size=size, seed=seed, **params)
+    grid = [[1] * size * GRID_SCALE for _ in range(size * GRID_SCALE)]
+    for element in battle_info['map_elements']:
+        size_in_tiles = element.get('size', 0)
+        cut_size = max(size_in_tiles - CUT_FROM_BUILDING, 0)
+        if not cut_size:
+            continue
+        x, y = (position + size_in_tiles / 2 for position in element['tile_position'])
+        cells = cut_size * GRID_SCALE
+        fill_square(grid, int(x * GRID_SCALE) - cells // 2, int(y * GRID_SCALE) - cells // 2,
+                    cells, 0)
+    return grid
+
+
+def walled(size, seed):
+    """
+    an open field with a closed box, goals in the box are unreachable
+    """
+    grid = open_field(size, seed)
+    low, high = size // 3, size * 2 // 3
+    for k in range(low, high + 1):
+        grid[low][k] = grid[high][k] = grid[k][low] = grid[k][high] = 0
+    return grid
+
+
+GRIDS = [
+    # name, function, size, seed, kwargs, kind of goals
+    ('open_80', open_field, 80, 1, {}, 'free'),
+    ('scattered_80', scattered, 80, 2, {}, 'free'),
+    ('maze_41', maze, 41, 3, {}, 'free'),
+    ('maze_81', maze, 81, 4, {}, 'free'),
+    ('battle_40', battle_map, 40, 5, {}, 'free'),
+    ('battle_dense_40', battle_map, 40, 6, {'buildings': 0.2, 'towers': 8}, 'free'),
+    ('battle_blocked_goals_40', battle_map, 40, 7, {'buildings': 0.2}, 'blocked'),
+    ('battle_100', battle_map, 100, 8, {'buildings': 0.1, 'towers': 12,
+                                        'obstacles': 0.05}, 'free'),
+    ('walled_60', walled, 60, 9, {}, 'walled'),
+]
+ROUTES_PER_GRID = 12
+VISIBILITY_PAIRS = 200
+VISIBILITY_DISTANCE = 20
+
+
+def encode_grid(grid):
+    return [''.join(FREE if el else BLOCKED for el in row) for row in grid]
+
+
+def decode_grid(rows):
+    return [[1 if el == FREE else 0 for el in row] for row in rows]
+
+
+def graph_edges(grid, graph):
+    """
+    edges of every cell of the grid as graph[cell] gives them, (row, column, cost),
+    in the order which doesn't depend on the order of neighbours.
+    Costs are floats, so any form of the graph with graph[cell] is comparable
+    """
+    for i, row in enumerate(grid):
+        for j in range(len(row)):
+            yield (i, j), sorted((neighbour[0], neighbour[1], round(float(neighbour[2]), 9))
+                                 for neighbour in graph[(i, j)])
+
+
+def graph_digest(grid, graph):
+    """
+    :return: number of edges and the digest of them
+    """
+    digest = hashlib.sha1()
+    count = 0
+    for cell, edges in graph_edges(grid, graph):
+        count += len(edges)
+        digest.update(repr((cell, edges)).encode())
+    return count, digest.hexdigest()
+
+
+def route_cost(route):
+    return sum(1 if a[0] == b[0] or a[1] == b[1] else SQRT_2 for a, b in zip(route, route[1:]))
+
+
+def route_length(route):
+    return sum(euclidean_distance(a, b) for a, b in zip(route, route[1:]))
+
+
+def goal_radius(grid, end, goal):
+    return 0 if grid[goal[0]][goal[1]] else max(abs(end[0] - goal[0]), abs(end[1] - goal[1]))
+
+
+def build_cases(grid, kind, rnd):
+    height, width = len(grid), len(grid[0])
+    free = [(i, j) for i in range(height) for j in range(width) if grid[i][j]]
+    blocked = [(i, j) for i in range(height) for j in range(width) if not grid[i][j]]
+    pairs = []
+    for number in range(ROUTES_PER_GRID):
+        start = rnd.choice(free)
+        if kind == 'blocked' and blocked:
+            goal = rnd.choice(blocked)
+        elif kind == 'walled' and number % 2:
+            # in the middle of the box
+            goal = (height // 2 + rnd.randint(-2, 2), width // 2 + rnd.randint(-2, 2))
+        else:
+            goal = rnd.choice(free)
+        pairs.append((start, goal))
+    graph = grid_to_graph(grid)
+    cases = []
+    for start, goal in pairs:
+        route = tuple(map(tuple, find_route(grid, graph, start, goal)))
+        straightened = straighten_route(grid, route) if route else []
+        cases.append({
+            'start': start,
+            'goal': goal,
+            'route': route,
+            'cost': route_cost(route),
+            'goal_radius': goal_radius(grid, route[-1], goal) if route else None,
+            'straightened': straightened,
+            'straightened_length': route_length(straightened),
+        })
+    return cases
+
+
+def build_visibility(grid, rnd):
+    free = [(i, j) for i, row in enumerate(grid) for j, el in enumerate(row) if el]
+    result = []
+    while len(result) < VISIBILITY_PAIRS:
+        start, end = rnd.choice(free), rnd.choice(free)
+        if start != end and euclidean_distance(start, end) <= VISIBILITY_DISTANCE:
+            result.append([start, end, cell_visibility(grid, start, end)])
+    return result
+
+
+def build_corpus():
+    corpus = []
+    for name, function, size, seed, kwargs, kind in GRIDS:
+        grid = function(size, seed, **kwargs)
+        rnd = random.Random(seed)
+        edges, digest = graph_digest(grid, grid_to_graph(grid))
+        corpus.append({
+            'name': name,
+            'grid': encode_grid(grid),
+            'edges': edges,
+            'graph_digest': digest,
+            'routes': build_cases(grid, kind, rnd),
+            'visibility': build_visibility(grid, rnd),
+        })
+    return {'sqrt_2': SQRT_2, 'grids': corpus}
+
+
+def check_route(grid, case, route):
+    """
+    :return: a description of the problem or None
+    """
+    route = [tuple(cell) for cell in route]
+    if not case['route']:
+        return None if not route else 'a route to the unreachable goal'
+    if not route:
+        return 'no route'
+    if route[0] != tuple(case['start']):
+        return 'wrong start'
+    for a, b in zip(route, route[1:]):
+        di, dj = b[0] - a[0], b[1] - a[1]
+        if max(abs(di), abs(dj)) != 1 or not grid[b[0]][b[1]]:
+            return 'a wrong step {} -> {}'.format(a, b)
+        if di and dj and not (grid[a[0] + di][a[1]] and grid[a[0]][a[1] + dj]):
+            return 'a corner is cut {} -> {}'.format(a, b)
+    if goal_radius(grid, route[-1], case['goal']) != case['goal_radius']:
+        return 'wrong end {}'.format(route[-1])
+    if abs(route_cost(route) - case['cost']) > EPSILON:
+        return 'cost {} instead of {}'.format(route_cost(route), case['cost'])
+    return None
+
+
+def check_straightened(case, straightened):
+    straightened = [tuple(cell) for cell in straightened]
+    route = [tuple(cell) for cell in case['route']]
+    if not route:
+        return None
+    if straightened[0] != route[0] or straightened[-1] != route[-1]:
+        return 'wrong ends of the straightened route'
+    position = 0
+    for cell in straightened:
+        if cell not in route[position:]:
+            return 'the straightened route has cells out of the route'
+        position = route.index(cell, position)
+    if abs(route_length(straightened) - case['straightened_length']) > EPSILON:
+        return 'length {} instead of {}'.format(route_length(straightened),
+                                                case['straightened_length'])
+    return None
+
+
+def timed(function, repeat):
+    """
+    :return: result of the last call and the best time of calls
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def measure(entry, repeat):
+    grid = decode_grid(entry['grid'])
+    errors = []
+    graph, graph_time = timed(lambda: grid_to_graph(grid), repeat)
+    if graph_digest(grid, graph) != (entry['edges'], entry['graph_digest']):
+        errors.append('grid_to_graph: another graph')
+
+    cases = entry['routes']
+    routes, route_time = timed(
+        lambda: [find_route(grid, graph, tuple(case['start']), tuple(case['goal']))
+                 for case in cases], repeat)
+    for case, route in zip(cases, routes):
+        error = check_route(grid, case, route)
+        if error:
+            errors.append('find_route {} -> {}: {}'.format(case['start'], case['goal'], error))
+
+    inputs = [[tuple(cell) for cell in case['route']] for case in cases]
+    straightened, straighten_time = timed(
+        lambda: [straighten_route(grid, route) if route else [] for route in inputs], repeat)
+    for case, result in zip(cases, straightened):
+        error = check_straightened(case, result)
+        if error:
+            errors.append('straighten_route {} -> {}: {}'.format(case['start'], case['goal'],
+                                                                 error))
+
+    pairs = [(tuple(start), tuple(end)) for start, end, _ in entry['visibility']]
+    visible, visibility_time = timed(
+        lambda: [cell_visibility(grid, start, end) for start, end in pairs], repeat)
+    mismatches = sum(result != golden for result, (_, _, golden) in
+                     zip(visible, entry['visibility']))
+    if mismatches:
+        errors.append('cell_visibility: {} of {} pairs differ'.format(mismatches, len(pairs)))
+
+    return {
+        'grid': entry['name'],
+        'cells': len(grid) * len(grid[0]),
+        'routes': len(cases),
+        'grid_to_graph_ms': round(graph_time * 1000, 3),
+        'find_route_ms': round(route_time * 1000, 3),
+        'straighten_route_ms': round(straighten_time * 1000, 3),
+        'cell_visibility_ms': round(visibility_time * 1000, 3),
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='write results to the file')
+    parser.add_argument('--update', action='store_true',
+                        help='build the corpus with the current functions')
+    parser.add_argument('--corpus', default=CORPUS_PATH)
+    args = parser.parse_args()
+
+    if args.update:
+        with open(args.corpus, 'w') as corpus_file:
+            json.dump(build_corpus(), corpus_file, separators=(',', ':'))
+        print('the corpus is written to {}'.format(args.corpus))
+        return
+
+    with open(args.corpus) as corpus_file:
+        corpus = json.load(corpus_file)
+    if corpus['sqrt_2'] != SQRT_2:
+        print('the cost of a diagonal step is changed, costs of the corpus are not comparable')
+    result = [measure(entry, args.repeat) for entry in corpus['grids']]
+    print('{:>24}{:>8}{:>8}{:>11}{:>11}{:>14}{:>13}  {}'.format(
+        'grid', 'cells', 'routes', 'graph, ms', 'route, ms', 'straight, ms', 'visible, ms',
+        'check'))
+    for row in result:
+        print('{grid:>24}{cells:>8}{routes:>8}{grid_to_graph_ms:>11}{find_route_ms:>11}'
+              '{straighten_route_ms:>14}{cell_visibility_ms:>13}  {check}'.format(
+                  check='ok' if not row['errors'] else '{} errors'.format(len(row['errors'])),
+                  **row))
+    for row in result:
+        for error in row['errors']:
+            print('{}: {}'.format(row['grid'], error))
+    if args.json:
+        with open(args.json, 'w') as result_file:
+            json.dump({'repeat': args.repeat, 'results': result}, result_file, indent=2)
+    if any(row['errors'] for row in result):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
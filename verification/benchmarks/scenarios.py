@@ -0,0 +1,196 @@
+"""
+Generate battle_info payloads of synthetic battles.
+
+    python benchmarks/scenarios.py [--map-size 40] [--buildings 0.05] [--towers 4]
+                                   [--units 12] [--obstacles 0.03] [--seed 1]
+                                   [--output battle.json]
+
+Battles are built like initial/python_3: a defender with a command center, towers
+and buildings, an attacker with units which land from crafts at the bottom of the map,
+obstacles are spread over the map. The codes of the players are the same as there.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from tools import ROLE, ATTRIBUTE, INITIAL, PLAYER, DEFEAT_REASON, MAX_LAND_POSITIONS
+
+DEFENDER, ATTACKER = 0, 1
+TOWER_CODE, UNIT_CODE = 0, 1
+CODES = [
+    {'id': TOWER_CODE, 'code': '\n'.join([
+        "from battle import commander",
+        "tower_client = commander.Client()",
+        "",
+        "",
+        "def search_next_target(data, **kwargs):",
+        "    enemies = tower_client.ask_enemy_items_in_my_firing_range()",
+        "    if enemies:",
+        "        unit_in_firing_range(enemies[0])",
+        "    else:",
+        "        tower_client.subscribe_enemy_in_my_firing_range(unit_in_firing_range)",
+        "",
+        "",
+        "def unit_in_firing_range(data, **kwargs):",
+        "    tower_client.attack_item(data['id'])",
+        "    tower_client.subscribe_im_idle(search_next_target)",
+        "",
+        "tower_client.subscribe_enemy_in_my_firing_range(unit_in_firing_range)",
+        ""])},
+    {'id': UNIT_CODE, 'code': '\n'.join([
+        "from battle import commander",
+        "unit_client = commander.Client()",
+        "",
+        "",
+        "def search_and_destroy(data=None, *args, **kwargs):",
+        "    enemy = unit_client.ask_nearest_enemy()",
+        "    unit_client.attack_item(enemy['id'])",
+        "    unit_client.subscribe_the_item_is_dead(enemy['id'], search_and_destroy)",
+        "",
+        "search_and_destroy()",
+        ""])},
+]
+
+CENTER = {'type': 'commandCenter', 'alias': 'commandCenter', 'size': 4, 'hit_points': 2500}
+TOWER = {'type': 'sentryGun', 'alias': 'sniper', 'size': 3, 'hit_points': 1000,
+         'damage_per_shot': 55, 'firing_range': 12, 'rate_of_fire': 1, 'code': TOWER_CODE}
+BUILDING = {'type': 'crystaliteFarm', 'alias': 'crystaliteFarm', 'size': 3, 'hit_points': 1000}
+OBSTACLES = [{'type': 'rock', 'alias': 'rock', 'size': size, 'hit_points': 9000000}
+             for size in (1, 2, 3, 4)]
+UNIT = {'type': 'infantryBot', 'c_size': 1, 'damage_per_shot': 50, 'firing_range': 4,
+        'hit_points': 120, 'rate_of_fire': 1, 'speed': 5}
+# crafts land units in the bottom rows, so nothing is put there
+LANDING_ROWS = 4
+# crafts are at least 5 tiles apart, see FightHandler.generate_craft_place
+CRAFT_WIDTH = 5
+
+
+class TileMap(object):
+    """
+    Occupied tiles of the map, every placed square keeps a tile of a gap around it.
+    """
+
+    def __init__(self, map_size, rnd):
+        self.height, self.width = map_size
+        self.rnd = rnd
+        self.busy = [[False] * self.width for _ in range(self.height)]
+
+    def is_free(self, row, column, size):
+        for i in range(max(row - 1, 0), min(row + size + 1, self.height)):
+            for j in range(max(column - 1, 0), min(column + size + 1, self.width)):
+                if self.busy[i][j]:
+                    return False
+        return True
+
+    def place(self, size, rows=None, attempts=200):
+        """
+        :param rows: range of rows for the top row of the square
+        :return: tile position or None if there is no room
+        """
+        rows = rows or (0, self.height - LANDING_ROWS - size)
+        if rows[1] < rows[0] or self.width - size < 0:
+            return None
+        for _ in range(attempts):
+            row = self.rnd.randint(*rows)
+            column = self.rnd.randint(0, self.width - size)
+            if self.is_free(row, column, size):
+                for i in range(row, row + size):
+                    self.busy[i][column:column + size] = [True] * size
+                return [row, column]
+        return None
+
+
+def generate_battle_info(map_size=40, buildings=0.05, towers=4, units=12, obstacles=0.03,
+                         time_limit=30, seed=1):
+    """
+    :param map_size: length of a side of the square map in tiles
+    :param buildings: part of the map area which is covered by buildings of the defender
+    :param towers: number of towers
+    :param units: number of units, they land by MAX_LAND_POSITIONS from a craft
+    :param obstacles: part of the map area which is covered by rocks
+    :param time_limit: seconds of the game time for the attacker
+    :param seed: the same seed gives the same battle
+    :return: battle_info for FightHandler
+    """
+    rnd = random.Random(seed)
+    tiles = TileMap((map_size, map_size), rnd)
+    elements = []
+
+    def add(template, role, player_id, position):
+        if position is None:
+            return
+        element = dict(template, role=role, level=1, status='idle', tile_position=position)
+        if player_id is not None:
+            element[PLAYER.PLAYER_ID] = player_id
+        elements.append(element)
+
+    middle = (map_size - LANDING_ROWS) // 2 - CENTER['size'] // 2
+    add(CENTER, ROLE.CENTER, DEFENDER,
+        tiles.place(CENTER['size'], rows=(max(middle - 2, 0), max(middle + 2, 0))))
+    for _ in range(towers):
+        add(TOWER, ROLE.TOWER, DEFENDER, tiles.place(TOWER['size']))
+    area = map_size * map_size
+    for _ in range(int(area * buildings / BUILDING['size'] ** 2)):
+        add(BUILDING, ROLE.BUILDING, DEFENDER, tiles.place(BUILDING['size']))
+    covered = 0
+    while covered < area * obstacles:
+        obstacle = rnd.choice(OBSTACLES)
+        position = tiles.place(obstacle['size'])
+        if position is None:
+            break
+        add(obstacle, ROLE.OBSTACLE, None, position)
+        covered += obstacle['size'] ** 2
+
+    crafts_count = min(-(-units // MAX_LAND_POSITIONS), (map_size - 1) // CRAFT_WIDTH)
+    for number in range(crafts_count):
+        quantity = min(units - number * MAX_LAND_POSITIONS, MAX_LAND_POSITIONS)
+        elements.append({
+            ATTRIBUTE.ROLE: ROLE.CRAFT, ATTRIBUTE.ITEM_TYPE: 'craft',
+            ATTRIBUTE.ALIAS: 'craft{}'.format(number), ATTRIBUTE.LEVEL: 1,
+            PLAYER.PLAYER_ID: ATTACKER, ATTRIBUTE.OPERATING_CODE: UNIT_CODE,
+            ATTRIBUTE.UNIT_QUANTITY: quantity, ATTRIBUTE.IN_UNIT_DESCRIPTION: dict(UNIT)
+        })
+
+    return {
+        INITIAL.CODES: CODES,
+        INITIAL.IS_STREAM: True,
+        INITIAL.MAP_SIZE: [map_size, map_size],
+        INITIAL.MAP_ELEMENTS: elements,
+        'players': [
+            {'id': DEFENDER, PLAYER.ENV_NAME: 'python_3',
+             PLAYER.DEFEAT_REASONS: [DEFEAT_REASON.CENTER]},
+            {'id': ATTACKER, PLAYER.ENV_NAME: 'python_3',
+             PLAYER.DEFEAT_REASONS: [DEFEAT_REASON.UNITS, DEFEAT_REASON.TIME]}
+        ],
+        INITIAL.REWARDS: {'adamantite': 400, 'crystalite': 150},
+        INITIAL.TIME_LIMIT: time_limit
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--map-size', type=int, default=40)
+    parser.add_argument('--buildings', type=float, default=0.05)
+    parser.add_argument('--towers', type=int, default=4)
+    parser.add_argument('--units', type=int, default=12)
+    parser.add_argument('--obstacles', type=float, default=0.03)
+    parser.add_argument('--time-limit', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the battle to the file instead of stdout')
+    args = parser.parse_args()
+
+    battle_info = generate_battle_info(args.map_size, args.buildings, args.towers, args.units,
+                                       args.obstacles, args.time_limit, args.seed)
+    if args.output:
+        with open(args.output, 'w') as battle_file:
+            json.dump(battle_info, battle_file, indent=2)
+    else:
+        json.dump(battle_info, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+"""
+settings_env for the benchmarks, the referee imports it at module load.
+Battles of the benchmarks are headless, so no environment is started.
+A deployed referee has its own settings_env with the commands of the environments.
+"""
+
+ENVIRONMENTS = {}
@@ -1,8 +1,20 @@
-from battle import ROLE, PARTY
+from battle import ROLE, PARTY, FILTER
+
+
+# a select which can't be answered from the local world
+_NOT_LOCAL = object()
+
+
+def _first_or_none(items):
+    return items[0] if items else None
 
 
 class Client(object):
     CLIENT = None
+    # don't wait a confirmation for actions and subscriptions
+    PIPELINE = False
+    _initial_info = None
+    _async_actions = False
 
     def __init__(self):
         assert self.CLIENT
@@ -20,8 +32,51 @@ class Client(object):
     def set_client(cls, client):
         cls.CLIENT = client
 
-    def select(self, fields):
-        return self.CLIENT.select(fields=[fields])[0]
+    def select(self, fields, post_process=None):
+        result = self._local_select(fields)
+        if result is _NOT_LOCAL:
+            result = self.CLIENT.select(fields=[fields])[0]
+        return post_process(result) if post_process else result
+
+    def _local_select(self, fields):
+        """
+        Answer the select from the world state if the client is subscribed on it.
+        poll doesn't wait for the state of the current frame, so the referee
+        is asked while the world is older than the last received event,
+        an item could be dead already after the "death" event.
+        """
+        if self.CLIENT.world is None:
+            return _NOT_LOCAL
+        self.CLIENT.poll()
+        event_frame = self.CLIENT.event_frame
+        if event_frame is not None and self.CLIENT.world_frame < event_frame:
+            return _NOT_LOCAL
+        world = self.CLIENT.world
+        field, data = fields['field'], fields.get('data')
+        if field == 'items' and set(data) == {PARTY.REQUEST_NAME, ROLE.REQUEST_NAME}:
+            return self._filter_world(world, data[PARTY.REQUEST_NAME], data[ROLE.REQUEST_NAME])
+        if field == 'item_info' and data['id'] in world:
+            return world[data['id']]
+        if field == 'my_info' and self._initial_info is not None and self.item_id in world:
+            return world[self.item_id]
+        return _NOT_LOCAL
+
+    def _filter_world(self, world, parties, roles):
+        # the same order as the referee gives: enemies first
+        result = []
+        for party in (PARTY.ENEMY, PARTY.MY):
+            if party not in parties:
+                continue
+            for item in world.values():
+                player_id = item['player_id']
+                if player_id < 0 or item['role'] not in roles:
+                    continue
+                if (player_id == self.player_id) == (party == PARTY.MY):
+                    result.append(item)
+        return result
+
+    def batch(self):
+        return Batch(self)
 
     def ask_my_info(self):
         return self.select(
@@ -38,15 +93,43 @@ class Client(object):
                 }
             })
 
-    def ask_items(self, parties=PARTY.ALL, roles=ROLE.ALL):
+    def ask_items(self, parties=PARTY.ALL, roles=ROLE.ALL, post_process=None, fields=None,
+                  coordinates=None, radius=None, hit_points_below=None, types=None,
+                  order_by_distance=False, limit=None):
+        """
+        Items are filtered on the referee side, so it is cheaper to ask only what is needed.
+        For instance 5 nearest enemy towers with id and coordinates only:
+
+            client.ask_items(parties=(PARTY.ENEMY,), roles=(ROLE.TOWER,),
+                             fields=('id', 'coordinates'), order_by_distance=True, limit=5)
+
+        :param fields: return only these fields of items
+        :param coordinates: the point for radius and order_by_distance, my coordinates by default
+        :param radius: only items within the radius
+        :param hit_points_below: only items with less hit points
+        :param types: only items of these types
+        :param order_by_distance: sort items by distance, the nearest first
+        :param limit: max number of items
+        """
+        data = {
+            PARTY.REQUEST_NAME: parties,
+            ROLE.REQUEST_NAME: roles
+        }
+        filters = {
+            FILTER.FIELDS: fields,
+            FILTER.COORDINATES: coordinates,
+            FILTER.RADIUS: radius,
+            FILTER.HIT_POINTS_BELOW: hit_points_below,
+            FILTER.TYPES: types,
+            FILTER.ORDER_BY_DISTANCE: order_by_distance or None,
+            FILTER.LIMIT: limit
+        }
+        data.update((key, value) for key, value in filters.items() if value is not None)
         return self.select(
             {
                 'field': 'items',
-                'data': {
-                    PARTY.REQUEST_NAME: parties,
-                    ROLE.REQUEST_NAME: roles
-                }
-            })
+                'data': data
+            }, post_process)
 
     def ask_enemy_items(self):
         return self.ask_items(parties=(PARTY.ENEMY,))
@@ -61,8 +144,7 @@ class Client(object):
         return self.ask_items(roles=(ROLE.TOWER,))
 
     def ask_center(self):
-        centers = self.ask_items(roles=(ROLE.CENTER,))
-        return centers[0] if centers else None
+        return self.ask_items(roles=(ROLE.CENTER,), post_process=_first_or_none)
 
     def ask_units(self):
         return self.ask_items(roles=(ROLE.UNIT,))
@@ -97,14 +179,73 @@ class Client(object):
                 }
             })
 
+    def ask_route_to(self, coordinates):
+        """
+        The route which the referee uses to move me to the coordinates.
+
+        :return: list of points, it's empty if there is no way
+        """
+        return self.select(
+            {
+                'field': 'route_to',
+                'data': {
+                    'id': self.item_id,
+                    'coordinates': coordinates
+                }
+            })
+
+    def ask_path_distance(self, coordinates):
+        """
+        :return: length of my way to the coordinates or None if there is no way
+        """
+        return self.select(
+            {
+                'field': 'path_distance',
+                'data': {
+                    'id': self.item_id,
+                    'coordinates': coordinates
+                }
+            })
+
+    def set_async_actions(self, enabled=True):
+        """
+        Actions return at once without a confirmation from the referee,
+        validation errors can be taken with ask_action_errors.
+        """
+        self._async_actions = enabled
+
+    def ask_action_errors(self):
+        # errors of the last actions could be received but not read yet
+        self.CLIENT.poll()
+        # in a multiplexed environment errors of all items are collected together
+        errors = [error for error in self.CLIENT.action_errors
+                  if error.get('item_id', self.item_id) == self.item_id]
+        self.CLIENT.action_errors[:] = [error for error in self.CLIENT.action_errors
+                                        if error not in errors]
+        return errors
+
+    def _set_action(self, action, data):
+        if self._async_actions:
+            return self.CLIENT.set_action(action, data, confirm=False)
+        return self.CLIENT.set_action(action, data, wait=not self.PIPELINE)
+
     def attack_item(self, item_id):
-        return self.CLIENT.set_action('attack', {'id': item_id})
+        return self._set_action('attack', {'id': item_id})
 
     def move_to_point(self, coordinates):
-        self.CLIENT.set_action('move', {'coordinates': coordinates})
+        self._set_action('move', {'coordinates': coordinates})
+
+    def subscribe_world_state(self):
+        """
+        The referee will push changes of all items every frame,
+        then ask_items and ask_item_info are answered without a request.
+        Such an answer can be one frame old: the state of the current frame
+        may be not received yet. After an event it is always actual.
+        """
+        return self.CLIENT.subscribe_world_state()
 
     def subscribe(self, event, callback, data=None):
-        return self.CLIENT.subscribe(event, callback, data)
+        return self.CLIENT.subscribe(event, callback, data, wait=not self.PIPELINE)
 
     def unsubscribe_all(self):
         return self.subscribe('unsubscribe_all', None)
@@ -135,3 +276,47 @@ class Client(object):
 
     def subscribe_the_item_is_dead(self, item_id, callback):
         return self.subscribe('death', callback, {'id': item_id})
+
+
+class Batch(Client):
+    """
+    Collects ask_* calls and resolves all of them with a single select.
+    Actions and subscriptions are sent at once without waiting for confirmations.
+
+        batch = client.batch()
+        batch.ask_my_info()
+        batch.ask_nearest_enemy()
+        batch.ask_enemy_items_in_my_firing_range()
+        my_info, enemy, in_range = batch.execute()
+    """
+    PIPELINE = True
+
+    def __init__(self, client):
+        self._initial_info = client._initial_info
+        self._async_actions = client._async_actions
+        self._fields = []
+        self._post_processes = []
+
+    def select(self, fields, post_process=None):
+        self._fields.append(fields)
+        self._post_processes.append(post_process)
+        return len(self._fields) - 1
+
+    def execute(self):
+        """
+        Send all collected asks.
+
+        :return: a list of results in the order of ask_* calls
+        """
+        fields, post_processes = self._fields, self._post_processes
+        self._fields, self._post_processes = [], []
+        if not fields:
+            return []
+        results = [self._local_select(field) for field in fields]
+        remote = [field for field, result in zip(fields, results) if result is _NOT_LOCAL]
+        if remote:
+            remote_results = iter(self.CLIENT.select(fields=remote))
+            results = [next(remote_results) if result is _NOT_LOCAL else result
+                       for result in results]
+        return [post_process(result) if post_process else result
+                for result, post_process in zip(results, post_processes)]
@@ -1,4 +1,4 @@
-__all__ = ["ROLE", "PARTY"]
+__all__ = ["ROLE", "PARTY", "FILTER"]
 
 
 class PARTY():
@@ -16,3 +16,13 @@ class ROLE():
     BUILDING = 'building'
     OBSTACLE = "obstacle"
     ALL = (CENTER, TOWER, UNIT, BUILDING, OBSTACLE)
+
+
+class FILTER():
+    FIELDS = 'fields'
+    COORDINATES = 'coordinates'
+    RADIUS = 'radius'
+    HIT_POINTS_BELOW = 'hit_points_below'
+    TYPES = 'types'
+    ORDER_BY_DISTANCE = 'order_by_distance'
+    LIMIT = 'limit'
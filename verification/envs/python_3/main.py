@@ -1,10 +1,11 @@
 import sys
 from queue import Queue
+from select import select
 
 from checkio_executor_python.client import ClientLoop, RefereeClient
 from checkio_executor_python.execs import Runner
 
-from battle import commander
+from battle import commander, wire
 
 Runner.ALLOWED_MODULES += ['battle', 'battle.commander']  # OMFG
 
@@ -18,58 +19,283 @@ def _make_id(target):
 class PlayerRefereeRunner(Runner):
     def __init__(self, *args, **kwargs):
         self._events = {}
+        self.client = None
+        # item id -> globals of the code of the item in a multiplexed environment
+        self._context_globals = {}
         super().__init__(*args, **kwargs)
 
+    def set_client(self, client):
+        self.client = client
+
+    def switch_context(self, item_id):
+        """
+        Every item of a multiplexed environment runs its code with its own globals,
+        so module level names of the code (as a client of the item) are not shared.
+        """
+        self.client.context_id = item_id
+        if item_id not in self._context_globals:
+            self._context_globals[item_id] = self.init_globals()
+        self.globals = self._context_globals[item_id]
+
+    def action_run_in_context(self, data):
+        """
+        Run the code for one item of a multiplexed environment,
+        all requests of the code and its result are sent with the item id.
+        """
+        self.switch_context(data['item_id'])
+        return self.action_run_code(data)
+
     def action_event(self, data):
-        lookup_key = tuple(data['lookup_key'])
-        self._events[lookup_key](data['data'])
+        if 'item_id' in data:
+            self.switch_context(data['item_id'])
+        if data.get('frame') is not None:
+            self.client.event_frame = max(self.client.event_frame or 0, data['frame'])
+        callback = self._events.get(tuple(data['lookup_key']))
+        # subscriptions of a resumed battle have keys of the process which subscribed
+        if callback is not None:
+            callback(data['data'])
+
+    def action_events(self, data):
+        """
+        All events of a frame come in one message.
+        ClientLoop sends the result back, it is an ack without "method",
+        so the referee drops it.
+        """
+        for event in data['events']:
+            self.action_event(event)
+        return {'status': 'success'}
 
     def subscribe(self, lookup_key, callback):
         self._events[lookup_key] = callback
 
 
 class PlayerRefereeClient(RefereeClient):
+    # offered to the referee, wire.STRUCT can be added when the link is the bottleneck
+    WIRE_FORMATS = wire.FORMATS
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._events = {}
         self.events_call = Queue()
         self.runner = None
+        # item id -> number of responses for requests which were sent without waiting
+        self._unconfirmed = {}
+        # the item which code is executed now, it is set only in a multiplexed
+        # environment where one process runs the code for many items
+        self.context_id = None
+        # item id -> info, it is filled after subscribe_world_state
+        # with the first full state from the referee
+        self.world = None
+        self.world_frame = None
+        # the last frame of received events, the world isn't actual till this frame
+        self.event_frame = None
+        # validation errors of actions which were sent without confirmation
+        self.action_errors = []
+        # negotiated with the first request from the player code
+        self.wire_format = None
+        # received bytes which are not parsed yet
+        self._buffer = bytearray()
 
     def set_runner(self, runner):
         self.runner = runner
 
-    def request(self, *args, skip_clean_up=None, **kwargs):
+    def request(self, data, skipp_result=None, skip_clean_up=None):
+        """
+        RefereeClient.request, the request is sent with the id of the current item.
+
+        :param skipp_result: don't wait for the response, the keyword of RefereeClient.request
+        :param skip_clean_up: don't run events which were queued while waiting for responses
+        """
         if not skip_clean_up:
             self.clean_up()
 
-        return super().request(*args, **kwargs)
+        if self.context_id is not None:
+            data['item_id'] = self.context_id
+        response = self._send_request(data, skipp_result)
+        if skipp_result:
+            return response
+        return self.skip_service_messages(response)
+
+    def _send_request(self, data, skipp_result=None):
+        if self.wire_format in (None, wire.JSON):
+            return super().request(data, skipp_result=skipp_result)
+        self.socket.sendall(wire.pack_frame(data, self.wire_format))
+        if skipp_result:
+            return None
+        return self._get_response_json()
+
+    def _get_response(self):
+        """
+        A JSON message, received data is buffered as bytes and only whole messages are decoded,
+        so frames of a compact format which come right after the last JSON message
+        stay in the buffer as they are.
+        """
+        index = self._buffer.find(self.TERMINATOR.encode())
+        while index < 0:
+            self._receive()
+            index = self._buffer.find(self.TERMINATOR.encode())
+        message = bytes(self._buffer[:index])
+        del self._buffer[:index + 1]
+        return message.decode('utf-8')
+
+    def _get_response_json(self):
+        if self.wire_format in (None, wire.JSON):
+            return super()._get_response_json()
+        length, = wire.FRAME_HEADER.unpack(self._read_exactly(wire.FRAME_HEADER.size))
+        return wire.decode(self._read_exactly(length), self.wire_format)
+
+    def _read_exactly(self, size):
+        while len(self._buffer) < size:
+            self._receive()
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def _receive(self):
+        # RefereeClient keeps received text in _collected_data, it goes first
+        if self._collected_data:
+            self._buffer += self._collected_data.encode('utf-8')
+            self._collected_data = ''
+            return
+        data = self.socket.recv(self.RECV_DATA_SIZE)
+        if not data:
+            raise ConnectionError("The referee closed the connection")
+        self._buffer += data
+
+    def _has_message(self):
+        """
+        A whole message is buffered already or the socket has data, so reading doesn't block.
+        """
+        if self._collected_data:
+            self._receive()
+        if self.wire_format in (None, wire.JSON):
+            if self.TERMINATOR.encode() in self._buffer:
+                return True
+        elif len(self._buffer) >= wire.FRAME_HEADER.size:
+            length, = wire.FRAME_HEADER.unpack_from(self._buffer)
+            if len(self._buffer) >= wire.FRAME_HEADER.size + length:
+                return True
+        return bool(select([self.socket], [], [], 0)[0])
+
+    def negotiate_wire_format(self):
+        """
+        Ask the referee for the most compact format which both sides support,
+        JSON is used if there is no such format.
+        The answer is the last JSON message from the referee, the format is switched
+        right after it, anything which is received after it is already in the new format.
+        """
+        if self.wire_format is not None:
+            return
+        self.wire_format = wire.JSON
+        response = self.actual_request({'method': 'protocol', 'formats': self.WIRE_FORMATS})
+        self.wire_format = response.get('format', wire.JSON)
+
+    def skip_service_messages(self, response):
+        """
+        Apply world states and skip responses for pipelined requests,
+        they come before any other response of the same item.
+        """
+        while True:
+            if response.get('action') == 'world_state':
+                self.apply_world_state(response)
+            elif response.get('action') == 'action_error':
+                self.action_errors.append(response)
+            elif not self._skip_unconfirmed(response):
+                return response
+            response = self._get_response_json()
+
+    def _skip_unconfirmed(self, response):
+        if 'action' in response:
+            return False
+        item_id = response.get('item_id')
+        if not self._unconfirmed.get(item_id):
+            return False
+        self._unconfirmed[item_id] -= 1
+        return True
+
+    def apply_world_state(self, data):
+        if data['full']:
+            self.world = {}
+        elif self.world is None:
+            return
+        for item in data['items']:
+            self.world[item['id']] = item
+        for item_id in data['removed']:
+            self.world.pop(item_id, None)
+        self.world_frame = data['frame']
+
+    def poll(self):
+        """
+        Read all messages which are already received without blocking,
+        so the local world is actual.
+        """
+        while self._has_message():
+            response = self._get_response_json()
+            if response.get('action') == 'world_state':
+                self.apply_world_state(response)
+            elif response.get('action') == 'action_error':
+                self.action_errors.append(response)
+            elif response.get('action') in ('events', 'run_in_context'):
+                self.events_call.put(response)
+            else:
+                self._skip_unconfirmed(response)
 
     def clean_up(self):
+        context_id = self.context_id
         while not self.events_call.empty():
             response = self.events_call.get()
-            self.runner.action_event(response)
+            if response.get('action') == 'run_in_context':
+                self.run_in_context(response)
+            else:
+                self.runner.action_events(response)
+        self.context_id = context_id
+        if context_id is not None:
+            self.runner.switch_context(context_id)
+
+    def run_in_context(self, data):
+        """
+        Run the code for an item which was started while the code
+        of another item waited for a response, the result is sent without waiting.
+        """
+        result = self.runner.action_run_in_context(data)
+        self.request(result, skip_clean_up=True, skipp_result=True)
 
     def _send_event(self, lookup_key, data):
         callback = self._events[lookup_key]
         callback(data=data)
 
     def wait_actual_response(self, response):
-        if response.get('action') != 'event':
+        response = self.skip_service_messages(response)
+        if response.get('action') not in ('events', 'run_in_context'):
             return response
 
         self.events_call.put(response)
         return self.wait_actual_response(self._get_response_json())
 
-    def actual_request(self, data, *args, **kwargs):
+    def actual_request(self, data):
+        self.negotiate_wire_format()
         data['status'] = 'success'  # hack because of backward requesting
-        response = self.request(data, *args, **kwargs)
+        response = self.request(data)
         return self.wait_actual_response(response)
 
-    def subscribe(self, event, callback, data=None):
+    def pipelined_request(self, data):
+        """
+        Send a request without waiting for the response,
+        it will be skipped by the next actual_request.
+        """
+        self.negotiate_wire_format()
+        data['status'] = 'success'  # hack because of backward requesting
+        self.request(data, skipp_result=True)
+        self._unconfirmed[self.context_id] = self._unconfirmed.get(self.context_id, 0) + 1
+
+    def subscribe(self, event, callback, data=None, wait=True):
         lookup_key = _make_id(callback)
-        response = self.actual_request({'method': 'subscribe', 'lookup_key': lookup_key,
-                                        'event': event, 'data': data})
+        request = {'method': 'subscribe', 'lookup_key': lookup_key, 'event': event, 'data': data}
+        if not wait:
+            self.runner.subscribe(lookup_key, callback)
+            self.pipelined_request(request)
+            return None
+        response = self.actual_request(request)
         if response.get('status') == 200:
             self.runner.subscribe(lookup_key, callback)
             return True
@@ -79,8 +305,26 @@ class PlayerRefereeClient(RefereeClient):
         response = self.actual_request({'method': 'select', 'fields': fields})
         return response['data']
 
-    def set_action(self, action, data):
-        return self.actual_request({'method': 'set_action', 'action': action, 'data': data})
+    def subscribe_world_state(self):
+        response = self.actual_request({'method': 'subscribe', 'lookup_key': None,
+                                        'event': 'world_state', 'data': None})
+        return response.get('status') == 200
+
+    def set_action(self, action, data, wait=True, confirm=True):
+        """
+        :param wait: wait for the confirmation
+        :param confirm: without confirmation the referee sends back only
+        a validation error, it is collected in action_errors
+        """
+        request = {'method': 'set_action', 'action': action, 'data': data}
+        if not confirm:
+            self.negotiate_wire_format()
+            request['confirm'] = False
+            request['status'] = 'success'  # hack because of backward requesting
+            return self.request(request, skipp_result=True)
+        if not wait:
+            return self.pipelined_request(request)
+        return self.actual_request(request)
 
 
 class PlayerClientLoop(ClientLoop):
@@ -90,8 +334,10 @@ class PlayerClientLoop(ClientLoop):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.client.set_runner(self.runner)
+        self.runner.set_client(self.client)
 
 
-client_loop = PlayerClientLoop(int(sys.argv[1]), sys.argv[2])
-commander.Client.set_client(client_loop.client)
-client_loop.start()
+if __name__ == '__main__':
+    client_loop = PlayerClientLoop(int(sys.argv[1]), sys.argv[2])
+    commander.Client.set_client(client_loop.client)
+    client_loop.start()
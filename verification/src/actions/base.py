@@ -31,7 +31,7 @@ class BaseItemActions(object):
 
     def _shot(self, enemy):
         attacker = self._item
-        attacker.charging += self._fight_handler.GAME_FRAME_TIME * attacker.rate_of_fire
+        self.charge()
         if attacker.charging < 1:
             return {'action': 'charge'}
 
@@ -47,6 +47,35 @@ class BaseItemActions(object):
             'damaged': [enemy.id],  # TODO:
         }
 
+    def charge(self, frames=1):
+        # frame by frame, so the charging is the same for sleeping items
+        attacker = self._item
+        for _ in range(frames):
+            attacker.charging += self._fight_handler.GAME_FRAME_TIME * attacker.rate_of_fire
+
+    def frames_to_shot(self):
+        """
+        :return: number of frames till the charging is enough for a shot
+            or 0 if the item doesn't charge
+        """
+        step = self._fight_handler.GAME_FRAME_TIME * (self._item.rate_of_fire or 0)
+        if step <= 0:
+            return 0
+        charging, frames = self._item.charging, 0
+        while charging < 1:
+            charging += step
+            frames += 1
+        return frames
+
+    def get_checkpoint(self):
+        """
+        JSON serializable state of the actions besides attributes of the item
+        """
+        return {}
+
+    def set_checkpoint(self, checkpoint):
+        pass
+
     def _dead(self, enemy):
         enemy.set_state_dead()
         self._fight_handler.send_death_event(enemy.id)
@@ -71,9 +100,7 @@ class BaseItemActions(object):
         if enemy.player['id'] == self._item.player['id']:
             raise ActionValidateError("Can not attack own item")
 
-        distance_to_enemy = euclidean_distance(enemy.coordinates, self._item.coordinates)
-        item_firing_range = self._item.firing_range
-        if distance_to_enemy - enemy.size / 2 > item_firing_range:
+        if not self._fight_handler.is_in_firing_range(self._item, enemy):
             raise ActionValidateError("Can not attack item, it's big distance")
 
     def validate_move(self, action, data):
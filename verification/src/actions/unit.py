@@ -1,6 +1,6 @@
 from .base import BaseItemActions, euclidean_distance
 from .exceptions import ActionValidateError
-from tools import find_route, straighten_route
+from tools.distances import segment_distance
 
 
 class UnitActions(BaseItemActions):
@@ -8,9 +8,26 @@ class UnitActions(BaseItemActions):
         self._route = []
         self._last_map_hash = 0
         self._last_destination_point = (0, 0)
+        # (start point, destination point) of the route which is being planned
+        self._route_request = None
 
         super().__init__(*args, **kwargs)
 
+    def get_checkpoint(self):
+        return {
+            'route': self._route,
+            'last_map_hash': self._last_map_hash,
+            'last_destination_point': self._last_destination_point,
+            'route_request': self._route_request
+        }
+
+    def set_checkpoint(self, checkpoint):
+        self._route = [tuple(point) for point in checkpoint['route']]
+        self._last_map_hash = checkpoint['last_map_hash']
+        self._last_destination_point = tuple(checkpoint['last_destination_point'])
+        route_request = checkpoint['route_request']
+        self._route_request = route_request and tuple(map(tuple, route_request))
+
     def actions_init(self):
         actions = super().actions_init()
         actions.update({
@@ -33,12 +50,17 @@ class UnitActions(BaseItemActions):
         return self._move(coordinates)
 
     def check_or_create_route(self, destination_point):
+        """
+        :return: False if a new route is being planned and there is no old one to follow
+        """
         if (self._fight_handler.map_hash != self._last_map_hash or
                 not self._route or
                 self._last_destination_point != tuple(destination_point)):
-            self.calculate_route(destination_point)
+            if not self.calculate_route(destination_point):
+                return bool(self._route)
             self._last_map_hash = self._fight_handler.map_hash
             self._last_destination_point = tuple(destination_point)
+        return True
 
     def _stop(self):
         self._fight_handler.send_im_stop(self._item.id)
@@ -54,7 +76,9 @@ class UnitActions(BaseItemActions):
         return next_point, intermediate_point
 
     def _move(self, destination_point):
-        self.check_or_create_route(destination_point)
+        if not self.check_or_create_route(destination_point):
+            # wait for the route without the idle event
+            return {'action': 'idle'}
         if not self._route:
             return self._stop()
         frame_distance = self._item.speed * self._fight_handler.GAME_FRAME_TIME
@@ -81,20 +105,40 @@ class UnitActions(BaseItemActions):
                 'to': new_point}
 
     def calculate_route(self, end_point):
-        current_point = self._item.coordinates
-        grid_scale = self._fight_handler.GRID_SCALE
-        cell_shift = self._fight_handler.CELL_SHIFT
-        current_cell = (int(round((current_point[0] - cell_shift) * grid_scale)),
-                        int(round((current_point[1] - cell_shift) * grid_scale)))
-        end_cell = (int(round((end_point[0] - cell_shift) * grid_scale)),
-                    int(round((end_point[1] - cell_shift) * grid_scale)))
-        # A-star search
-        cell_route = find_route(self._fight_handler.map_grid,
-                                self._fight_handler.map_graph,
-                                current_cell, end_cell)
-        cut_cell_route = straighten_route(self._fight_handler.map_grid, cell_route)
-        self._route = [((c[0] / grid_scale) + cell_shift, (c[1] / grid_scale) + cell_shift)
-                       for c in cut_cell_route]
+        """
+        :return: False if the route is planned asynchronously and isn't ready yet
+        """
+        start_point = tuple(self._item.coordinates)
+        if self._route_request is not None and self._route_request[1] == tuple(end_point):
+            # the unit goes by the old route, don't ask a new one from every point
+            start_point = self._route_request[0]
+        route = self._fight_handler.get_route(start_point, end_point, wait=False)
+        if route is None:
+            self._route_request = (start_point, tuple(end_point))
+            return False
+        self._route_request = None
+        if start_point != tuple(self._item.coordinates):
+            route = self.skip_passed_points(route)
+        self._route = route
+        return True
+
+    def skip_passed_points(self, route):
+        """
+        The route was planned from the point where the unit was when it was asked,
+        the unit goes on from the nearest segment of the route instead of going back.
+
+        :return: the route without points which are behind the unit
+        """
+        position = tuple(self._item.coordinates)
+        nearest, first_index = None, 0
+        for index in range(1, len(route)):
+            distance = segment_distance(position, route[index - 1], route[index])
+            if nearest is None or distance < nearest:
+                nearest, first_index = distance, index
+        # the unit is not on the route yet, it's nearer to the start than to the first segment
+        if first_index == 1 and euclidean_distance(position, route[0]) <= nearest:
+            first_index = 0
+        return route[first_index:]
 
     def validate_attack(self, action, data):
         enemy = self._fight_handler.fighters.get(data['id'])
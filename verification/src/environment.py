@@ -1,8 +1,31 @@
+from collections import defaultdict, deque
+
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+
 from checkio_referee.environment.controller import EnvironmentsController
 from checkio_referee.environment.client import EnvironmentClient
 
+from tools import wire
+
 
-class BattleEnvironmentClient(EnvironmentClient):
+class BattleMessagesMixin(object):
+    """
+        Messages of the battle protocol.
+        A class defines write and _add_event.
+    """
+
+    def set_wire_format(self, formats):
+        """
+        Choose a format which both sides support, the answer is the last JSON message.
+        """
+        wire_format = wire.choose_format(formats)
+        self.write({
+            'status': 200,
+            'format': wire_format
+        })
+        self.wire_format = wire_format
 
     def select_result(self, data):
         self.write({
@@ -15,18 +38,214 @@ class BattleEnvironmentClient(EnvironmentClient):
             'status': 200
         })
 
-    def bad_action(self):
-        self.write({
+    def bad_action(self, error=None):
+        response = {
             'status': 400
-        })
+        }
+        if error is not None:
+            response['error'] = str(error)
+        self.write(response)
 
-    def send_event(self, lookup_key, data):
+    def send_action_error(self, action, data, error):
         self.write({
-            'action': 'event',
+            'action': 'action_error',
+            'name': action,
+            'data': data,
+            'error': str(error)
+        })
+
+    def send_event(self, lookup_key, data, frame=None):
+        self._add_event({
             'lookup_key': lookup_key,
-            'data': data
+            'data': data,
+            'frame': frame
+        })
+
+    def send_world_state(self, data):
+        self.write(dict(data, action='world_state'))
+
+
+class BattleEnvironmentClient(BattleMessagesMixin, EnvironmentClient):
+    """
+        Events are collected and sent as a single message
+        at the end of the current IOLoop callback (a frame, as a rule).
+        Any other message sends collected events before itself to keep the order.
+
+        Messages are JSON until the environment negotiates a compact wire format,
+        then both sides use length-prefixed frames of that format.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._events = []
+        self.wire_format = wire.JSON
+
+    def write(self, data):
+        self.flush_events()
+        self._write(data)
+
+    def _write(self, data):
+        if self.wire_format == wire.JSON:
+            super().write(data)
+        else:
+            self._stream.write(wire.pack_frame(data, self.wire_format))
+
+    @gen.coroutine
+    def read_message(self):
+        if self.wire_format == wire.JSON:
+            message = yield super().read_message()
+            return message
+        header = yield self._stream.read_bytes(wire.FRAME_HEADER.size)
+        length, = wire.FRAME_HEADER.unpack(header)
+        payload = yield self._stream.read_bytes(length)
+        return wire.decode(payload, self.wire_format)
+
+    def flush_events(self):
+        if not self._events:
+            return
+        events, self._events = self._events, []
+        self._write({
+            'action': 'events',
+            'events': events
         })
 
+    def _add_event(self, event):
+        if not self._events:
+            IOLoop.current().add_callback(self.flush_events)
+        self._events.append(event)
+
+
+class MultiplexedEnvironment(object):
+    """
+        One environment process for many items with the same code.
+        Every item works in its own context of the process,
+        messages of the context have "item_id" and are routed by it.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._contexts = {}
+
+    def context(self, item_id):
+        """
+        :return: ItemEnvironment, it is used by the item as a usual environment
+        """
+        context = self._contexts.get(item_id)
+        if context is None:
+            context = self._contexts[item_id] = ItemEnvironment(self._client, item_id)
+        return context
+
+    @gen.coroutine
+    def route_messages(self):
+        while True:
+            message = yield self._client.read_message()
+            if not isinstance(message, dict):
+                continue
+            context = self._contexts.get(message.pop('item_id', None))
+            if context is None:
+                continue
+            if message.get('method') == 'protocol':
+                # a context would handle it after the next read is started,
+                # but the next message can be already in the negotiated format
+                context.set_wire_format(message['formats'])
+                continue
+            context.put_message(message)
+
+
+class ItemEnvironment(BattleMessagesMixin):
+    """
+        A context of MultiplexedEnvironment, it has the interface
+        of BattleEnvironmentClient for the item.
+    """
+
+    def __init__(self, client, item_id):
+        self._client = client
+        self.item_id = item_id
+        self._messages = deque()
+        self._waiter = None
+
+    @property
+    def wire_format(self):
+        return self._client.wire_format
+
+    @wire_format.setter
+    def wire_format(self, value):
+        self._client.wire_format = value
+
+    def write(self, data):
+        self._client.write(dict(data, item_id=self.item_id))
+
+    def _add_event(self, event):
+        self._client._add_event(dict(event, item_id=self.item_id))
+
+    @gen.coroutine
+    def run_code(self, code):
+        self.write({
+            'action': 'run_in_context',
+            'code': code
+        })
+        result = yield self.read_message()
+        return result
+
+    def put_message(self, message):
+        if self._waiter is not None:
+            waiter, self._waiter = self._waiter, None
+            waiter.set_result(message)
+        else:
+            self._messages.append(message)
+
+    def read_message(self):
+        future = Future()
+        if self._messages:
+            future.set_result(self._messages.popleft())
+        else:
+            self._waiter = future
+        return future
+
 
 class BattleEnvironmentsController(EnvironmentsController):
+    """
+        Keeps a pool of started environments for every env name.
+        An environment process imports the battle modules and connects
+        before it gets the code, so get_environment hands out a ready one
+        and starts a new one instead of it.
+        Environments are never returned to the pool after a battle:
+        the code of a player can change imported modules and builtins
+        of the process, a reset of globals and subscriptions doesn't undo it,
+        and the next battle could run the code of another player there.
+        The pool is refilled in the background right after an environment
+        is taken, so a battle waits for a spawn only when it takes more
+        environments than were started before it.
+    """
     ENVIRONMENT_CLIENT_CLS = BattleEnvironmentClient
+    POOL_SIZE = 0
+
+    def __init__(self, *args, pool_size=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_size = self.POOL_SIZE if pool_size is None else pool_size
+        self._pool = defaultdict(deque)  # env name -> Futures of started environments
+        self.stats = {'pooled': 0, 'started': 0}
+
+    def warm_up(self, env_name, count=None):
+        """
+        Start environments in the background until the pool has "count" of them.
+        """
+        pool = self._pool[env_name]
+        count = self.pool_size if count is None else count
+        while len(pool) < count:
+            pool.append(super().get_environment(env_name))
+
+    @gen.coroutine
+    def get_environment(self, env_name):
+        pool = self._pool[env_name]
+        while pool:
+            future = pool.popleft()
+            environment = yield future
+            if not environment._stream.closed():
+                self.stats['pooled'] += 1
+                break
+        else:
+            self.stats['started'] += 1
+            environment = yield super().get_environment(env_name)
+        self.warm_up(env_name)
+        return environment
@@ -1,10 +1,20 @@
 import atexit
+import json
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from tornado import gen
 from tornado.ioloop import IOLoop
 
 from random import choice
-from tools import precalculated, fill_square, grid_to_graph
-from tools import ROLE, ATTRIBUTE, PARTY, ACTION, STATUS, INITIAL, DEFEAT_REASON, OUTPUT
+from tools import precalculated, fill_square, grid_to_graph, plan_route, plan_route_on_grid
+from tools import RouteSearch, straighten_route
+from tools import CoverageMap, COVERAGE_INSIDE, COVERAGE_BORDER, Landmarks, square_cells
+from tools import MapCache, map_key, ItemScheduler
+from tools import CHECKPOINT_VERSION, dump_checkpoint, write_checkpoint, load_checkpoint
+from tools import encode_random_state, decode_random_state, encode_floats, decode_floats
+from tools import ROLE, ATTRIBUTE, PARTY, ACTION, STATUS, INITIAL, DEFEAT_REASON, OUTPUT, FILTER
+from tools import LOG_FORMAT, FrameSampler, pack_log_chunks, battle_log, check_keyframe_interval
 
 from checkio_referee import RefereeBase
 from checkio_referee.handlers.base import BaseHandler
@@ -12,7 +22,7 @@ from checkio_referee.handlers.base import BaseHandler
 import settings_env
 from actions import ItemActions
 from actions.exceptions import ActionValidateError
-from environment import BattleEnvironmentsController
+from environment import BattleEnvironmentsController, MultiplexedEnvironment
 from tools.distances import euclidean_distance
 from tools.terms import PLAYER
 
@@ -29,6 +39,31 @@ class Item(object):
         return cls.ITEMS_COUNT
 
 
+class InfoAttribute(object):
+    """
+        an attribute of FightItem which is a part of FightItem.info.
+        Only a real change of the value drops the cached info,
+        with "wake" it also wakes the item, see ItemScheduler
+    """
+
+    def __init__(self, name, wake=False):
+        self.name = name
+        self.wake = wake
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance.__dict__[self.name]
+
+    def __set__(self, instance, value):
+        if self.name in instance.__dict__ and instance.__dict__[self.name] == value:
+            return
+        instance.__dict__[self.name] = value
+        instance.drop_info()
+        if self.wake:
+            instance.wake()
+
+
 class FightItem(Item):
     """
         class for a single item in the fight.
@@ -39,7 +74,15 @@ class FightItem(Item):
     ACTIONS = None
     SELECT_HANDLERS = None
 
+    hit_points = InfoAttribute('hit_points')
+    coordinates = InfoAttribute('coordinates')
+    action = InfoAttribute('action', wake=True)
+    _state = InfoAttribute('state')
+
     def __init__(self, item_data, player, fight_handler):
+        self._fight_handler = fight_handler  # object of FightHandler
+        self._info = None  # cached info, see InfoAttribute
+        self.info_version = 0  # grows every time the info is changed
         self.init_handlers()
         self.id = self.generate_id()
         self.player = player  # dict, data about the player who owns this Item
@@ -70,7 +113,6 @@ class FightItem(Item):
         self.action = item_data.get(ACTION.REQUEST_NAME)
         self.charging = 0
 
-        self._fight_handler = fight_handler  # object of FightHandler
         self.code = self._fight_handler.codes.get(item_data.get(ATTRIBUTE.OPERATING_CODE))
         self._initial = item_data
         self._env = None  # ??
@@ -81,6 +123,31 @@ class FightItem(Item):
         self._actions_handlers = ItemActions.get_factory(self, fight_handler=fight_handler)
         self.set_state_idle()
 
+    @classmethod
+    def from_checkpoint(cls, checkpoint, player, fight_handler):
+        item = cls(checkpoint['data'], player=player, fight_handler=fight_handler)
+        item.id = checkpoint['id']
+        item.hit_points = checkpoint['hit_points']
+        item.coordinates = checkpoint['coordinates']
+        item.action = checkpoint['action']
+        item.charging = checkpoint['charging']
+        item._state = checkpoint['state']
+        item._actions_handlers.set_checkpoint(checkpoint['actions'])
+        return item
+
+    def get_checkpoint(self):
+        return {
+            'id': self.id,
+            'player_id': self.player[ATTRIBUTE.ID],
+            'data': self._initial,
+            'hit_points': self.hit_points,
+            'coordinates': self.coordinates,
+            'action': self.action,
+            'charging': self.charging,
+            'state': self._state,
+            'actions': self._actions_handlers.get_checkpoint()
+        }
+
     @property
     def is_dead(self):
         return self.hit_points <= 0
@@ -89,9 +156,23 @@ class FightItem(Item):
     def is_obstacle(self):
         return self.role == "obstacle"
 
+    def wake(self):
+        self._fight_handler.wake_item(self.id)
+
+    def drop_info(self):
+        self._info = None
+        self.info_version += 1
+
     @property
     def info(self):
         # DEPRECATED
+        # The same dict is shared by all requests until the item is changed,
+        # so don't modify it
+        if self._info is None:
+            self._info = self._build_info()
+        return self._info
+
+    def _build_info(self):
         return {
             ATTRIBUTE.ID: self.id,
             ATTRIBUTE.PLAYER_ID: self.player["id"],
@@ -116,11 +197,14 @@ class FightItem(Item):
             select - to ask data from system
             set_action - to command unit to do
             subscribe - to subscribe on some event
+            and a service one
+            protocol - to negotiate a wire format of messages
         """
         self.HANDLERS = {
             'select': self.method_select,
             'set_action': self.method_set_action,
             'subscribe': self.method_subscribe,
+            'protocol': self.method_protocol,
         }
 
         self.SELECT_HANDLERS = {
@@ -129,7 +213,9 @@ class FightItem(Item):
             'players': self.select_players,
             'items': self.select_items,
             'nearest_enemy': self.select_nearest_enemy,
-            'enemy_items_in_my_firing_range': self.select_enemy_items_in_my_firing_range
+            'enemy_items_in_my_firing_range': self.select_enemy_items_in_my_firing_range,
+            'route_to': self.select_route_to,
+            'path_distance': self.select_path_distance
         }
 
     def get_percentage_hit_points(self):
@@ -146,10 +232,12 @@ class FightItem(Item):
         if self.size:
             self._fight_handler.clear_from_map(self)
         self._state = {'action': 'dead'}
+        self._fight_handler.wake_watchers(self.id)
 
     def set_coordinates(self, coordinates):
         self.coordinates = coordinates
         self._fight_handler.send_range_events(self.id)
+        self._fight_handler.wake_watchers(self.id)
 
     @property
     def is_executable(self):
@@ -162,10 +250,13 @@ class FightItem(Item):
 
     @gen.coroutine
     def start(self):
-        if not self.is_executable:
+        if not self.is_executable or self._fight_handler.headless:
             return
-        self._env = yield self._fight_handler.get_environment(self.player[PLAYER.ENV_NAME])
+        started = time.perf_counter()
+        self._env = yield self._fight_handler.get_item_environment(self)
         result = yield self._env.run_code(self.code)
+        # till the first message of the code
+        self._fight_handler.startup_times[self.id] = time.perf_counter() - started
         while True:
             if result is not None:
                 status = result.pop('status')
@@ -207,7 +298,7 @@ class FightItem(Item):
         return self._fight_handler.get_public_players_info(data, self.player[ATTRIBUTE.ID])
 
     def select_items(self, data):
-        return self._fight_handler.get_group_item_info(data, self.player[ATTRIBUTE.ID])
+        return self._fight_handler.get_group_item_info(data, self.player[ATTRIBUTE.ID], self.id)
 
     def select_nearest_enemy(self, data):
         return self._fight_handler.get_nearest_enemy(data[ATTRIBUTE.ID])
@@ -215,13 +306,31 @@ class FightItem(Item):
     def select_enemy_items_in_my_firing_range(self, data):
         return self._fight_handler.get_enemy_items_in_my_firing_range(data[ATTRIBUTE.ID])
 
-    def method_set_action(self, action, data):
+    def select_route_to(self, data):
+        return self._fight_handler.get_route_to(data[ATTRIBUTE.ID], data[ATTRIBUTE.COORDINATES])
+
+    def select_path_distance(self, data):
+        return self._fight_handler.get_path_distance(data[ATTRIBUTE.ID],
+                                                     data[ATTRIBUTE.COORDINATES])
+
+    def method_set_action(self, action, data, confirm=True):
+        """
+            without confirm the environment doesn't wait for a response,
+            so only a validation error is sent back
+        """
         try:
             self.action = self._actions_handlers.parse_action_data(action, data)
         except ActionValidateError as e:
-            self._env.bad_action(e)
+            if confirm:
+                self._env.bad_action(e)
+            else:
+                self._env.send_action_error(action, data, e)
         else:
-            self._env.confirm()
+            if confirm:
+                self._env.confirm()
+
+    def method_protocol(self, formats):
+        self._env.set_wire_format(formats)
 
     def method_subscribe(self, event, lookup_key, data):
         result = self._fight_handler.subscribe(event, self.id, lookup_key, data)
@@ -236,8 +345,29 @@ class FightItem(Item):
         except ActionValidateError:
             self.set_state_idle()
 
+    def skip_frames(self, frames):
+        """
+            charge for frames which the item slept through
+        """
+        self._actions_handlers.charge(frames)
+
+    def frames_to_shot(self):
+        return self._actions_handlers.frames_to_shot()
+
     def send_event(self, lookup_key, data):
-        self._env.send_event(lookup_key, data)
+        # subscriptions restored from a checkpoint can come before the code is started
+        if self._env is not None:
+            # the client doesn't answer selects from a world state older than the event
+            self._env.send_event(lookup_key, data, self._fight_handler.current_frame)
+
+    def send_world_state(self, data):
+        """
+            :return: False if the code isn't started yet and the state isn't sent
+        """
+        if self._env is None:
+            return False
+        self._env.send_world_state(data)
+        return True
 
 
 class CraftItem(Item):
@@ -251,6 +381,29 @@ class CraftItem(Item):
         self.player = player
         self.role = ROLE.CRAFT
 
+    @classmethod
+    def from_checkpoint(cls, checkpoint, player, fight_handler):
+        craft = cls({
+            ATTRIBUTE.COORDINATES: checkpoint['coordinates'],
+            ATTRIBUTE.LEVEL: checkpoint['level'],
+            ATTRIBUTE.ALIAS: checkpoint['alias'],
+            ATTRIBUTE.ITEM_TYPE: checkpoint['type']
+        }, player=player, fight_handler=fight_handler)
+        craft.id = checkpoint['id']
+        craft.tile_position = checkpoint['tile_position']
+        return craft
+
+    def get_checkpoint(self):
+        return {
+            'id': self.id,
+            'player_id': self.player.get("id"),
+            'coordinates': self.coordinates,
+            'tile_position': self.tile_position,
+            'level': self.level,
+            'alias': self.alias,
+            'type': self.item_type
+        }
+
     @property
     def info(self):
         return {
@@ -273,6 +426,13 @@ class FightHandler(BaseHandler):
     GRID_SCALE = 2
     CELL_SHIFT = 1 / (GRID_SCALE * 2)
     ACCURACY_RANGE = 0.1
+    # executors are shared by battles and shut down at exit, see shutdown_executors
+    # an encoded final log is packed out of the process, it's created on demand
+    LOG_EXECUTOR = None
+    # checkpoints are written one by one out of the IOLoop, it's created on demand
+    CHECKPOINT_EXECUTOR = None
+    # routes are planned out of the process with INITIAL.ASYNC_ROUTES, it's created on demand
+    ROUTE_EXECUTOR = None
 
     """
     Each item of an EVENT must have next structure:
@@ -308,7 +468,15 @@ class FightHandler(BaseHandler):
         """
         self.players = {}
         self.codes = {}
+        # subscriptions of the battle, EVENTS of the class only names events
+        self.EVENTS = {event_name: [] for event_name in self.EVENTS}
         self.is_stream = True
+        self.log_format = LOG_FORMAT.JSON
+        self.log_keyframe_interval = battle_log.KEYFRAME_INTERVAL
+        self.frame_sampler = FrameSampler()
+        self.log_compression = None
+        # the editor asked for an encoded log, it's sent by chunks
+        self.log_chunked = False
         self.battle_log = {
             OUTPUT.INITIAL_CATEGORY: {
                 OUTPUT.BUILDINGS: [],
@@ -320,15 +488,56 @@ class FightHandler(BaseHandler):
         }
         self.map_size = (0, 0)
         self.map_grid = [[]]
-        self.map_graph = {}
+        self.map_graph = grid_to_graph([])
         self.time_limit = float("inf")
         self.map_hash = 0
+        # number of ALT landmarks for route searches, 0 - the straight line heuristic
+        self.route_landmarks = 0
+        self.landmarks = None
+        # precomputation of maps is kept there for the next battles on the same map
+        self.map_cache_dir = None
+        self.map_stats = {'cache': None, 'seconds': 0}
+        # (shooter id, target size) -> CoverageMap of the firing range of a static shooter
+        self.coverage_maps = {}
+        # (start cell, end cell) -> straightened route, only for the current map_hash
+        self.route_cache = {}
+        self.route_cache_stats = {'hits': 0, 'misses': 0}
+        self.async_routes = False
+        self._pending_routes = {}  # (start cell, end cell) -> Future of the route
+        # max number of cells which route searches expand per frame,
+        # for every unit with route_budget_per_unit, None - no limit.
+        # Without route_budget_per_unit searches are served in the order they were started
+        self.route_budget = None
+        self.route_budget_per_unit = False
+        self._route_searches = {}  # (start cell, end cell) -> RouteSearch
+        self._continued_searches = set()  # keys of searches which were continued on the frame
+        # expanded cells by route searches with the budget
+        self.route_expansions = {'frame': 0, 'total': 0, 'max_frame': 0}
+        # without environments and real time, frames go one by one
+        self.headless = False
+        self.scheduler = None  # ItemScheduler with INITIAL.SLEEPING_ITEMS
+        self.checkpoint_interval = None
+        self.checkpoint_dir = None
+        # frame_files of the last written checkpoint, the next one writes only new frames
+        self._checkpoint_frame_files = ()
         """
             self.fighters is a dict of all available fighters on the map.
             where key is an id of the fighter and value is an object of FightItem
         """
         self.fighters = {}
         self.crafts = {}
+        # receivers of the world state, item id -> True if it waits for the full state
+        self.world_state_receivers = {}
+        self._world_versions = {}  # item id -> info_version which was sent last time
+        # results of queries for the current frame, key -> item ids
+        self._query_cache = {}
+        self.query_cache_stats = {'hits': 0, 'misses': 0}
+        self.collect_stats = False
+        # items with the same player and code share one environment process
+        self.multiplex_environments = False
+        self._multiplexed_environments = {}  # (player id, code) -> Future of the environment
+        self.startup_times = {}  # item id -> seconds to start the environment and the code
+        self.environment_waits = []  # seconds of every get_environment of the battle
 
         self.current_frame = 0
         self.current_game_time = 0
@@ -346,6 +555,27 @@ class FightHandler(BaseHandler):
     @gen.coroutine
     def start(self):
         self.is_stream = self.initial_data.get(INITIAL.IS_STREAM, True)
+        self.log_format = self.initial_data.get(INITIAL.LOG_FORMAT, LOG_FORMAT.JSON)
+        # checked here, so a wrong interval does not fail the battle at the end
+        self.log_keyframe_interval = check_keyframe_interval(
+            self.initial_data.get(INITIAL.LOG_KEYFRAME_INTERVAL, battle_log.KEYFRAME_INTERVAL))
+        self.frame_sampler = FrameSampler(self.initial_data.get(INITIAL.LOG_FRAME_STEP, 1))
+        self.log_compression = self.initial_data.get(INITIAL.LOG_COMPRESSION)
+        self.log_chunked = (INITIAL.LOG_FORMAT in self.initial_data or
+                            INITIAL.LOG_COMPRESSION in self.initial_data)
+        self.collect_stats = self.initial_data.get(INITIAL.COLLECT_STATS, False)
+        self.multiplex_environments = self.initial_data.get(INITIAL.MULTIPLEX_ENVIRONMENTS,
+                                                            False)
+        self.headless = self.initial_data.get(INITIAL.HEADLESS, False)
+        self.async_routes = self.initial_data.get(INITIAL.ASYNC_ROUTES, False)
+        self.route_budget = self.initial_data.get(INITIAL.ROUTE_BUDGET)
+        self.route_budget_per_unit = self.initial_data.get(INITIAL.ROUTE_BUDGET_PER_UNIT, False)
+        self.route_landmarks = self.initial_data.get(INITIAL.ROUTE_LANDMARKS, 0)
+        self.map_cache_dir = self.initial_data.get(INITIAL.MAP_CACHE_DIR)
+        if self.initial_data.get(INITIAL.SLEEPING_ITEMS, False):
+            self.scheduler = ItemScheduler()
+        self.checkpoint_interval = self.initial_data.get(INITIAL.CHECKPOINT_INTERVAL)
+        self.checkpoint_dir = self.initial_data.get(INITIAL.CHECKPOINT_DIR, 'checkpoints')
         # WHY: can't we move an initialisation of players in the __init__ function?
         # in that case we can use it before start
         self.players = {p['id']: p for p in self.initial_data['players']}
@@ -356,6 +586,17 @@ class FightHandler(BaseHandler):
         self.map_size = self.initial_data[INITIAL.MAP_SIZE]
         self.rewards = self.initial_data.get(INITIAL.REWARDS, {})
         self.time_limit = self.initial_data.get(INITIAL.TIME_LIMIT, float("inf"))
+        checkpoint = self.initial_data.get(INITIAL.CHECKPOINT)
+        if checkpoint is not None:
+            if not isinstance(checkpoint, dict):
+                checkpoint = load_checkpoint(checkpoint)
+            self.restore_checkpoint(checkpoint)
+            fight_items = [it.start() for it in self.fighters.values() if not it.is_dead]
+            atexit.register(self.send_full_log)
+            self.compute_frame()
+            yield fight_items
+            return
+
         fight_items = []
         for item in self.initial_data[INITIAL.MAP_ELEMENTS]:
             player = self.players[item.get(PLAYER.PLAYER_ID, -1)]
@@ -371,21 +612,130 @@ class FightHandler(BaseHandler):
         self._log_initial_state()
 
         self.compute_frame()
-        self.create_map()
-        self.create_route_graph()
+        self.prepare_map()
         yield fight_items
 
-    def create_map(self):
-        height = self.map_size[0] * self.GRID_SCALE
-        width = self.map_size[1] * self.GRID_SCALE
-        self.map_grid = [[1] * width for _ in range(height)]
-        for it in self.fighters.values():
-            if not it.size:
-                continue
-            size = it.size * self.GRID_SCALE
-            fill_square(self.map_grid, int(it.coordinates[0] * self.GRID_SCALE) - size // 2,
-                        int(it.coordinates[1] * self.GRID_SCALE) - size // 2, size, 0)
+    @gen.coroutine
+    def get_item_environment(self, item):
+        """
+            an environment for the executable item.
+            With INITIAL.MULTIPLEX_ENVIRONMENTS items of the same player and code
+            are contexts of one environment process
+        """
+        env_name = item.player[PLAYER.ENV_NAME]
+        if not self.multiplex_environments:
+            env = yield self._get_environment(env_name)
+            return env
+        key = (item.player[ATTRIBUTE.ID], item.code)
+        if key not in self._multiplexed_environments:
+            self._multiplexed_environments[key] = self._start_multiplexed_environment(env_name)
+        env = yield self._multiplexed_environments[key]
+        return env.context(item.id)
+
+    @gen.coroutine
+    def _start_multiplexed_environment(self, env_name):
+        client = yield self._get_environment(env_name)
+        env = MultiplexedEnvironment(client)
+        env.route_messages()
+        return env
+
+    @gen.coroutine
+    def _get_environment(self, env_name):
+        started = time.perf_counter()
+        env = yield self.get_environment(env_name)
+        self.environment_waits.append(time.perf_counter() - started)
+        return env
+
+    def prepare_map(self):
+        """
+            the grid, the route graph and landmarks.
+            With INITIAL.MAP_CACHE_DIR the grid and landmark tables are loaded
+            from the cache for the same items on the grid or saved there
+        """
+        started = time.perf_counter()
+        cache = cached = None
+        if self.map_cache_dir:
+            cache = MapCache(self.map_cache_dir)
+            key = map_key([(it.coordinates, it.size) for it in self.fighters.values() if it.size],
+                          self.map_size, self.GRID_SCALE, self.route_landmarks)
+            cached = cache.load(key)
+
+        if cached is None:
+            self.create_map()
+            self.create_route_graph()
+            self.create_landmarks()
+            if cache is not None:
+                landmarks = self.landmarks
+                cache.save(key, self.map_grid, self.map_graph,
+                           landmarks.cells if landmarks else (),
+                           landmarks.tables if landmarks else ())
+        else:
+            self.create_map(cached['grid'])
+            self.map_graph = cached['graph']
+            if self.route_landmarks:
+                self.landmarks = Landmarks.from_tables(
+                    self.map_graph, len(self.map_grid), len(self.map_grid[0]),
+                    cached['landmark_cells'], cached['landmark_tables'])
+        self.map_stats = {
+            'cache': None if cache is None else ('hit' if cached else 'miss'),
+            'seconds': time.perf_counter() - started
+        }
+
+    def create_map(self, grid=None):
+        """
+            :param grid: the grid which was created before for the same map
+        """
+        if grid is not None:
+            self.map_grid = grid
+        else:
+            height = self.map_size[0] * self.GRID_SCALE
+            width = self.map_size[1] * self.GRID_SCALE
+            self.map_grid = [[1] * width for _ in range(height)]
+            for it in self.fighters.values():
+                if not it.size:
+                    continue
+                size = it.size * self.GRID_SCALE
+                fill_square(self.map_grid, int(it.coordinates[0] * self.GRID_SCALE) - size // 2,
+                            int(it.coordinates[1] * self.GRID_SCALE) - size // 2, size, 0)
         self.hash_grid()
+        self.create_coverage_maps()
+
+    def create_coverage_maps(self):
+        """
+            coverage maps of static shooters for sizes of all items on the map,
+            maps for other sizes are created on demand
+        """
+        sizes = {it.size for it in self.fighters.values()}
+        for shooter in self.fighters.values():
+            if self.is_static_shooter(shooter):
+                for size in sizes:
+                    self.get_coverage_map(shooter, size)
+
+    @staticmethod
+    def is_static_shooter(item):
+        return item.role in (ROLE.TOWER, ROLE.CENTER) and bool(item.firing_range)
+
+    def get_coverage_map(self, shooter, target_size):
+        key = (shooter.id, target_size)
+        coverage = self.coverage_maps.get(key)
+        if coverage is None:
+            coverage = self.coverage_maps[key] = CoverageMap(
+                shooter.coordinates, shooter.firing_range + target_size / 2,
+                self.map_size, self.GRID_SCALE)
+        return coverage
+
+    def is_in_firing_range(self, shooter, target):
+        """
+            the target is within the firing range of the shooter.
+            For static shooters coverage maps answer without the distance
+            except cells on the border of the range
+        """
+        if self.is_static_shooter(shooter):
+            found = self.get_coverage_map(shooter, target.size).lookup(target.coordinates)
+            if found != COVERAGE_BORDER:
+                return found == COVERAGE_INSIDE
+        distance = euclidean_distance(target.coordinates, shooter.coordinates)
+        return distance - target.size / 2 <= shooter.firing_range
 
     def is_point_on_map(self, x, y):
         return 0 < x < self.map_size[0] and 0 < y < self.map_size[1]
@@ -395,13 +745,147 @@ class FightHandler(BaseHandler):
 
     def hash_grid(self):
         self.map_hash = hash(tuple(map(tuple, self.map_grid)))
+        self.route_cache = {}
+        # they are planned for the old map
+        for future in self._pending_routes.values():
+            future.cancel()
+        self._pending_routes = {}
+        self._route_searches = {}
+
+    def point_to_cell(self, point):
+        return (int(round((point[0] - self.CELL_SHIFT) * self.GRID_SCALE)),
+                int(round((point[1] - self.CELL_SHIFT) * self.GRID_SCALE)))
+
+    def cell_to_point(self, cell):
+        return ((cell[0] / self.GRID_SCALE) + self.CELL_SHIFT,
+                (cell[1] / self.GRID_SCALE) + self.CELL_SHIFT)
+
+    def get_route(self, start_point, end_point, wait=True):
+        """
+            a route between points as a new list of points, it's empty
+            if there is no way. Routes are cached until the map is changed
+
+            :param start_point: coordinates of the start
+            :param end_point: coordinates of the goal
+            :param wait: with INITIAL.ASYNC_ROUTES a route which is not cached yet
+                is planned in ROUTE_EXECUTOR and None is returned,
+                the route is taken by collect_routes on one of the next frames.
+                With INITIAL.ROUTE_BUDGET the search expands cells within the budget
+                of the frame, None is returned until it's finished on one of the next calls
+        """
+        key = (self.point_to_cell(start_point), self.point_to_cell(end_point))
+        cell_route = self.route_cache.get(key)
+        if cell_route is None:
+            if self.async_routes and not wait:
+                self.plan_route_async(key)
+                return None
+            if self.route_budget is not None and not wait:
+                return self.search_route_in_budget(key)
+            self.route_cache_stats['misses'] += 1
+            cell_route = self.route_cache[key] = plan_route(self.map_grid, self.map_graph, *key,
+                                                            heuristic=self.route_heuristic())
+        else:
+            self.route_cache_stats['hits'] += 1
+        return [self.cell_to_point(cell) for cell in cell_route]
+
+    def plan_route_async(self, key):
+        if key in self._pending_routes:
+            return
+        if FightHandler.ROUTE_EXECUTOR is None:
+            FightHandler.ROUTE_EXECUTOR = ProcessPoolExecutor(max_workers=2)
+        self.route_cache_stats['misses'] += 1
+        self._pending_routes[key] = self.ROUTE_EXECUTOR.submit(
+            plan_route_on_grid, self.map_grid, self.map_hash, *key)
+
+    def search_route_in_budget(self, key):
+        search = self._route_searches.get(key)
+        if search is None:
+            self.route_cache_stats['misses'] += 1
+            search = self._route_searches[key] = RouteSearch(self.map_grid, self.map_graph, *key,
+                                                             heuristic=self.route_heuristic())
+        if self.route_budget_per_unit:
+            budget = self.route_budget
+        else:
+            budget = max(self.route_budget - self.route_expansions['frame'], 0)
+        self._continued_searches.add(key)
+        self.route_expansions['frame'] += search.step(budget)
+        if not search.finished:
+            return None
+        self.finish_route_search(key)
+        return [self.cell_to_point(cell) for cell in self.route_cache[key]]
+
+    def finish_route_search(self, key):
+        search = self._route_searches.pop(key)
+        self.route_cache[key] = search.route and tuple(straighten_route(self.map_grid,
+                                                                        search.route))
+
+    def continue_route_searches(self):
+        """
+            continue searches of the previous frames before units are computed,
+            the oldest search first, each with all the budget which is left.
+            Otherwise the budget goes in the order of units and a unit which
+            is computed late waits while units before it start new searches.
+            A finished search is put in the cache, new searches of the frame
+            get the rest of the budget.
+            Equal shares for all searches finish every route late and units stand
+            idle longer, with the budget of 50 cells it changes the winner of
+            small and horde battles of benchmarks/battles.py
+        """
+        for key, search in tuple(self._route_searches.items()):
+            budget = self.route_budget - self.route_expansions['frame']
+            if budget <= 0:
+                break
+            self.route_expansions['frame'] += search.step(budget)
+            if search.finished:
+                self.finish_route_search(key)
+
+    def collect_routes(self):
+        """
+            put planned routes in the cache and start the route budget of a new frame.
+            In the headless mode all routes which were asked on the previous frame
+            are waited for, so a battle doesn't depend on the speed of workers
+        """
+        for key, future in tuple(self._pending_routes.items()):
+            if self.headless or future.done():
+                del self._pending_routes[key]
+                self.route_cache[key] = future.result()
+
+        expansions = self.route_expansions
+        expansions['total'] += expansions['frame']
+        expansions['max_frame'] = max(expansions['max_frame'], expansions['frame'])
+        expansions['frame'] = 0
+        # nobody continued them on the last frame
+        for key in set(self._route_searches) - self._continued_searches:
+            del self._route_searches[key]
+        self._continued_searches = set()
+        if self.route_budget is not None and not self.route_budget_per_unit:
+            self.continue_route_searches()
 
     def clear_from_map(self, item):
         size = item.size * self.GRID_SCALE
-        fill_square(self.map_grid, item.coordinates[0] * self.GRID_SCALE - size // 2,
-                    item.coordinates[1] * self.GRID_SCALE - size // 2, size, 1)
+        row = item.coordinates[0] * self.GRID_SCALE - size // 2
+        column = item.coordinates[1] * self.GRID_SCALE - size // 2
+        opened = [(i, j) for i, j in square_cells(self.map_grid, row, column, size)
+                  if not self.map_grid[i][j]]
+        fill_square(self.map_grid, row, column, size, 1)
         self.create_route_graph()
         self.hash_grid()
+        if self.landmarks is not None:
+            self.landmarks.open_cells(self.map_graph, opened)
+
+    def create_landmarks(self):
+        if self.route_landmarks:
+            self.landmarks = Landmarks(self.map_graph, len(self.map_grid),
+                                       len(self.map_grid[0]), self.route_landmarks)
+
+    def route_heuristic(self):
+        """
+            ALT heuristic with INITIAL.ROUTE_LANDMARKS, the straight line without them
+        """
+        if self.landmarks is None:
+            return euclidean_distance
+        self.landmarks.update()
+        return self.landmarks.heuristic
 
     @gen.coroutine
     def add_fight_item(self, item_data, player):
@@ -448,27 +932,199 @@ class FightHandler(BaseHandler):
         """
             calculate every frame and action for every FightItem
         """
+        if (self.checkpoint_interval and self.current_frame and
+                not self.current_frame % self.checkpoint_interval):
+            self.save_checkpoint()
         self.send_frame()
+        self._query_cache = {}
+        self.collect_routes()
         self.current_frame += 1
         self.current_game_time += self.GAME_FRAME_TIME
-        for key, fighter in self.fighters.items():
-            # WHY: can't we move in the FightItem class?
-            # When in can be None?
+        if self.scheduler is not None:
+            self.compute_active_items()
+        else:
+            for key, fighter in self.fighters.items():
+                # WHY: can't we move in the FightItem class?
+                # When in can be None?
+                if fighter.is_dead:
+                    continue
+
+                if fighter.action is None:
+                    fighter.set_state_idle()
+                    continue
+
+                fighter.do_frame_action()
+
+        self.send_world_state()
+        winner = self.get_winner()
+        if winner is not None:
+            self.finish_battle({'winner': winner})
+        elif self.headless:
+            IOLoop.current().add_callback(self.compute_frame)
+        else:
+            IOLoop.current().call_later(self.FRAME_TIME, self.compute_frame)
+
+    def compute_active_items(self):
+        """
+            the same as the loop over all fighters in compute_frame, but only for items
+            which are awake. Idle items are parked till an action, a subscription
+            or a change of the target, charging shooters sleep till the frame of the shot
+        """
+        scheduler = self.scheduler
+        for item_id in scheduler.run(self.current_frame):
+            fighter = self.fighters[item_id]
             if fighter.is_dead:
+                scheduler.park(item_id)
                 continue
 
             if fighter.action is None:
                 fighter.set_state_idle()
+                scheduler.park(item_id)
                 continue
 
+            fighter.skip_frames(scheduler.skipped_frames(item_id, self.current_frame))
             fighter.do_frame_action()
+            if fighter.get_action_status() == 'charge':
+                frames = fighter.frames_to_shot()
+                if frames > 1:
+                    scheduler.sleep(item_id, self.current_frame, self.current_frame + frames,
+                                    fighter.action['data'][ATTRIBUTE.ID])
 
-        winner = self.get_winner()
-        if winner is not None:
-            self.send_frame({'winner': winner}, True)
-            self.stop()
-        else:
-            IOLoop.current().call_later(self.FRAME_TIME, self.compute_frame)
+    def wake_item(self, item_id):
+        if self.scheduler is not None:
+            self.scheduler.wake(item_id)
+
+    def wake_watchers(self, item_id):
+        """
+            items which sleep on the item are woken when it's moved or dead
+        """
+        if self.scheduler is not None:
+            self.scheduler.wake_watchers(item_id)
+
+    def save_checkpoint(self):
+        """
+            the checkpoint is dumped here, as it shares lists with the battle,
+            and written in CHECKPOINT_EXECUTOR. Only frames after the previous
+            checkpoint are dumped, so it doesn't grow with the battle log
+        """
+        dumped = dump_checkpoint(self.get_checkpoint(), self._checkpoint_frame_files)
+        self._checkpoint_frame_files = dumped.frame_files
+        if FightHandler.CHECKPOINT_EXECUTOR is None:
+            FightHandler.CHECKPOINT_EXECUTOR = ThreadPoolExecutor(max_workers=1)
+        future = self.CHECKPOINT_EXECUTOR.submit(write_checkpoint, self.checkpoint_dir, dumped)
+        # an error of the write is logged by IOLoop
+        IOLoop.current().add_future(future, lambda result: result.result())
+
+    def get_checkpoint(self):
+        """
+            the state of the battle between frames as JSON serializable data,
+            it shares lists with the battle, so dump it before the next frame.
+            Environments are not a part of it, the code of items is started again
+            when the battle is resumed with INITIAL.CHECKPOINT
+        """
+        routes = dict(self.route_cache)
+        pending_routes = []
+        for key, future in self._pending_routes.items():
+            # a route which is not planned yet is planned again on resume
+            if future.done():
+                routes[key] = future.result()
+            else:
+                pending_routes.append(list(key))
+        landmarks = None
+        if self.landmarks is not None:
+            self.landmarks.update()
+            landmarks = {'cells': self.landmarks.cells,
+                         'tables': [encode_floats(table) for table in self.landmarks.tables]}
+        return {
+            'version': CHECKPOINT_VERSION,
+            'frame': self.current_frame,
+            'game_time': self.current_game_time,
+            'fight_items_count': FightItem.ITEMS_COUNT,
+            'craft_items_count': CraftItem.ITEMS_COUNT,
+            'random': encode_random_state(random.getstate()),
+            'players': list(self.players),
+            'defeat_reason': self.defeat_reason,
+            'fighters': [it.get_checkpoint() for it in self.fighters.values()],
+            'crafts': [craft.get_checkpoint() for craft in self.crafts.values()],
+            'map_grid': self.map_grid,
+            'landmarks': landmarks,
+            'routes': [[start, end, route] for (start, end), route in routes.items()],
+            'pending_routes': pending_routes,
+            'route_searches': [[start, end, search.get_state()]
+                               for (start, end), search in self._route_searches.items()],
+            'continued_searches': list(self._continued_searches),
+            'route_expansions': self.route_expansions,
+            'events': self.EVENTS,
+            'world_state_receivers': list(self.world_state_receivers),
+            'scheduler': self.scheduler and self.scheduler.get_state(),
+            'frame_sampler': self.frame_sampler.get_state(),
+            'battle_log': self.battle_log
+        }
+
+    def restore_checkpoint(self, checkpoint):
+        """
+            resume the battle from get_checkpoint data. Players, codes and flags
+            are taken from the initial data, so the code can be changed
+        """
+        if checkpoint.get('version') != CHECKPOINT_VERSION:
+            raise ValueError("Unknown version of the checkpoint")
+        players = self.players
+        self.players = {player_id: players[player_id] for player_id in checkpoint['players']}
+        self.defeat_reason = checkpoint['defeat_reason']
+        for item_checkpoint in checkpoint['fighters']:
+            item = FightItem.from_checkpoint(item_checkpoint,
+                                             players[item_checkpoint['player_id']], self)
+            self.fighters[item.id] = item
+        for craft_checkpoint in checkpoint['crafts']:
+            craft = CraftItem.from_checkpoint(craft_checkpoint,
+                                              players[craft_checkpoint['player_id']], self)
+            self.crafts[craft.id] = craft
+        # ids of fighters and crafts are counted separately, creation above counted them too
+        FightItem.ITEMS_COUNT = checkpoint['fight_items_count']
+        CraftItem.ITEMS_COUNT = checkpoint['craft_items_count']
+        self.current_frame = checkpoint['frame']
+        self.current_game_time = checkpoint['game_time']
+        random.setstate(decode_random_state(checkpoint['random']))
+
+        self.create_map(checkpoint['map_grid'])
+        self.create_route_graph()
+        landmarks = checkpoint['landmarks']
+        if landmarks is not None:
+            self.landmarks = Landmarks.from_tables(
+                self.map_graph, len(self.map_grid), len(self.map_grid[0]),
+                map(tuple, landmarks['cells']), map(decode_floats, landmarks['tables']))
+        self.route_cache = {(tuple(start), tuple(end)): tuple(map(tuple, route))
+                            for start, end, route in checkpoint['routes']}
+        heuristic = self.route_heuristic()
+        self._route_searches = {
+            (tuple(start), tuple(end)): RouteSearch.from_state(self.map_graph, state, heuristic)
+            for start, end, state in checkpoint['route_searches']}
+        self._continued_searches = {(tuple(start), tuple(end))
+                                    for start, end in checkpoint['continued_searches']}
+        self.route_expansions = dict(checkpoint['route_expansions'])
+        for start, end in checkpoint['pending_routes']:
+            self.plan_route_async((tuple(start), tuple(end)))
+
+        # lookup keys of subscriptions are valid only in the process of the code
+        # which subscribed, the code is started again and the client skips events
+        # with unknown keys, receivers of the world state get the full state
+        self.EVENTS = {event_name: checkpoint['events'].get(event_name, [])
+                       for event_name in self.EVENTS}
+        self.world_state_receivers = {item_id: True
+                                      for item_id in checkpoint['world_state_receivers']}
+        scheduler_state = checkpoint['scheduler']
+        if self.scheduler is not None:
+            self.scheduler = ItemScheduler()
+            if scheduler_state is not None:
+                self.scheduler.set_state(scheduler_state)
+            else:
+                self.scheduler.active = set(self.fighters)
+        elif scheduler_state is not None:
+            # charging which sleeping items didn't get yet
+            for item_id, since in scheduler_state['since']:
+                self.fighters[item_id].skip_frames(self.current_frame - since)
+        self.frame_sampler = FrameSampler.from_state(checkpoint['frame_sampler'])
+        self.battle_log = checkpoint['battle_log']
 
     def count_casualties(self, roles):
         result = {}
@@ -513,7 +1169,15 @@ class FightHandler(BaseHandler):
                 return True
         return False
 
-    def send_frame(self, status=None, battle_finished=False):
+    @gen.coroutine
+    def finish_battle(self, status):
+        if self.collect_stats:
+            self.battle_log[OUTPUT.RESULT_CATEGORY][OUTPUT.STATS] = self.get_stats()
+        self.send_frame(status)
+        yield self.send_final_log()
+        self.stop()
+
+    def send_frame(self, status=None):
         """
             prepare and send data to an interface for visualisation
         """
@@ -534,12 +1198,56 @@ class FightHandler(BaseHandler):
                 'current_frame': self.current_frame,
                 'current_game_time': self.current_game_time
             })
-        self.battle_log["frames"].append(self._get_battle_snapshot())
-        if battle_finished:
-            self.editor_client.send_battle(self.battle_log)
+        self.battle_log["frames"].append(self.frame_sampler.sample(self._get_battle_snapshot()))
 
     def send_full_log(self):
-        self.send_frame(battle_finished=True)
+        """
+            called at exit, when IOLoop doesn't work anymore
+        """
+        self.send_frame()
+        if not self.log_chunked:
+            self.editor_client.send_battle(self.battle_log)
+            return
+        for message in pack_log_chunks(self.battle_log, self.log_format, self.log_compression,
+                                       self.log_keyframe_interval):
+            self.editor_client.send_battle(message)
+
+    @gen.coroutine
+    def send_final_log(self):
+        """
+            Without log_format and log_compression in the initial data
+            the battle log is sent as a dict, as the editor expects it.
+            It's the default, and the editor client still encodes the whole log
+            on the IOLoop then, so a long battle blocks the IOLoop for the time.
+            With any of them the log is encoded and compressed in LOG_EXECUTOR,
+            a process pool, so the encoding doesn't hold the GIL of the IOLoop,
+            and it's sent by chunks of base64.
+            Only pickling of the log for the worker is done in the process
+        """
+        if not self.log_chunked:
+            self.editor_client.send_battle(self.battle_log)
+            return
+        if FightHandler.LOG_EXECUTOR is None:
+            FightHandler.LOG_EXECUTOR = ProcessPoolExecutor(max_workers=2)
+        messages = yield self.LOG_EXECUTOR.submit(
+            pack_log_chunks, self.battle_log, self.log_format, self.log_compression,
+            self.log_keyframe_interval)
+        for message in messages:
+            self.editor_client.send_battle(message)
+            yield gen.moment
+
+    @classmethod
+    def shutdown_executors(cls, wait=True):
+        """
+            executors are shared by all battles of the referee process,
+            so they are shut down at exit, not when a battle is stopped.
+            A pending checkpoint is written before it returns with wait
+        """
+        for name in ('LOG_EXECUTOR', 'CHECKPOINT_EXECUTOR', 'ROUTE_EXECUTOR'):
+            executor = getattr(FightHandler, name)
+            if executor is not None:
+                setattr(FightHandler, name, None)
+                executor.shutdown(wait=wait)
 
     def _log_initial_state(self):
         for item in self.fighters.values():
@@ -628,18 +1336,135 @@ class FightHandler(BaseHandler):
         players = [{PLAYER.PLAYER_ID: p} for p in self.players if p >= 0]
         return self.filter_by_party(players, data[PARTY.REQUEST_NAME], applicant_player_id)
 
-    def get_group_item_info(self, data, applicant_player_id):
+    def get_stats(self):
+        """
+            counters of the battle internals, they are added to the result
+            with INITIAL.COLLECT_STATS
+        """
+        hits = self.query_cache_stats['hits']
+        total = hits + self.query_cache_stats['misses']
+        startup_times = list(self.startup_times.values())
+        route_hits = self.route_cache_stats['hits']
+        route_total = route_hits + self.route_cache_stats['misses']
+        stats = {
+            'query_cache': dict(self.query_cache_stats,
+                                hit_rate=hits / total if total else 0),
+            'route_cache': dict(self.route_cache_stats,
+                                hit_rate=route_hits / route_total if route_total else 0),
+            'map': self.map_stats,
+            'route_search': dict(self.route_expansions, budget=self.route_budget,
+                                 per_unit=self.route_budget_per_unit),
+            'startup': {
+                'items': self.startup_times,
+                'mean': sum(startup_times) / len(startup_times) if startup_times else 0,
+                'max': max(startup_times, default=0),
+                'environment_waits': {
+                    'calls': self.environment_waits,
+                    'mean': (sum(self.environment_waits) / len(self.environment_waits)
+                             if self.environment_waits else 0),
+                    'max': max(self.environment_waits, default=0)
+                }
+            }
+        }
+        if self.scheduler is not None:
+            stats['scheduler'] = dict(self.scheduler.stats, items=len(self.fighters))
+        if self._referee is not None:
+            # environments which were taken from the pool and started on demand
+            stats['startup']['environments'] = dict(
+                self._referee.environments_controller.stats)
+        return stats
+
+    def cached_query(self, key, compute):
+        """
+            memoize a query for the current frame,
+            the cache is dropped when compute_frame advances the frame.
+
+            :param key: hashable query key, it must include everything
+                the result depends on (the applicant player, position and so on)
+            :param compute: function without arguments, returns a list of item ids
+                or an item id, infos are built from them for every call
+                so they include changes made between frames (actions)
+        """
+        try:
+            result = self._query_cache[key]
+        except KeyError:
+            self.query_cache_stats['misses'] += 1
+            result = self._query_cache[key] = compute()
+        else:
+            self.query_cache_stats['hits'] += 1
+        return result
+
+    def get_group_item_info(self, data, applicant_player_id, applicant_id=None):
+        """
+            items by parties and roles and optional FILTER keys:
+            types - item types,
+            hit_points_below - hit points are less than the value,
+            radius - items within the radius of coordinates
+                (the applicant coordinates by default),
+            order_by_distance - sort by the distance to the coordinates,
+            limit - max number of items,
+            fields - return only these fields of the info
+        """
+        by_distance = (data.get(FILTER.RADIUS) is not None or
+                       data.get(FILTER.ORDER_BY_DISTANCE))
+        if by_distance and data.get(FILTER.COORDINATES) is None:
+            position = tuple(self.fighters[applicant_id].coordinates)
+        else:
+            position = None
+        query = {key: value for key, value in data.items() if key != FILTER.FIELDS}
+        key = ('items', json.dumps(query, sort_keys=True), applicant_player_id, position)
+        item_ids = self.cached_query(
+            key, lambda: self._find_group_items(data, applicant_player_id, applicant_id))
+
+        items = [self.fighters[item_id].info for item_id in item_ids]
+        fields = data.get(FILTER.FIELDS)
+        if fields is None:
+            return items
+        return [{field: info[field] for field in fields if field in info} for info in items]
+
+    def _find_group_items(self, data, applicant_player_id, applicant_id):
         items = [it.info for it in self.fighters.values() if not it.is_dead]
         items = self.filter_by_party(items, data[PARTY.REQUEST_NAME], applicant_player_id)
         items = self.filter_by_role(items, data[ROLE.REQUEST_NAME])
-        return items
+        items = [self.fighters[it[ATTRIBUTE.ID]] for it in items]
+
+        types = data.get(FILTER.TYPES)
+        if types is not None:
+            items = [it for it in items if it.item_type in types]
+        hit_points_below = data.get(FILTER.HIT_POINTS_BELOW)
+        if hit_points_below is not None:
+            items = [it for it in items if it.hit_points < hit_points_below]
+
+        radius = data.get(FILTER.RADIUS)
+        order_by_distance = data.get(FILTER.ORDER_BY_DISTANCE)
+        if radius is not None or order_by_distance:
+            center = data.get(FILTER.COORDINATES)
+            if center is None:
+                center = self.fighters[applicant_id].coordinates
+            distances = {it.id: euclidean_distance(it.coordinates, center) - it.size / 2
+                         for it in items}
+            if radius is not None:
+                items = [it for it in items if distances[it.id] <= radius]
+            if order_by_distance:
+                items.sort(key=lambda it: distances[it.id])
+
+        limit = data.get(FILTER.LIMIT)
+        if limit is not None:
+            items = items[:limit]
+        return [it.id for it in items]
 
     def get_nearest_enemy(self, item_id):
+        fighter = self.fighters[item_id]
+        key = ('nearest_enemy', fighter.player[ATTRIBUTE.ID], tuple(fighter.coordinates))
+        nearest_id = self.cached_query(key, lambda: self._find_nearest_enemy(fighter))
+        if nearest_id is None:
+            return None
+        return self.get_item_info(nearest_id)
+
+    def _find_nearest_enemy(self, fighter):
         min_length = 1000
         nearest_enemy = None
 
-        fighter = self.fighters[item_id]
-
         for item in self.fighters.values():
             if item.player == fighter.player or item.is_dead or item.is_obstacle:
                 continue
@@ -649,17 +1474,37 @@ class FightHandler(BaseHandler):
             if length < min_length:
                 min_length = length
                 nearest_enemy = item
-        return self.get_item_info(nearest_enemy.id)
+        return nearest_enemy and nearest_enemy.id
+
+    def get_route_to(self, item_id, coordinates):
+        return self.get_route(self.fighters[item_id].coordinates, coordinates)
+
+    def get_path_distance(self, item_id, coordinates):
+        """
+            length of the way which the item goes to the coordinates
+            or None if there is no way
+        """
+        route = self.get_route_to(item_id, coordinates)
+        if not route:
+            return None
+        points = [tuple(self.fighters[item_id].coordinates)] + route
+        return sum(euclidean_distance(point, next_point)
+                   for point, next_point in zip(points, points[1:]))
 
     def get_enemy_items_in_my_firing_range(self, item_id):
         seeker = self.fighters[item_id]
+        key = ('enemy_items_in_my_firing_range', seeker.player[ATTRIBUTE.ID],
+               tuple(seeker.coordinates), seeker.firing_range)
+        item_ids = self.cached_query(key, lambda: self._find_enemies_in_range(seeker))
+        return [self.get_item_info(other_id) for other_id in item_ids]
+
+    def _find_enemies_in_range(self, seeker):
         result = []
         for other in self.fighters.values():
             if other.player == seeker.player or other.is_dead or other.is_obstacle:
                 continue
-            distance = euclidean_distance(other.coordinates, seeker.coordinates)
-            if distance - other.size / 2 <= seeker.firing_range:
-                result.append(self.get_item_info(other.id))
+            if self.is_in_firing_range(seeker, other):
+                result.append(other.id)
         return result
 
     def subscribe(self, event_name, item_id, lookup_key, data):
@@ -671,6 +1516,9 @@ class FightHandler(BaseHandler):
             event_item = self.fighters[item_id]
             self.unsubscribe(event_item)
             return
+        if event_name == "world_state":
+            self.world_state_receivers[item_id] = True
+            return True
         if event_name not in self.EVENTS:
             return
         subscribe_data = {
@@ -682,6 +1530,8 @@ class FightHandler(BaseHandler):
         if subscribe_data in event:
             return False
         event.append(subscribe_data)
+        # events like "im_idle" are checked when the item is run
+        self.wake_item(item_id)
         return True
 
     def unsubscribe(self, item):
@@ -691,11 +1541,43 @@ class FightHandler(BaseHandler):
         # WHY: don't we call this method unsubscribe_item or unsubscribe_all
         # because if we have subscribe method working in one way then
         # unsubscribe should work in opposite
+        self.world_state_receivers.pop(item.id, None)
         for events in self.EVENTS.values():
             for event in events[:]:
                 if event['receiver_id'] == item.id:
                     events.remove(event)
 
+    def send_world_state(self):
+        """
+            send changes of items since the previous frame to all world state receivers.
+            Changes are collected once per frame and the same data goes to every receiver,
+            a new receiver gets the full state
+        """
+        if not self.world_state_receivers:
+            return
+        changed = []
+        removed = []
+        for item in self.fighters.values():
+            if item.is_dead:
+                if self._world_versions.pop(item.id, None) is not None:
+                    removed.append(item.id)
+                continue
+            if self._world_versions.get(item.id) != item.info_version:
+                self._world_versions[item.id] = item.info_version
+                changed.append(item.info)
+        delta = {'frame': self.current_frame, 'full': False, 'items': changed, 'removed': removed}
+        full_state = None
+        for receiver_id, needs_full_state in self.world_state_receivers.items():
+            if needs_full_state:
+                if full_state is None:
+                    full_state = {'frame': self.current_frame, 'full': True, 'removed': [],
+                                  'items': [it.info for it in self.fighters.values()
+                                            if not it.is_dead]}
+                if self.fighters[receiver_id].send_world_state(full_state):
+                    self.world_state_receivers[receiver_id] = False
+            elif changed or removed:
+                self.fighters[receiver_id].send_world_state(delta)
+
     def _send_event(self, event_item_id, event_name, check_function, data_function):
         event_item = self.fighters.get(event_item_id)
         events = self.EVENTS.get(event_name, [])
@@ -780,8 +1662,7 @@ class FightHandler(BaseHandler):
             if (receiver.id != event_item.id and
                     not event_item.is_obstacle and
                     event_item.player != receiver.player):
-                distance = euclidean_distance(receiver.coordinates, event_item.coordinates)
-                return distance - event_item.size / 2 <= receiver.firing_range
+                return self.is_in_firing_range(receiver, event_item)
             return False
 
         self._send_event(event_item_id, "enemy_in_my_firing_range",
@@ -794,8 +1675,7 @@ class FightHandler(BaseHandler):
 
         def check_function(event, event_item, receiver):
             if event["data"]["item_id"] == event_item.id:
-                distance = euclidean_distance(receiver.coordinates, event_item.coordinates)
-                return distance - event_item.size / 2 > receiver.firing_range
+                return not self.is_in_firing_range(receiver, event_item)
             return False
 
         self._send_event(event_item_id, "the_item_out_my_firing_range",
@@ -813,8 +1693,14 @@ class FightHandler(BaseHandler):
         self._send_event(event_item_id, "any_item_in_area", check_function, self._data_event_id)
 
 
+# after send_full_log of battles, as atexit calls functions in the reverse order
+atexit.register(FightHandler.shutdown_executors)
+
+
 class Referee(RefereeBase):
     ENVIRONMENTS = settings_env.ENVIRONMENTS
+    # started environments which wait for a code, for every env name
+    ENVIRONMENTS_POOL_SIZE = getattr(settings_env, 'ENVIRONMENTS_POOL_SIZE', 0)
     EDITOR_LOAD_ARGS = ('battle_info', 'action')
     HANDLERS = {
         'battle': FightHandler
@@ -823,6 +1709,9 @@ class Referee(RefereeBase):
     @property
     def environments_controller(self):
         if not hasattr(self, '_environments_controller'):
-            setattr(self, '_environments_controller', BattleEnvironmentsController(
-                self.ENVIRONMENTS))
+            controller = BattleEnvironmentsController(self.ENVIRONMENTS,
+                                                      pool_size=self.ENVIRONMENTS_POOL_SIZE)
+            for env_name in self.ENVIRONMENTS:
+                controller.warm_up(env_name)
+            setattr(self, '_environments_controller', controller)
         return getattr(self, '_environments_controller')
@@ -1,4 +1,10 @@
 from .grid import *
 from .precalculated import *
 from .distances import *
-from .terms import *
\ No newline at end of file
+from .terms import *
+from .battle_log import *
+from .coverage import *
+from .landmarks import *
+from .map_cache import *
+from .scheduler import *
+from .checkpoint import *
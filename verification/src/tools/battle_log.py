@@ -0,0 +1,419 @@
+"""
+Compact binary form of the battle log.
+
+Layout (all numbers are little-endian):
+
+    MAGIC                       4 bytes
+    header length, header       uint32 + utf-8 JSON with the initial and result categories
+    string table                uint16 count + (uint8 length + utf-8) for every status name
+    frames count                uint32
+    every frame:
+        frame kind              uint8, KEYFRAME or DELTA
+        records count           uint16
+        records                 RECORD for every item of the frame: uint32 id,
+                                int32 x, int32 y, uint8 hit points percentage,
+                                uint8 status code, int32 firing point x, int32 firing point y
+    index                       uint32 count + (uint32 frame number, uint32 offset)
+                                for every keyframe
+    index offset                uint32
+
+A keyframe holds the full state of every item, a delta frame holds only
+records which are changed since the previous frame.
+Any frame can be rebuilt from the nearest keyframe before it and a few deltas.
+
+Item ids are uint32, coordinates are stored as signed fixed-point numbers
+with COORDINATE_SCALE steps per tile. A value out of range raises ValueError.
+The high bit of the status code marks records with a firing point.
+"""
+
+__all__ = ["check_keyframe_interval", "encode_battle_log", "decode_battle_log", "BattleLogReader",
+           "FrameSampler", "downsample_frames", "dump_battle_log_json", "pack_log_chunks",
+           "unpack_log_chunks"]
+
+import gzip
+import json
+import zlib
+from base64 import b64encode, b64decode
+from bisect import bisect_right
+from struct import Struct
+
+from .terms import OUTPUT, ACTION, LOG_FORMAT, LOG_COMPRESSION
+
+MAGIC = b'CBL\x03'
+COORDINATE_SCALE = 100
+FLAG_FIRING_POINT = 0x80
+KEYFRAME_INTERVAL = 50
+CHUNK_SIZE = 256 * 1024  # characters of base64 in one message of the final log
+
+KEYFRAME = 0
+DELTA = 1
+
+# id, x, y, hit points percentage, status code, firing point x, firing point y
+RECORD = Struct('<IiiBBii')
+FRAME_HEADER = Struct('<BH')
+INDEX_ENTRY = Struct('<II')
+UINT8 = Struct('<B')
+UINT16 = Struct('<H')
+UINT32 = Struct('<I')
+UINT32_MAX = 2 ** 32 - 1
+INT32_MIN, INT32_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+def _build_string_table(frames):
+    table = []
+    for frame in frames:
+        for record in frame:
+            status = record[OUTPUT.ITEM_STATUS]
+            if status not in table:
+                table.append(status)
+    return table
+
+
+def _check_range(name, value, low, high):
+    if not low <= value <= high:
+        raise ValueError("{} {} is out of the range [{}, {}] of the binary battle log".format(
+            name, value, low, high))
+    return value
+
+
+def _to_fixed(coordinate):
+    return _check_range('Coordinate', int(round(coordinate * COORDINATE_SCALE)),
+                        INT32_MIN, INT32_MAX)
+
+
+def _from_fixed(value):
+    return value / COORDINATE_SCALE
+
+
+def _pack_record(record, status_codes):
+    x, y = record[OUTPUT.TILE_POSITION]
+    status_code = status_codes[record[OUTPUT.ITEM_STATUS]]
+    firing_point = record.get(OUTPUT.FIRING_POINT)
+    if firing_point is None:
+        fx = fy = 0
+    else:
+        status_code |= FLAG_FIRING_POINT
+        fx, fy = firing_point
+    return RECORD.pack(_check_range('Item id', record[OUTPUT.ITEM_ID], 0, UINT32_MAX),
+                       _to_fixed(x), _to_fixed(y),
+                       _check_range('Hit points percentage',
+                                    record[OUTPUT.HIT_POINTS_PERCENTAGE], 0, 255),
+                       status_code,
+                       _to_fixed(fx), _to_fixed(fy))
+
+
+def check_keyframe_interval(keyframe_interval):
+    """
+    The first frame is always a keyframe, so the interval is at least 1.
+    """
+    if isinstance(keyframe_interval, bool) or not isinstance(keyframe_interval, int) \
+            or keyframe_interval < 1:
+        raise ValueError("Keyframe interval should be a positive integer, got {!r}".format(
+            keyframe_interval))
+    return keyframe_interval
+
+
+def encode_battle_log(battle_log, keyframe_interval=KEYFRAME_INTERVAL):
+    """
+    Pack the battle log into the compact binary form.
+
+    :param battle_log: A dict with OUTPUT.INITIAL_CATEGORY, OUTPUT.FRAME_CATEGORY
+    and OUTPUT.RESULT_CATEGORY keys, as FightHandler collects it
+    :param keyframe_interval: every keyframe_interval-th frame is written with the full state
+    :return: bytes
+    """
+    check_keyframe_interval(keyframe_interval)
+    frames = battle_log[OUTPUT.FRAME_CATEGORY]
+    header = json.dumps({
+        OUTPUT.INITIAL_CATEGORY: battle_log[OUTPUT.INITIAL_CATEGORY],
+        OUTPUT.RESULT_CATEGORY: battle_log[OUTPUT.RESULT_CATEGORY]
+    }).encode('utf-8')
+    string_table = _build_string_table(frames)
+    _check_range('Number of statuses', len(string_table), 0, FLAG_FIRING_POINT - 1)
+    status_codes = {status: code for code, status in enumerate(string_table)}
+
+    chunks = [MAGIC, UINT32.pack(len(header)), header, UINT16.pack(len(string_table))]
+    for status in string_table:
+        encoded = status.encode('utf-8')
+        _check_range('Length of the status name', len(encoded), 0, 255)
+        chunks.append(UINT8.pack(len(encoded)) + encoded)
+    chunks.append(UINT32.pack(len(frames)))
+    offset = sum(map(len, chunks))
+
+    state = {}  # item id -> the last packed record, in order of appearance
+    index = []
+    for number, frame in enumerate(frames):
+        changed = []
+        for record in frame:
+            packed = _pack_record(record, status_codes)
+            item_id = record[OUTPUT.ITEM_ID]
+            if state.get(item_id) != packed:
+                state[item_id] = packed
+                changed.append(packed)
+        if number % keyframe_interval:
+            kind, records = DELTA, changed
+        else:
+            kind, records = KEYFRAME, list(state.values())
+            index.append(INDEX_ENTRY.pack(number, offset))
+        _check_range('Number of records in a frame', len(records), 0, 2 ** 16 - 1)
+        chunk = FRAME_HEADER.pack(kind, len(records)) + b''.join(records)
+        chunks.append(chunk)
+        offset += len(chunk)
+
+    chunks.append(UINT32.pack(len(index)))
+    chunks.extend(index)
+    chunks.append(UINT32.pack(offset))
+    return b''.join(chunks)
+
+
+class BattleLogReader(object):
+    """
+        Reader for a binary battle log.
+        Frames are parsed lazily, so a viewer can walk them one by one
+        or seek to any frame without building the whole OUTPUT structure.
+    """
+
+    def __init__(self, data):
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("Unknown battle log format")
+        self._data = memoryview(data)
+        offset = len(MAGIC)
+        header_length, = UINT32.unpack_from(self._data, offset)
+        offset += UINT32.size
+        header = json.loads(bytes(self._data[offset:offset + header_length]).decode('utf-8'))
+        offset += header_length
+        self.initial = header[OUTPUT.INITIAL_CATEGORY]
+        self.result = header[OUTPUT.RESULT_CATEGORY]
+
+        self.string_table = []
+        strings_count, = UINT16.unpack_from(self._data, offset)
+        offset += UINT16.size
+        for _ in range(strings_count):
+            length, = UINT8.unpack_from(self._data, offset)
+            offset += UINT8.size
+            self.string_table.append(bytes(self._data[offset:offset + length]).decode('utf-8'))
+            offset += length
+
+        self.frames_count, = UINT32.unpack_from(self._data, offset)
+
+        index_offset, = UINT32.unpack_from(self._data, len(self._data) - UINT32.size)
+        keyframes_count, = UINT32.unpack_from(self._data, index_offset)
+        self._keyframes = []
+        self._keyframe_offsets = []
+        for number in range(keyframes_count):
+            frame_number, frame_offset = INDEX_ENTRY.unpack_from(
+                self._data, index_offset + UINT32.size + number * INDEX_ENTRY.size)
+            self._keyframes.append(frame_number)
+            self._keyframe_offsets.append(frame_offset)
+
+    def _read_frame(self, offset, state):
+        """
+        Apply the frame at the offset to the state.
+
+        :return: the offset of the next frame
+        """
+        kind, records_count = FRAME_HEADER.unpack_from(self._data, offset)
+        offset += FRAME_HEADER.size
+        if kind == KEYFRAME:
+            state.clear()
+        for _ in range(records_count):
+            record = RECORD.unpack_from(self._data, offset)
+            state[record[0]] = record
+            offset += RECORD.size
+        return offset
+
+    def iter_frames(self, start=0):
+        """
+        Yield frames in the same form as FightHandler._get_battle_snapshot builds them.
+        A frame holds every item which is met before it, so for a log of FrameSampler
+        an item which is missed in a frame of the JSON log is in its last known state,
+        as a viewer shows it.
+
+        :param start: number of the first frame
+        """
+        if start >= self.frames_count:
+            return
+        position = bisect_right(self._keyframes, start) - 1
+        number, offset = self._keyframes[position], self._keyframe_offsets[position]
+        state = {}
+        while number < self.frames_count:
+            offset = self._read_frame(offset, state)
+            if number >= start:
+                yield [self._decode_record(record) for record in state.values()]
+            number += 1
+
+    def get_frame(self, number):
+        """
+        Rebuild a single frame by seeking to the nearest keyframe before it.
+        """
+        if not 0 <= number < self.frames_count:
+            raise IndexError("Frame {} is out of the log".format(number))
+        return next(self.iter_frames(number))
+
+    def _decode_record(self, record):
+        item_id, x, y, hit_points, status_code, fx, fy = record
+        item_info = {
+            OUTPUT.ITEM_ID: item_id,
+            OUTPUT.TILE_POSITION: [_from_fixed(x), _from_fixed(y)],
+            OUTPUT.HIT_POINTS_PERCENTAGE: hit_points,
+            OUTPUT.ITEM_STATUS: self.string_table[status_code & ~FLAG_FIRING_POINT]
+        }
+        if status_code & FLAG_FIRING_POINT:
+            item_info[OUTPUT.FIRING_POINT] = [_from_fixed(fx), _from_fixed(fy)]
+            # TODO LEGACY DEPRECATED
+            item_info[OUTPUT.FIRING_POINT_LEGACY] = item_info[OUTPUT.FIRING_POINT]
+        return item_info
+
+    def to_output(self):
+        """
+        Rebuild the battle log in the OUTPUT structure.
+        """
+        return {
+            OUTPUT.INITIAL_CATEGORY: self.initial,
+            OUTPUT.FRAME_CATEGORY: list(self.iter_frames()),
+            OUTPUT.RESULT_CATEGORY: self.result
+        }
+
+
+class FrameSampler(object):
+    """
+        Level of detail for the battle log frames.
+        A record of an item is kept in every step-th frame and in any frame where
+        the item status or hit points are changed or where the item attacks,
+        so the viewer does not lose any animated event.
+        A frame holds only kept records, a missed item keeps its last known state.
+    """
+
+    def __init__(self, step=1):
+        self.step = max(int(step), 1)
+        self.frame_number = 0
+        self._last_records = {}
+
+    def _is_record_needed(self, record):
+        last_record = self._last_records.get(record[OUTPUT.ITEM_ID])
+        return (last_record is None or
+                record[OUTPUT.ITEM_STATUS] == ACTION.ATTACK or
+                record[OUTPUT.ITEM_STATUS] != last_record[OUTPUT.ITEM_STATUS] or
+                record[OUTPUT.HIT_POINTS_PERCENTAGE] != last_record[OUTPUT.HIT_POINTS_PERCENTAGE])
+
+    def sample(self, frame):
+        """
+        Thin out the next frame of the battle.
+
+        :param frame: A list of item records as FightHandler._get_battle_snapshot builds them
+        :return: A list with records which should be logged
+        """
+        if self.step == 1 or not self.frame_number % self.step:
+            result = frame
+        else:
+            result = [record for record in frame if self._is_record_needed(record)]
+        for record in result:
+            self._last_records[record[OUTPUT.ITEM_ID]] = record
+        self.frame_number += 1
+        return result
+
+    def get_state(self):
+        return {'step': self.step, 'frame_number': self.frame_number,
+                'last_records': list(self._last_records.values())}
+
+    @classmethod
+    def from_state(cls, state):
+        sampler = cls(state['step'])
+        sampler.frame_number = state['frame_number']
+        sampler._last_records = {record[OUTPUT.ITEM_ID]: record
+                                 for record in state['last_records']}
+        return sampler
+
+
+def downsample_frames(frames, step):
+    """
+    Thin out frames of an already collected battle log.
+
+    :param frames: A list of frames from OUTPUT.FRAME_CATEGORY
+    :param step: Every step-th frame is kept in full
+    :return: A new list of frames
+    """
+    sampler = FrameSampler(step)
+    return [sampler.sample(frame) for frame in frames]
+
+
+def decode_battle_log(data):
+    """
+    Unpack a binary battle log into the OUTPUT structure.
+
+    :param data: bytes produced by encode_battle_log
+    :return: A dict in the same form as FightHandler.battle_log
+    """
+    return BattleLogReader(data).to_output()
+
+
+COMPRESSORS = {
+    LOG_COMPRESSION.ZLIB: (zlib.compress, zlib.decompress),
+    LOG_COMPRESSION.GZIP: (gzip.compress, gzip.decompress),
+}
+
+
+def dump_battle_log_json(battle_log):
+    """
+    The same as json.dumps(battle_log).encode('utf-8'), but frames are encoded one by one,
+    so the GIL is released between frames when it's called in a thread.
+    """
+    parts = []
+    for key, value in battle_log.items():
+        if key == OUTPUT.FRAME_CATEGORY:
+            encoded = '[' + ', '.join(json.dumps(frame) for frame in value) + ']'
+        else:
+            encoded = json.dumps(value)
+        parts.append(json.dumps(key) + ': ' + encoded)
+    return ('{' + ', '.join(parts) + '}').encode('utf-8')
+
+
+def pack_log_chunks(battle_log, log_format=LOG_FORMAT.JSON, compression=None,
+                    keyframe_interval=KEYFRAME_INTERVAL, chunk_size=CHUNK_SIZE):
+    """
+    Encode, compress and split the final battle log into messages for the editor.
+    It does not touch anything but the given log, so it can be run in a worker.
+
+    :param battle_log: A dict in the same form as FightHandler.battle_log
+    :param log_format: LOG_FORMAT.JSON or LOG_FORMAT.BINARY
+    :param compression: None or one of LOG_COMPRESSION
+    :param keyframe_interval: passed to encode_battle_log
+    :param chunk_size: max length of the data in one message
+    :return: A list of dicts, every one holds a base64 part of the log
+    """
+    if log_format == LOG_FORMAT.BINARY:
+        data = encode_battle_log(battle_log, keyframe_interval)
+    else:
+        data = dump_battle_log_json(battle_log)
+    if compression is not None:
+        compress, _ = COMPRESSORS[compression]
+        data = compress(data)
+    data = b64encode(data).decode('ascii')
+    parts = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)] or ['']
+    return [{
+        OUTPUT.LOG_FORMAT: log_format,
+        OUTPUT.LOG_COMPRESSION: compression,
+        OUTPUT.LOG_CHUNK: number,
+        OUTPUT.LOG_CHUNKS: len(parts),
+        OUTPUT.LOG_DATA: part
+    } for number, part in enumerate(parts)]
+
+
+def unpack_log_chunks(messages):
+    """
+    Rebuild the battle log from the messages of pack_log_chunks.
+
+    :param messages: all messages of one log, in any order
+    :return: A dict in the same form as FightHandler.battle_log
+    """
+    messages = sorted(messages, key=lambda message: message[OUTPUT.LOG_CHUNK])
+    if not messages or len(messages) != messages[0][OUTPUT.LOG_CHUNKS]:
+        raise ValueError("Not all chunks of the battle log are received")
+    data = b64decode(''.join(message[OUTPUT.LOG_DATA] for message in messages))
+    compression = messages[0][OUTPUT.LOG_COMPRESSION]
+    if compression is not None:
+        _, decompress = COMPRESSORS[compression]
+        data = decompress(data)
+    if messages[0][OUTPUT.LOG_FORMAT] == LOG_FORMAT.BINARY:
+        return decode_battle_log(data)
+    return json.loads(data.decode('utf-8'))
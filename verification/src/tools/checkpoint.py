@@ -0,0 +1,141 @@
+"""
+Checkpoints of a battle between frames, see FightHandler.get_checkpoint.
+
+A checkpoint is a JSON file, so it can be resumed in another process
+(INITIAL.CHECKPOINT) and it's easy to look into when a desync is bisected.
+Tuples become lists in JSON, owners of the data convert them back.
+
+Frames of the battle log are not in the checkpoint file, every checkpoint writes
+only the frames after the previous one to its frames file (a JSON frame per line)
+and has the list of frames files with the frames before it.
+So a checkpoint doesn't grow with the battle log.
+"""
+
+__all__ = ["CHECKPOINT_VERSION", "checkpoint_path", "frames_path", "DumpedCheckpoint",
+           "dump_checkpoint", "write_checkpoint", "save_checkpoint", "load_checkpoint",
+           "encode_random_state", "decode_random_state", "encode_floats", "decode_floats"]
+
+import json
+import os
+import tempfile
+from array import array
+from base64 import b64encode, b64decode
+from collections import namedtuple
+
+from .terms import OUTPUT
+
+CHECKPOINT_VERSION = 3
+
+# frame_files is a list of [name of a frames file, count of frames in it]
+DumpedCheckpoint = namedtuple('DumpedCheckpoint', ['frame', 'data', 'frames', 'frame_files'])
+
+
+def checkpoint_path(directory, frame):
+    return os.path.join(directory, 'checkpoint_{:06d}.json'.format(frame))
+
+
+def frames_path(directory, frame):
+    return os.path.join(directory, 'frames_{:06d}.jsonl'.format(frame))
+
+
+def dump_checkpoint(checkpoint, frame_files=()):
+    """
+    Encode the checkpoint for write_checkpoint, the checkpoint can be changed after it.
+
+    :param frame_files: frame_files of the previous DumpedCheckpoint of the battle,
+        the frames in them are not written again
+    :return: DumpedCheckpoint
+    """
+    battle_log = dict(checkpoint['battle_log'])
+    frames = battle_log.pop(OUTPUT.FRAME_CATEGORY)
+    saved = sum(count for _, count in frame_files)
+    name = os.path.basename(frames_path('', checkpoint['frame']))
+    frame_files = list(frame_files) + [[name, len(frames) - saved]]
+    data = json.dumps(dict(checkpoint, battle_log=battle_log, frame_files=frame_files))
+    new_frames = ''.join(json.dumps(frame) + '\n' for frame in frames[saved:])
+    return DumpedCheckpoint(checkpoint['frame'], data, new_frames, frame_files)
+
+
+def _write_atomically(path, text):
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(handle, 'w') as result_file:
+            result_file.write(text)
+        os.replace(temp_path, path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def write_checkpoint(directory, dumped):
+    """
+    Write the frames file and the checkpoint atomically, a reader never gets
+    a half written file. It doesn't touch the battle, so it can be run in a worker.
+
+    :param dumped: DumpedCheckpoint
+    :return: path of the checkpoint file
+    """
+    os.makedirs(directory, exist_ok=True)
+    _write_atomically(frames_path(directory, dumped.frame), dumped.frames)
+    path = checkpoint_path(directory, dumped.frame)
+    _write_atomically(path, dumped.data)
+    return path
+
+
+def save_checkpoint(directory, checkpoint):
+    """
+    Write the checkpoint with all its frames.
+
+    :return: path of the file
+    """
+    return write_checkpoint(directory, dump_checkpoint(checkpoint))
+
+
+def load_checkpoint(path):
+    """
+    Read the checkpoint and its frames files, they are in the directory of the checkpoint.
+
+    :return: A dict in the same form as FightHandler.get_checkpoint returns
+    """
+    with open(path) as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    if checkpoint.get('version') != CHECKPOINT_VERSION:
+        raise ValueError("Unknown version of the checkpoint {}".format(path))
+    frames = []
+    for name, count in checkpoint.pop('frame_files'):
+        with open(os.path.join(os.path.dirname(path), name)) as frames_file:
+            file_frames = [json.loads(line) for line in frames_file]
+        if len(file_frames) != count:
+            raise ValueError("The frames file {} doesn't match the checkpoint {}".format(
+                name, path))
+        frames.extend(file_frames)
+    checkpoint['battle_log'][OUTPUT.FRAME_CATEGORY] = frames
+    return checkpoint
+
+
+def encode_random_state(state):
+    """
+    :param state: random.getstate()
+    """
+    version, internal_state, gauss_next = state
+    return [version, list(internal_state), gauss_next]
+
+
+def decode_random_state(data):
+    """
+    :return: state for random.setstate
+    """
+    version, internal_state, gauss_next = data
+    return version, tuple(internal_state), gauss_next
+
+
+def encode_floats(values):
+    """
+    Floats as base64 of doubles, they are exact and much shorter than in JSON.
+    """
+    return b64encode(array('d', values).tobytes()).decode('ascii')
+
+
+def decode_floats(data):
+    return array('d', b64decode(data))
@@ -0,0 +1,63 @@
+__all__ = ["CoverageMap", "COVERAGE_OUTSIDE", "COVERAGE_INSIDE", "COVERAGE_BORDER"]
+
+COVERAGE_OUTSIDE = 0
+COVERAGE_INSIDE = 1
+COVERAGE_BORDER = 2
+# cells so close to the circle that float rounding matters are border ones
+EPSILON = 1e-9
+
+
+class CoverageMap(object):
+    """
+    Cells of a map around a static point within the radius.
+    A cell is inside if all its points are within the radius, outside if none of them is,
+    other cells are on the border and a point there must be checked by the distance.
+    """
+
+    def __init__(self, center, radius, map_size, scale):
+        """
+        :param center: coordinates of the static point
+        :param radius: max distance from the center
+        :param map_size: size of the map, the same as for the map grid
+        :param scale: number of cells per a map unit
+        """
+        self.scale = scale
+        self.height = int(map_size[0] * scale)
+        self.width = int(map_size[1] * scale)
+        self.cells = bytearray(self.height * self.width)
+        cx, cy = center
+
+        def axis_distances(cell, middle):
+            start, end = cell / scale, (cell + 1) / scale
+            near = max(start - middle, middle - end, 0)
+            far = max(abs(start - middle), abs(end - middle))
+            return near ** 2, far ** 2
+
+        inner = (radius - EPSILON) ** 2 if radius > EPSILON else -1
+        outer = (radius + EPSILON) ** 2
+        first_row = max(int((cx - radius) * scale) - 1, 0)
+        last_row = min(int((cx + radius) * scale) + 2, self.height)
+        first_column = max(int((cy - radius) * scale) - 1, 0)
+        last_column = min(int((cy + radius) * scale) + 2, self.width)
+        columns = [axis_distances(j, cy) for j in range(first_column, last_column)]
+        for i in range(first_row, last_row):
+            row_near, row_far = axis_distances(i, cx)
+            shift = i * self.width
+            for j, (column_near, column_far) in enumerate(columns, first_column):
+                if row_near + column_near > outer:
+                    continue
+                if row_far + column_far <= inner:
+                    self.cells[shift + j] = COVERAGE_INSIDE
+                else:
+                    self.cells[shift + j] = COVERAGE_BORDER
+
+    def lookup(self, point):
+        """
+        :param point: coordinates
+        :return: COVERAGE_INSIDE, COVERAGE_OUTSIDE or COVERAGE_BORDER for the cell
+            with the point. Points out of the map are on the border.
+        """
+        i, j = int(point[0] * self.scale), int(point[1] * self.scale)
+        if 0 <= i < self.height and 0 <= j < self.width and point[0] >= 0 and point[1] >= 0:
+            return self.cells[i * self.width + j]
+        return COVERAGE_BORDER
@@ -1,4 +1,4 @@
-__all__ = ["euclidean_distance", "manhattan_distance"]
+__all__ = ["euclidean_distance", "manhattan_distance", "segment_distance"]
 
 
 def euclidean_distance(point1, point2):
@@ -21,3 +21,21 @@ def manhattan_distance(point1, point2):
     :return: the distance as a float or an integer
     """
     return abs(point1[0] - point2[0]) + abs(point1[1] - point2[1])
+
+
+def segment_distance(point, start, end):
+    """
+    Calculate Euclidean distance from a point to the nearest point of a segment.
+
+    :param point: Coordinates of the point
+    :param start: Coordinates of the start of the segment
+    :param end: Coordinates of the end of the segment
+    :return: the distance as a float
+    """
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    length = dx ** 2 + dy ** 2
+    if not length:
+        return euclidean_distance(point, start)
+    part = ((point[0] - start[0]) * dx + (point[1] - start[1]) * dy) / length
+    part = min(max(part, 0), 1)
+    return euclidean_distance(point, (start[0] + part * dx, start[1] + part * dy))
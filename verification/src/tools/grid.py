@@ -1,10 +1,11 @@
-__all__ = ["fill_square", "find_route", "straighten_route", "grid_to_graph"]
+__all__ = ["fill_square", "square_cells", "find_route", "straighten_route", "grid_to_graph",
+           "plan_route", "plan_route_on_grid", "RouteSearch", "RouteGraph"]
 
 from heapq import heappop, heappush
 from .distances import euclidean_distance
 from itertools import product
 from fractions import Fraction
-from collections import defaultdict
+from array import array
 
 SQRT_2 = round(2 ** 0.5, 3)
 HEURISTIC = euclidean_distance
@@ -33,12 +34,19 @@ def fill_square(matrix: list, row: int, column: int, size: int, fill_element=1)
     :param fill_element: An element which will be inserted
     :return: The changed matrix
     """
+    for i, j in square_cells(matrix, row, column, size):
+        matrix[i][j] = fill_element
+    return matrix
+
+
+def square_cells(matrix: list, row: int, column: int, size: int) -> list:
+    """
+    Cells of the square area which are in the matrix, the same as for fill_square.
+    """
     row, column = round(row), round(column)
     height, width = len(matrix), len(matrix[0]) if matrix else 0
-    for i in range(max(row, 0), min(row + size, height)):
-        for j in range(max(column, 0), min(column + size, width)):
-            matrix[i][j] = fill_element
-    return matrix
+    return [(i, j) for i in range(max(row, 0), min(row + size, height))
+            for j in range(max(column, 0), min(column + size, width))]
 
 
 def grid_to_graph(grid):
@@ -46,33 +54,92 @@ def grid_to_graph(grid):
     Transform a grid of a map to the graph
 
     :param grid: A matrix of the map
-    :return: The graph as a dict where keys are tuples of coordinates and
-    values are a sequence of neighbours.
+    :return: RouteGraph, neighbours of every cell go in the same order
+        as they were in the former dict of tuples, so searches don't change.
     """
     height, width = len(grid), len(grid[0]) if grid else 0
-    graph = defaultdict(tuple)
+    offsets = array('I', [0])
+    targets = array('I')
+    costs = array('d')
+    add_target, add_cost = targets.append, costs.append
     for i, row in enumerate(grid):
+        up = grid[i - 1] if i > 0 else None
+        down = grid[i + 1] if i < height - 1 else None
+        shift = i * width
         for j, el in enumerate(row):
-            south_flag = east_flag = west_flag = False
-            if not el:
-                continue
-            if i < height - 1 and grid[i + 1][j]:
-                graph[(i, j)] += ((i + 1, j, 1),)
-                graph[(i + 1, j)] += ((i, j, 1),)
-                south_flag = True
-            if j < width - 1 and grid[i][j + 1]:
-                graph[(i, j)] += ((i, j + 1, 1),)
-                graph[(i, j + 1)] += ((i, j, 1),)
-                east_flag = True
-            if j > 0 and grid[i][j - 1]:
-                west_flag = True
-            if south_flag and east_flag and grid[i + 1][j + 1]:
-                graph[(i, j)] += ((i + 1, j + 1, SQRT_2),)
-                graph[(i + 1, j + 1)] += ((i, j, SQRT_2),)
-            if south_flag and west_flag and grid[i + 1][j - 1]:
-                graph[(i, j)] += ((i + 1, j - 1, SQRT_2),)
-                graph[(i + 1, j - 1)] += ((i, j, SQRT_2),)
-    return graph
+            if el:
+                west = j > 0 and row[j - 1]
+                east = j < width - 1 and row[j + 1]
+                if up is not None and up[j]:
+                    if west and up[j - 1]:
+                        add_target(shift - width + j - 1)
+                        add_cost(SQRT_2)
+                    add_target(shift - width + j)
+                    add_cost(1)
+                    if east and up[j + 1]:
+                        add_target(shift - width + j + 1)
+                        add_cost(SQRT_2)
+                if west:
+                    add_target(shift + j - 1)
+                    add_cost(1)
+                if down is not None and down[j]:
+                    add_target(shift + width + j)
+                    add_cost(1)
+                if east:
+                    add_target(shift + j + 1)
+                    add_cost(1)
+                if down is not None and down[j]:
+                    if east and down[j + 1]:
+                        add_target(shift + width + j + 1)
+                        add_cost(SQRT_2)
+                    if west and down[j - 1]:
+                        add_target(shift + width + j - 1)
+                        add_cost(SQRT_2)
+            offsets.append(len(targets))
+    return RouteGraph(height, width, offsets, targets, costs)
+
+
+class RouteGraph(object):
+    """
+    The route graph in the compressed sparse row form.
+    Cells are numbered row by row, edges of the cell "index" are
+    targets[offsets[index]:offsets[index + 1]] with costs of the same slice.
+    Arrays can be views of a memory-mapped file.
+    """
+
+    def __init__(self, height, width, offsets, targets, costs):
+        self.height = height
+        self.width = width
+        self.offsets = offsets
+        self.targets = targets
+        self.costs = costs
+
+    def index(self, cell):
+        """
+        :return: number of the cell or None if it's out of the grid
+        """
+        if 0 <= cell[0] < self.height and 0 <= cell[1] < self.width:
+            return cell[0] * self.width + cell[1]
+        return None
+
+    def __getitem__(self, cell):
+        """
+        Neighbours of the cell as (row, column, cost), like in the former dict graph.
+        """
+        index = self.index(cell)
+        if index is None:
+            return ()
+        return tuple(divmod(self.targets[k], self.width) + (self.costs[k],)
+                     for k in range(self.offsets[index], self.offsets[index + 1]))
+
+    @property
+    def edges_count(self):
+        return len(self.targets)
+
+    @property
+    def nbytes(self):
+        return sum(len(part) * part.itemsize
+                   for part in (self.offsets, self.targets, self.costs))
 
 
 def get_neighbours(grid: list, cell: tuple):
@@ -98,7 +165,7 @@ def find_possible_end(grid, goal):
     return result
 
 
-def find_route(grid, graph, start_cell, end_cell):
+def find_route(grid, graph, start_cell, end_cell, heuristic=HEURISTIC):
     """
     Find a route in a grid with A* search.
     If end cell are not available then search a path to near positions.
@@ -106,34 +173,136 @@ def find_route(grid, graph, start_cell, end_cell):
     :param grid: a matrix to search
     :param start_cell: start position
     :param end_cell: goal cell
+    :param heuristic: function(cell, end_cell) -> estimated distance
     :return: A route as a tuple of coordinates.
     """
-    heap = []
-    start_cell = tuple(start_cell)
-    end_cell = tuple(end_cell)
-    if not grid[end_cell[0]][end_cell[1]]:
-        goals = find_possible_end(grid, end_cell)
-    else:
-        goals = {tuple(end_cell)}
-    # priority, distance, path, cell
-    heappush(heap, (0, 0, (start_cell,), start_cell))
-    visited = set()
-    count = 0
-    while heap:
-        _, distance, path, current = heappop(heap)
-        count += 1
-        if current in visited:
-            continue
-        visited.add(current)
-        if current in goals:
-            return path
-        for nx, ny, cost in graph[current]:
-            neighbour = (nx, ny)
-            if neighbour in visited:
+    search = RouteSearch(grid, graph, start_cell, end_cell, heuristic)
+    search.step()
+    return search.route
+
+
+class RouteSearch(object):
+    """
+    A* search which can be stopped after a number of expanded cells
+    and continued later, for instance on the next frame.
+    """
+
+    def __init__(self, grid, graph, start_cell, end_cell, heuristic=HEURISTIC):
+        self.graph = graph
+        self.heuristic = heuristic
+        start_cell = tuple(start_cell)
+        self.end_cell = tuple(end_cell)
+        if not grid[end_cell[0]][end_cell[1]]:
+            self.goals = find_possible_end(grid, self.end_cell)
+        else:
+            self.goals = {self.end_cell}
+        # priority, distance, path, cell
+        self.heap = [(0, 0, (start_cell,), start_cell)]
+        self.visited = bytearray(graph.height * graph.width)
+        self.expanded = 0
+        self.finished = False
+        self.route = ()
+
+    def step(self, budget=None):
+        """
+        Expand cells until the route is found or the budget is spent.
+
+        :param budget: max number of cells to expand, without limit by default
+        :return: number of expanded cells
+        """
+        heap, visited, goals, end_cell = self.heap, self.visited, self.goals, self.end_cell
+        heuristic = self.heuristic
+        graph = self.graph
+        offsets, targets, costs, width = graph.offsets, graph.targets, graph.costs, graph.width
+        expanded = 0
+        while heap:
+            if budget is not None and expanded >= budget:
+                self.expanded += expanded
+                return expanded
+            _, distance, path, current = heappop(heap)
+            index = graph.index(current)
+            if index is not None:
+                if visited[index]:
+                    continue
+                visited[index] = 1
+            expanded += 1
+            if current in goals:
+                self.route = path
+                break
+            if index is None:
                 continue
-            priority = distance + HEURISTIC((nx, ny), end_cell)
-            heappush(heap, (priority, distance + cost, path + (neighbour,), neighbour))
-    return ()
+            for k in range(offsets[index], offsets[index + 1]):
+                target = targets[k]
+                if visited[target]:
+                    continue
+                neighbour = divmod(target, width)
+                priority = distance + heuristic(neighbour, end_cell)
+                heappush(heap, (priority, distance + costs[k], path + (neighbour,), neighbour))
+        self.finished = True
+        self.expanded += expanded
+        return expanded
+
+    def get_state(self):
+        """
+        JSON serializable state of the search to continue it in another process.
+        """
+        return {
+            'end_cell': self.end_cell,
+            'goals': sorted(self.goals),
+            'heap': self.heap,
+            'visited': self.visited.hex(),
+            'expanded': self.expanded,
+            'finished': self.finished,
+            'route': self.route
+        }
+
+    @classmethod
+    def from_state(cls, graph, state, heuristic=HEURISTIC):
+        """
+        :param graph: the graph of the same map as the search was started for
+        :param state: see get_state
+        """
+        search = cls.__new__(cls)
+        search.graph = graph
+        search.heuristic = heuristic
+        search.end_cell = tuple(state['end_cell'])
+        search.goals = set(map(tuple, state['goals']))
+        # the order of the list is kept, so it's still a heap
+        search.heap = [(priority, distance, tuple(map(tuple, path)), tuple(cell))
+                       for priority, distance, path, cell in state['heap']]
+        search.visited = bytearray.fromhex(state['visited'])
+        search.expanded = state['expanded']
+        search.finished = state['finished']
+        search.route = tuple(map(tuple, state['route']))
+        return search
+
+
+def plan_route(grid, graph, start_cell, end_cell, heuristic=HEURISTIC):
+    """
+    Find a route with A* search and straighten it.
+
+    :return: A straightened route as a tuple of cells, it's empty if there is no way.
+    """
+    route = find_route(grid, graph, start_cell, end_cell, heuristic)
+    if not route:
+        return ()
+    return tuple(straighten_route(grid, route))
+
+
+# map hash -> graph of the last map, is used by plan_route_on_grid in a worker process
+_graphs = {}
+
+
+def plan_route_on_grid(grid, map_hash, start_cell, end_cell):
+    """
+    plan_route for a worker process which doesn't have the graph.
+    The graph is built once for a map hash.
+    """
+    graph = _graphs.get(map_hash)
+    if graph is None:
+        _graphs.clear()
+        graph = _graphs[map_hash] = grid_to_graph(grid)
+    return plan_route(grid, graph, start_cell, end_cell)
 
 
 def straighten_route(grid, route):
@@ -0,0 +1,190 @@
+__all__ = ["Landmarks"]
+
+from heapq import heappop, heappush
+from .distances import euclidean_distance
+
+INF = float("inf")
+
+
+def _dijkstra(graph, table, heap):
+    """
+    Decrease distances of the table from cell indexes of the heap.
+    """
+    offsets, targets, costs = graph.offsets, graph.targets, graph.costs
+    while heap:
+        distance, index = heappop(heap)
+        if distance > table[index]:
+            continue
+        for k in range(offsets[index], offsets[index + 1]):
+            target = targets[k]
+            if distance + costs[k] < table[target]:
+                table[target] = distance + costs[k]
+                heappush(heap, (distance + costs[k], target))
+    return table
+
+
+class Landmarks(object):
+    """
+    ALT heuristic: distances from a few landmark cells to all cells of the map.
+    By the triangle inequality |d(L, goal) - d(L, cell)| is a lower bound
+    of the way from the cell to the goal, it's much tighter than the straight line
+    when buildings are between them.
+
+    Tables are valid while the map only opens up (dead buildings),
+    opened cells are collected and tables are updated on the next search.
+
+    The goal of a unit which attacks a building is a blocked cell,
+    the search ends at open cells around it (see find_possible_end),
+    so bounds are taken to the nearest of these cells.
+    """
+
+    def __init__(self, graph, height, width, count):
+        """
+        :param graph: RouteGraph, see grid_to_graph
+        :param height: number of rows of the grid
+        :param width: number of columns of the grid
+        :param count: number of landmarks
+        """
+        self.graph = graph
+        self.width = width
+        self.size = height * width
+        self.cells = []
+        self.tables = []
+        self._opened = set()
+        # goal -> the straight line spread and landmark bounds of its open cells
+        self._goal_bounds = {}
+        self.choose_landmarks(count)
+
+    @classmethod
+    def from_tables(cls, graph, height, width, cells, tables):
+        """
+        Landmarks with tables which were built before, for instance for a cached map.
+        Tables can be read-only sequences, they are copied to lists before updates.
+        """
+        landmarks = cls(graph, height, width, 0)
+        landmarks.cells = list(cells)
+        landmarks.tables = list(tables)
+        return landmarks
+
+    def build_table(self, landmark):
+        index = landmark[0] * self.width + landmark[1]
+        table = [INF] * self.size
+        table[index] = 0
+        return _dijkstra(self.graph, table, [(0, index)])
+
+    def choose_landmarks(self, count):
+        """
+        Every next landmark is the farthest cell from the chosen ones.
+        """
+        offsets = self.graph.offsets
+        first = next((index for index in range(self.size) if offsets[index] < offsets[index + 1]),
+                     None)
+        if first is None or not count:
+            return
+        # the farthest cell from any cell is a good start
+        nearest = self.build_table(divmod(first, self.width))
+        for _ in range(count):
+            index = max(range(self.size),
+                        key=lambda i: nearest[i] if nearest[i] != INF else -1)
+            if nearest[index] in (0, INF):
+                break
+            landmark = divmod(index, self.width)
+            table = self.build_table(landmark)
+            if not self.cells:
+                nearest = table[:]
+            else:
+                nearest = [min(a, b) for a, b in zip(nearest, table)]
+            self.cells.append(landmark)
+            self.tables.append(table)
+
+    def open_cells(self, graph, cells):
+        """
+        :param graph: the new route graph
+        :param cells: cells which become passable
+        """
+        self.graph = graph
+        self._opened.update(cells)
+        self._goal_bounds = {}
+
+    def update(self):
+        """
+        Distances only decrease when cells are opened, so they are relaxed
+        from cells which got new edges: opened cells and their neighbours.
+        """
+        if not self._opened:
+            return
+        graph, width = self.graph, self.width
+        offsets, targets, costs = graph.offsets, graph.targets, graph.costs
+        changed = {cell[0] * width + cell[1] for cell in self._opened}
+        for index in tuple(changed):
+            changed.update(targets[offsets[index]:offsets[index + 1]])
+        self._opened = set()
+        self._goal_bounds = {}
+        for number, table in enumerate(self.tables):
+            if not isinstance(table, list):
+                table = self.tables[number] = table.tolist()
+            heap = []
+            for index in changed:
+                for k in range(offsets[index], offsets[index + 1]):
+                    distance = table[targets[k]] + costs[k]
+                    if distance < table[index]:
+                        table[index] = distance
+                if table[index] != INF:
+                    heappush(heap, (table[index], index))
+            _dijkstra(graph, table, heap)
+
+    def _is_open(self, cell):
+        index = self.graph.index(cell)
+        return index is not None and self.graph.offsets[index] < self.graph.offsets[index + 1]
+
+    def goal_cells(self, goal):
+        """
+        The goal itself if it's open, otherwise the nearest open cells around it,
+        as find_possible_end finds them on the grid.
+        """
+        if self._is_open(goal):
+            return [goal]
+        for radius in range(1, max(self.graph.height, self.graph.width)):
+            cells = [(goal[0] + dx, goal[1] + dy)
+                     for dx in range(-radius, radius + 1) for dy in range(-radius, radius + 1)]
+            cells = [cell for cell in cells if self._is_open(cell)]
+            if cells:
+                return cells
+        return []
+
+    def _get_goal_bounds(self, goal):
+        """
+        For every landmark its table with the nearest and the farthest goal cell:
+        the way from a cell to any goal cell is at least
+        d(L, cell) - farthest and nearest - d(L, cell).
+        A landmark which doesn't reach all goal cells gives no bound and is skipped.
+        """
+        cells = self.goal_cells(goal)
+        spread = max((euclidean_distance(cell, goal) for cell in cells), default=0)
+        indexes = [cell[0] * self.width + cell[1] for cell in cells]
+        bounds = []
+        for table in self.tables:
+            distances = [table[index] for index in indexes]
+            if distances and INF not in distances:
+                bounds.append((table, min(distances), max(distances)))
+        return spread, bounds
+
+    def heuristic(self, cell, goal):
+        """
+        The largest of the landmark bounds and the straight line to the goal cells.
+        """
+        goal_bounds = self._goal_bounds.get(goal)
+        if goal_bounds is None:
+            goal_bounds = self._goal_bounds[goal] = self._get_goal_bounds(goal)
+        spread, bounds = goal_bounds
+        result = euclidean_distance(cell, goal) - spread
+        cell_index = cell[0] * self.width + cell[1]
+        for table, nearest, farthest in bounds:
+            to_cell = table[cell_index]
+            if to_cell == INF:
+                continue
+            if to_cell - farthest > result:
+                result = to_cell - farthest
+            if nearest - to_cell > result:
+                result = nearest - to_cell
+        return result
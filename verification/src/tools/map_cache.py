@@ -0,0 +1,132 @@
+"""
+On-disk cache of map precomputation for the same static map elements.
+
+Layout of a cache file (numbers are in the native byte order,
+the cache is local to the machine):
+
+    HEADER                      magic, grid height, grid width, landmarks count, edges count
+    grid                        uint8 for every cell, row by row
+    padding                     zero bytes up to a multiple of 8
+    graph offsets               uint32 for every cell and one more, see RouteGraph
+    graph targets               uint32 for every edge
+    padding                     zero bytes up to a multiple of 8
+    graph costs                 float64 for every edge
+    landmark cells              uint32 row and column for every landmark
+    landmark tables             float64 for every cell, a table for every landmark
+
+Files are memory-mapped when it's possible, arrays of the graph are views of the file
+and so are landmark tables until they are changed.
+"""
+
+__all__ = ["MapCache", "map_key"]
+
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+from array import array
+from struct import Struct
+
+from .grid import RouteGraph
+
+MAGIC = b'CMC\x02'
+HEADER = Struct('=4sIIII')
+ALIGNMENT = 8
+
+
+def map_key(elements, map_size, scale, landmarks=0):
+    """
+    :param elements: (coordinates, size) of items which are on the grid
+    :param map_size: size of the map
+    :param scale: number of cells per a map unit
+    :param landmarks: number of landmarks
+    :return: hex digest which is used as a file name
+    """
+    data = json.dumps([sorted(map(list, elements)), list(map_size), scale, landmarks])
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class MapCache(object):
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.map')
+
+    def load(self, key):
+        """
+        :return: dict with "grid" (list of rows), "graph" (RouteGraph),
+            "landmark_cells" and "landmark_tables" or None if there is no valid cache
+        """
+        try:
+            with open(self.path(key), 'rb') as cache_file:
+                try:
+                    data = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+                except (ValueError, OSError):
+                    data = cache_file.read()
+        except OSError:
+            return None
+        if len(data) < HEADER.size:
+            return None
+        magic, height, width, count, edges = HEADER.unpack_from(data, 0)
+        size = height * width
+        offsets_offset = _aligned(HEADER.size + size)
+        targets_offset = offsets_offset + (size + 1) * 4
+        costs_offset = _aligned(targets_offset + edges * 4)
+        cells_offset = costs_offset + edges * 8
+        tables_offset = cells_offset + count * 8
+        if magic != MAGIC or len(data) != tables_offset + count * size * 8:
+            return None
+
+        view = memoryview(data)
+        grid = [list(view[HEADER.size + i * width:HEADER.size + (i + 1) * width])
+                for i in range(height)]
+        graph = RouteGraph(height, width,
+                           view[offsets_offset:targets_offset].cast('I'),
+                           view[targets_offset:targets_offset + edges * 4].cast('I'),
+                           view[costs_offset:cells_offset].cast('d'))
+        cells = view[cells_offset:tables_offset].cast('I').tolist()
+        tables = view[tables_offset:].cast('d')
+        return {
+            'grid': grid,
+            'graph': graph,
+            'landmark_cells': list(zip(cells[::2], cells[1::2])),
+            'landmark_tables': [tables[i * size:(i + 1) * size] for i in range(count)]
+        }
+
+    def save(self, key, grid, graph, landmark_cells=(), landmark_tables=()):
+        """
+        Write the cache atomically, so a concurrent battle reads the old file or the new one.
+        """
+        height, width = len(grid), len(grid[0]) if grid else 0
+        cells = array('I', [number for cell in landmark_cells for number in cell])
+        tables = array('d')
+        for table in landmark_tables:
+            tables.extend(table)
+        content = bytearray(HEADER.pack(MAGIC, height, width, len(landmark_cells),
+                                        graph.edges_count))
+        for row in grid:
+            content.extend(bytes(row))
+        content.extend(bytes(_aligned(len(content)) - len(content)))
+        content.extend(array('I', graph.offsets).tobytes())
+        content.extend(array('I', graph.targets).tobytes())
+        content.extend(bytes(_aligned(len(content)) - len(content)))
+        content.extend(array('d', graph.costs).tobytes())
+        content.extend(cells.tobytes())
+        content.extend(tables.tobytes())
+
+        os.makedirs(self.directory, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(handle, 'wb') as cache_file:
+                cache_file.write(content)
+            os.replace(temp_path, self.path(key))
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
@@ -0,0 +1,140 @@
+__all__ = ["TimerWheel", "ItemScheduler"]
+
+from collections import defaultdict
+from heapq import heappop, heappush
+
+
+class TimerWheel(object):
+    """
+    Hashed timer wheel with a slot for every frame of a round,
+    timers which are farther than a round stay in their slot for the next rounds.
+    """
+
+    def __init__(self, size=64):
+        self.size = size
+        self.slots = [{} for _ in range(size)]  # item id -> frame
+        self.timers = {}  # item id -> frame
+
+    def __len__(self):
+        return len(self.timers)
+
+    def schedule(self, item_id, frame):
+        self.cancel(item_id)
+        self.slots[frame % self.size][item_id] = frame
+        self.timers[item_id] = frame
+
+    def cancel(self, item_id):
+        frame = self.timers.pop(item_id, None)
+        if frame is not None:
+            del self.slots[frame % self.size][item_id]
+
+    def pop_due(self, frame):
+        """
+        :return: ids of items with timers on the frame
+        """
+        slot = self.slots[frame % self.size]
+        due = [item_id for item_id, timer_frame in slot.items() if timer_frame <= frame]
+        for item_id in due:
+            del slot[item_id]
+            del self.timers[item_id]
+        return due
+
+
+class ItemScheduler(object):
+    """
+    Items which have something to do on a frame.
+    Idle items are parked till they are woken, charging shooters sleep
+    till the frame of the shot or till their target is changed.
+    """
+
+    def __init__(self, wheel_size=64):
+        self.active = set()
+        self.wheel = TimerWheel(wheel_size)
+        self.watchers = defaultdict(set)  # target id -> ids of items sleeping on it
+        self.targets = {}  # id of a sleeping item -> target id
+        self.since = {}  # item id -> the last frame it was run before it fell asleep
+        self.stats = {'frames': 0, 'runs': 0, 'max_frame': 0}
+        self._queue = None  # heap of item ids to run on the current frame
+        self._current = None  # id of the item which is being run
+
+    def wake(self, item_id):
+        target_id = self.targets.pop(item_id, None)
+        if target_id is not None:
+            self.watchers[target_id].discard(item_id)
+            self.wheel.cancel(item_id)
+        if item_id in self.active:
+            return
+        self.active.add(item_id)
+        # items after the current one are run on the same frame as it was before
+        if self._queue is not None and item_id > self._current:
+            heappush(self._queue, item_id)
+
+    def wake_watchers(self, target_id):
+        for item_id in self.watchers.pop(target_id, ()):
+            self.wake(item_id)
+
+    def park(self, item_id):
+        self.active.discard(item_id)
+
+    def sleep(self, item_id, frame, wake_frame, target_id):
+        """
+        :param frame: the current frame
+        :param wake_frame: the frame to run the item again
+        :param target_id: the item is woken earlier when the target is changed
+        """
+        self.active.discard(item_id)
+        self.since[item_id] = frame
+        self.targets[item_id] = target_id
+        self.watchers[target_id].add(item_id)
+        self.wheel.schedule(item_id, wake_frame)
+
+    def get_state(self):
+        """
+        JSON serializable state, sleeping items keep their timers and targets
+        """
+        return {
+            'active': sorted(self.active),
+            'since': sorted(self.since.items()),
+            'targets': sorted(self.targets.items()),
+            'timers': sorted(self.wheel.timers.items()),
+            'stats': self.stats
+        }
+
+    def set_state(self, state):
+        self.active = set(state['active'])
+        self.since = dict(state['since'])
+        self.targets = dict(state['targets'])
+        self.watchers = defaultdict(set)
+        for item_id, target_id in self.targets.items():
+            self.watchers[target_id].add(item_id)
+        self.wheel = TimerWheel(self.wheel.size)
+        for item_id, frame in state['timers']:
+            self.wheel.schedule(item_id, frame)
+        self.stats = dict(state['stats'])
+
+    def skipped_frames(self, item_id, frame):
+        """
+        :return: number of frames the item slept through before the frame
+        """
+        since = self.since.pop(item_id, None)
+        return 0 if since is None else frame - since - 1
+
+    def run(self, frame):
+        """
+        Yield ids of items to run on the frame in the order of ids (the order of creation),
+        items which are woken by earlier items on the frame are yielded too.
+        """
+        for item_id in self.wheel.pop_due(frame):
+            self.wake(item_id)
+        self._queue = sorted(self.active)
+        runs = 0
+        try:
+            while self._queue:
+                self._current = heappop(self._queue)
+                runs += 1
+                yield self._current
+        finally:
+            self._queue = self._current = None
+            self.stats['frames'] += 1
+            self.stats['runs'] += runs
+            self.stats['max_frame'] = max(self.stats['max_frame'], runs)
@@ -1,5 +1,6 @@
 __all__ = ['ROLE', 'PARTY', 'ATTRIBUTE', 'ACTION', 'STATUS',
-           'INITIAL', 'PLAYER', 'DEFEAT_REASON', 'OUTPUT']
+           'INITIAL', 'PLAYER', 'DEFEAT_REASON', 'OUTPUT', 'LOG_FORMAT', 'LOG_COMPRESSION',
+           'FILTER']
 
 
 class PARTY():
@@ -22,6 +23,16 @@ class ROLE():
     PLAYER_STATIC = (BUILDING, CENTER, TOWER)
 
 
+class FILTER():
+    FIELDS = 'fields'
+    COORDINATES = 'coordinates'
+    RADIUS = 'radius'
+    HIT_POINTS_BELOW = 'hit_points_below'
+    TYPES = 'types'
+    ORDER_BY_DISTANCE = 'order_by_distance'
+    LIMIT = 'limit'
+
+
 class ATTRIBUTE():
     ID = 'id'
     PLAYER_ID = 'player_id'
@@ -65,6 +76,22 @@ class INITIAL():
     IS_STREAM = 'is_stream'
     REWARDS = 'rewards'
     CODES = 'codes'
+    LOG_FORMAT = 'log_format'
+    LOG_KEYFRAME_INTERVAL = 'log_keyframe_interval'
+    LOG_FRAME_STEP = 'log_frame_step'
+    LOG_COMPRESSION = 'log_compression'
+    COLLECT_STATS = 'collect_stats'
+    MULTIPLEX_ENVIRONMENTS = 'multiplex_environments'
+    HEADLESS = 'headless'
+    ASYNC_ROUTES = 'async_routes'
+    ROUTE_BUDGET = 'route_budget'
+    ROUTE_BUDGET_PER_UNIT = 'route_budget_per_unit'
+    ROUTE_LANDMARKS = 'route_landmarks'
+    MAP_CACHE_DIR = 'map_cache_dir'
+    SLEEPING_ITEMS = 'sleeping_items'
+    CHECKPOINT = 'checkpoint'
+    CHECKPOINT_INTERVAL = 'checkpoint_interval'
+    CHECKPOINT_DIR = 'checkpoint_dir'
 
 
 class RESOURCE():
@@ -104,3 +131,19 @@ class OUTPUT():
     REWARDS = 'rewards'
     WINNER = 'winner'
     CASUALTIES = "casualties"
+    LOG_FORMAT = 'format'
+    LOG_DATA = 'data'
+    LOG_COMPRESSION = 'compression'
+    LOG_CHUNK = 'chunk'
+    LOG_CHUNKS = 'chunks'
+    STATS = 'stats'
+
+
+class LOG_FORMAT():
+    JSON = 'json'
+    BINARY = 'binary'
+
+
+class LOG_COMPRESSION():
+    ZLIB = 'zlib'
+    GZIP = 'gzip'
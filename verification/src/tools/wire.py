@@ -0,0 +1,235 @@
+"""
+Encodings of messages between the referee and environments.
+JSON is always available and is used until a compact format is negotiated.
+A compact format uses length-prefixed frames: FRAME_HEADER with the payload size
+and the payload.
+
+STRUCT is a binary form of JSON values which needs only the standard library:
+every value is a type tag and the value packed with struct (big-endian).
+A list of dicts with the same keys, as item lists of selects are, is packed
+as a table where the keys are written once.
+MSGPACK is used when msgpack is installed on both sides.
+STRUCT halves the bytes of JSON, but it is pure Python and costs more CPU
+to encode and decode than the C json module, see benchmarks/wire.py.
+So it is not offered by default, an environment opts in by offering it.
+
+The codec is kept in two identical copies: src/tools/wire.py of the referee
+and envs/python_3/battle/wire.py of the environment,
+tests/test_wire.py checks that they don't differ.
+"""
+
+__all__ = ["JSON", "STRUCT", "MSGPACK", "FORMATS", "SUPPORTED_FORMATS", "FRAME_HEADER",
+           "choose_format", "encode", "decode", "pack_frame"]
+
+import json
+from struct import Struct
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = 'json'
+STRUCT = 'struct'
+MSGPACK = 'msgpack'
+FRAME_HEADER = Struct('>I')
+
+_NONE, _TRUE, _FALSE = b'N', b'T', b'F'
+_INT8 = Struct('>cb')
+_INT32 = Struct('>ci')
+_INT64 = Struct('>cq')
+_FLOAT = Struct('>cd')
+_SIZED = Struct('>cI')  # tag and length of a str, list, dict or table
+_LENGTH = Struct('>I')
+_SHORT_LENGTH = Struct('>B')
+_LONG_STR = 0xff  # a short length which means the real one is _LENGTH after it
+_STR, _LIST, _DICT, _TABLE = b's', b'l', b'd', b't'
+_INT8_TAG, _INT32_TAG, _INT64_TAG, _FLOAT_TAG = b'b', b'i', b'q', b'f'
+
+
+def _key(key):
+    # keys become strings as in JSON
+    return key if isinstance(key, str) else json.dumps(key)
+
+
+def _pack_str(value, out):
+    # most strings are short names, their length takes a byte
+    encoded = value.encode('utf-8')
+    if len(encoded) < _LONG_STR:
+        out += _SHORT_LENGTH.pack(len(encoded))
+    else:
+        out += _SHORT_LENGTH.pack(_LONG_STR)
+        out += _LENGTH.pack(len(encoded))
+    out += encoded
+
+
+def _pack_value(value, out):
+    if value is None:
+        out += _NONE
+    elif value is True:
+        out += _TRUE
+    elif value is False:
+        out += _FALSE
+    elif isinstance(value, int):
+        if -2 ** 7 <= value < 2 ** 7:
+            out += _INT8.pack(_INT8_TAG, value)
+        elif -2 ** 31 <= value < 2 ** 31:
+            out += _INT32.pack(_INT32_TAG, value)
+        elif -2 ** 63 <= value < 2 ** 63:
+            out += _INT64.pack(_INT64_TAG, value)
+        else:
+            raise ValueError("Integer {} is too big for the struct wire format".format(value))
+    elif isinstance(value, float):
+        out += _FLOAT.pack(_FLOAT_TAG, value)
+    elif isinstance(value, str):
+        out += _STR
+        _pack_str(value, out)
+    elif isinstance(value, dict):
+        out += _SIZED.pack(_DICT, len(value))
+        for key, item in value.items():
+            _pack_str(_key(key), out)
+            _pack_value(item, out)
+    elif isinstance(value, (list, tuple)):
+        keys = _table_keys(value)
+        if keys is None:
+            out += _SIZED.pack(_LIST, len(value))
+            for item in value:
+                _pack_value(item, out)
+        else:
+            out += _SIZED.pack(_TABLE, len(keys))
+            for key in keys:
+                _pack_str(_key(key), out)
+            out += _LENGTH.pack(len(value))
+            for row in value:
+                for item in row.values():
+                    _pack_value(item, out)
+    else:
+        raise TypeError("Object of type {} is not serializable".format(type(value).__name__))
+
+
+def _table_keys(values):
+    """
+    :return: keys of the table if the list has a few dicts with the same keys or None
+    """
+    if len(values) < 2 or not isinstance(values[0], dict):
+        return None
+    keys = list(values[0])
+    for value in values:
+        if not isinstance(value, dict) or list(value) != keys:
+            return None
+    return keys
+
+
+def _unpack_str(payload, offset):
+    length = payload[offset]
+    offset += 1
+    if length == _LONG_STR:
+        length, = _LENGTH.unpack_from(payload, offset)
+        offset += _LENGTH.size
+    return str(payload[offset:offset + length], 'utf-8'), offset + length
+
+
+def _unpack_value(payload, offset):
+    """
+    :return: the value and the offset after it
+    """
+    tag = payload[offset:offset + 1]
+    if tag == _NONE:
+        return None, offset + 1
+    if tag == _TRUE:
+        return True, offset + 1
+    if tag == _FALSE:
+        return False, offset + 1
+    if tag == _INT8_TAG:
+        return _INT8.unpack_from(payload, offset)[1], offset + _INT8.size
+    if tag == _INT32_TAG:
+        return _INT32.unpack_from(payload, offset)[1], offset + _INT32.size
+    if tag == _INT64_TAG:
+        return _INT64.unpack_from(payload, offset)[1], offset + _INT64.size
+    if tag == _FLOAT_TAG:
+        return _FLOAT.unpack_from(payload, offset)[1], offset + _FLOAT.size
+    if tag == _STR:
+        return _unpack_str(payload, offset + 1)
+    if tag not in (_LIST, _DICT, _TABLE):
+        raise ValueError("Unknown tag {!r} at {} of the struct payload".format(tag, offset))
+    _, count = _SIZED.unpack_from(payload, offset)
+    offset += _SIZED.size
+    if tag == _LIST:
+        result = []
+        for _ in range(count):
+            item, offset = _unpack_value(payload, offset)
+            result.append(item)
+        return result, offset
+    if tag == _DICT:
+        result = {}
+        for _ in range(count):
+            key, offset = _unpack_str(payload, offset)
+            result[key], offset = _unpack_value(payload, offset)
+        return result, offset
+    keys = []
+    for _ in range(count):
+        key, offset = _unpack_str(payload, offset)
+        keys.append(key)
+    rows_count, = _LENGTH.unpack_from(payload, offset)
+    offset += _LENGTH.size
+    result = []
+    for _ in range(rows_count):
+        row = {}
+        for key in keys:
+            row[key], offset = _unpack_value(payload, offset)
+        result.append(row)
+    return result, offset
+
+
+def _encode_struct(data):
+    out = bytearray()
+    _pack_value(data, out)
+    return bytes(out)
+
+
+def _decode_struct(payload):
+    value, offset = _unpack_value(payload, 0)
+    if offset != len(payload):
+        raise ValueError("Extra data after the struct payload")
+    return value
+
+
+CODECS = {
+    JSON: (lambda data: json.dumps(data, separators=(',', ':')).encode('utf-8'),
+           lambda payload: json.loads(payload.decode('utf-8'))),
+    STRUCT: (_encode_struct, _decode_struct),
+}
+if msgpack is not None:
+    CODECS[MSGPACK] = (lambda data: msgpack.packb(data, use_bin_type=True),
+                       lambda payload: msgpack.unpackb(payload, raw=False))
+
+# supported formats, the most preferable first
+SUPPORTED_FORMATS = [name for name in (MSGPACK, STRUCT, JSON) if name in CODECS]
+# formats which an environment offers by default, STRUCT is slower than JSON
+FORMATS = [name for name in SUPPORTED_FORMATS if name != STRUCT]
+
+
+def choose_format(formats):
+    """
+    Choose the most preferable format which both sides support.
+
+    :param formats: formats which the other side offers
+    :return: name of the format
+    """
+    for name in SUPPORTED_FORMATS:
+        if name in formats:
+            return name
+    return JSON
+
+
+def encode(data, name):
+    return CODECS[name][0](data)
+
+
+def decode(payload, name):
+    return CODECS[name][1](payload)
+
+
+def pack_frame(data, name):
+    payload = encode(data, name)
+    return FRAME_HEADER.pack(len(payload)) + payload
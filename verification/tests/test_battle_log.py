@@ -0,0 +1,172 @@
+"""
+The binary battle log of a battle with a downsampled (FrameSampler) log
+and of a whole battle of the referee.
+"""
+import json
+import os
+import sys
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from tools import (OUTPUT, ACTION, LOG_FORMAT, LOG_COMPRESSION, FrameSampler, BattleLogReader,
+                   encode_battle_log, pack_log_chunks, unpack_log_chunks)
+from tools.battle_log import COORDINATE_SCALE
+
+try:
+    import battles
+    import referee
+except ImportError:  # checkio_referee is installed only with the referee
+    battles = None
+
+
+def record(item_id, position, hit_points, status, firing_point=None):
+    result = {
+        OUTPUT.ITEM_ID: item_id,
+        OUTPUT.TILE_POSITION: position,
+        OUTPUT.HIT_POINTS_PERCENTAGE: hit_points,
+        OUTPUT.ITEM_STATUS: status
+    }
+    if firing_point is not None:
+        result[OUTPUT.FIRING_POINT] = firing_point
+        result[OUTPUT.FIRING_POINT_LEGACY] = firing_point
+    return result
+
+
+def battle_frames(count):
+    """
+    A unit walks to a tower, stands and attacks it from the 12th frame,
+    the tower loses hit points, a building stays idle.
+    """
+    for number in range(count):
+        attacking = number >= 12
+        yield [
+            record(1, [0.5 + min(number, 10) * 0.25, 3.0], 100,
+                   ACTION.ATTACK if attacking else 'move',
+                   [5.0, 3.0] if attacking else None),
+            record(2, [5.0, 3.0], 100 - max(number - 12, 0) * 10, 'idle'),
+            record(3, [8.0, 8.0], 100, 'idle'),
+        ]
+
+
+def fill_missed_records(frames):
+    """
+    A viewer shows a missed item of a sampled frame in its last known state.
+    """
+    known = {}
+    for frame in frames:
+        for item_record in frame:
+            known[item_record[OUTPUT.ITEM_ID]] = item_record
+        yield list(known.values())
+
+
+class SampledBinaryLogTest(unittest.TestCase):
+
+    def setUp(self):
+        sampler = FrameSampler(5)
+        self.frames = [sampler.sample(frame) for frame in battle_frames(20)]
+        self.reader = BattleLogReader(encode_battle_log({
+            OUTPUT.INITIAL_CATEGORY: {},
+            OUTPUT.FRAME_CATEGORY: self.frames,
+            OUTPUT.RESULT_CATEGORY: {}
+        }, keyframe_interval=4))
+
+    def test_frames_are_sampled(self):
+        self.assertEqual([len(frame) for frame in self.frames[:6]], [3, 0, 0, 0, 0, 3])
+        # the attacking unit and the damaged tower
+        self.assertEqual([item_record[OUTPUT.ITEM_ID] for item_record in self.frames[13]], [1, 2])
+
+    def test_iter_frames_fills_missed_records(self):
+        self.assertEqual(list(self.reader.iter_frames()),
+                         list(fill_missed_records(self.frames)))
+
+    def test_seek_into_sampled_frames(self):
+        expected = list(fill_missed_records(self.frames))
+        for number in range(len(self.frames)):
+            self.assertEqual(self.reader.get_frame(number), expected[number])
+
+
+def quantized(frames):
+    """
+    Frames as they come back from the binary log with COORDINATE_SCALE steps.
+    """
+    def point(coordinates):
+        return [round(value * COORDINATE_SCALE) / COORDINATE_SCALE for value in coordinates]
+
+    for frame in frames:
+        result = []
+        for item_record in frame:
+            item_record = dict(item_record, **{
+                OUTPUT.TILE_POSITION: point(item_record[OUTPUT.TILE_POSITION])})
+            if OUTPUT.FIRING_POINT in item_record:
+                item_record[OUTPUT.FIRING_POINT] = point(item_record[OUTPUT.FIRING_POINT])
+                item_record[OUTPUT.FIRING_POINT_LEGACY] = item_record[OUTPUT.FIRING_POINT]
+            result.append(item_record)
+        yield result
+
+
+class QuantizationTest(unittest.TestCase):
+
+    def test_coordinates_are_rounded_to_the_scale(self):
+        frames = [[record(1, [1.23456, -0.004], 50, 'move')],
+                  [record(1, [1.235, 2.5], 50, ACTION.ATTACK, [7.0049, 0.125])]]
+        reader = BattleLogReader(encode_battle_log({
+            OUTPUT.INITIAL_CATEGORY: {}, OUTPUT.FRAME_CATEGORY: frames,
+            OUTPUT.RESULT_CATEGORY: {}}))
+        self.assertEqual(list(reader.iter_frames()), list(quantized(frames)))
+        self.assertEqual(reader.get_frame(1)[0][OUTPUT.FIRING_POINT], [7.0, 0.12])
+
+    def test_coordinates_out_of_the_range(self):
+        frames = [[record(1, [2 ** 31 / COORDINATE_SCALE, 0], 50, 'move')]]
+        self.assertRaises(ValueError, encode_battle_log, {
+            OUTPUT.INITIAL_CATEGORY: {}, OUTPUT.FRAME_CATEGORY: frames,
+            OUTPUT.RESULT_CATEGORY: {}})
+
+
+@unittest.skipIf(battles is None, "checkio_referee is not installed")
+class BattleRoundTripTest(unittest.TestCase):
+    KEYFRAME_INTERVAL = 16
+
+    @classmethod
+    def setUpClass(cls):
+        referee.FightItem.ITEMS_COUNT = referee.CraftItem.ITEMS_COUNT = 0
+        battle_info = battles.generate_battle_info(seed=1, **battles.SCENARIOS['small'])
+        handler, _ = battles.run_battle(battle_info, {}, seed=1)
+        # the log as the editor gets it in JSON
+        cls.battle_log = json.loads(json.dumps(handler.battle_log))
+        cls.frames = list(fill_missed_records(quantized(cls.battle_log[OUTPUT.FRAME_CATEGORY])))
+
+    def setUp(self):
+        self.reader = BattleLogReader(encode_battle_log(self.battle_log, self.KEYFRAME_INTERVAL))
+
+    def test_whole_battle(self):
+        frames_count = len(self.frames)
+        self.assertGreater(frames_count, self.KEYFRAME_INTERVAL * 4)
+        self.assertEqual(self.reader.frames_count, frames_count)
+        self.assertEqual(self.reader._keyframes,
+                         list(range(0, frames_count, self.KEYFRAME_INTERVAL)))
+        output = self.reader.to_output()
+        self.assertEqual(output[OUTPUT.INITIAL_CATEGORY],
+                         self.battle_log[OUTPUT.INITIAL_CATEGORY])
+        self.assertEqual(output[OUTPUT.RESULT_CATEGORY], self.battle_log[OUTPUT.RESULT_CATEGORY])
+        self.assertEqual(output[OUTPUT.FRAME_CATEGORY], self.frames)
+
+    def test_seek_to_every_frame(self):
+        for number in range(len(self.frames)):
+            self.assertEqual(self.reader.get_frame(number), self.frames[number], number)
+        self.assertEqual(list(self.reader.iter_frames(self.KEYFRAME_INTERVAL + 3)),
+                         self.frames[self.KEYFRAME_INTERVAL + 3:])
+        self.assertRaises(IndexError, self.reader.get_frame, len(self.frames))
+
+    def test_chunks_of_the_binary_log(self):
+        messages = pack_log_chunks(self.battle_log, LOG_FORMAT.BINARY, LOG_COMPRESSION.ZLIB,
+                                   self.KEYFRAME_INTERVAL, chunk_size=1024)
+        self.assertGreater(len(messages), 1)
+        output = unpack_log_chunks(list(reversed(messages)))
+        self.assertEqual(output[OUTPUT.FRAME_CATEGORY], self.frames)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+"""
+Checkpoints of a battle: files with only new frames and a resumed battle
+which ends the same way as the uninterrupted one.
+"""
+import copy
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from tools import (OUTPUT, INITIAL, CHECKPOINT_VERSION, checkpoint_path, frames_path,
+                   dump_checkpoint, write_checkpoint, save_checkpoint, load_checkpoint)
+
+try:
+    from tornado.ioloop import IOLoop
+    import battles
+    import referee
+except ImportError:  # checkio_referee is installed only with the referee
+    battles = None
+
+
+def battle_log(frames_count):
+    return {
+        OUTPUT.INITIAL_CATEGORY: {OUTPUT.UNITS: []},
+        OUTPUT.FRAME_CATEGORY: [[{OUTPUT.ITEM_ID: number}] for number in range(frames_count)]
+    }
+
+
+class CheckpointFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def checkpoint(self, frame, log):
+        return {'version': CHECKPOINT_VERSION, 'frame': frame, 'battle_log': log}
+
+    def read_frames(self, frame):
+        with open(frames_path(self.directory, frame)) as frames_file:
+            return [json.loads(line) for line in frames_file]
+
+    def test_only_new_frames_are_written(self):
+        log = battle_log(3)
+        first = dump_checkpoint(self.checkpoint(3, log))
+        write_checkpoint(self.directory, first)
+        log[OUTPUT.FRAME_CATEGORY].extend([[{OUTPUT.ITEM_ID: 3}], [{OUTPUT.ITEM_ID: 4}]])
+        second = dump_checkpoint(self.checkpoint(5, log), first.frame_files)
+        path = write_checkpoint(self.directory, second)
+
+        self.assertEqual(len(self.read_frames(3)), 3)
+        self.assertEqual(self.read_frames(5), [[{OUTPUT.ITEM_ID: 3}], [{OUTPUT.ITEM_ID: 4}]])
+        with open(path) as checkpoint_file:
+            self.assertNotIn(OUTPUT.FRAME_CATEGORY, json.load(checkpoint_file)['battle_log'])
+        self.assertEqual(load_checkpoint(path)['battle_log'], battle_log(5))
+
+    def test_checkpoint_is_not_changed_by_the_battle_after_dump(self):
+        log = battle_log(2)
+        dumped = dump_checkpoint(self.checkpoint(2, log))
+        log[OUTPUT.FRAME_CATEGORY].append([])
+        log[OUTPUT.INITIAL_CATEGORY][OUTPUT.UNITS].append({})
+        self.assertEqual(load_checkpoint(write_checkpoint(self.directory, dumped))['battle_log'],
+                         battle_log(2))
+
+    def test_missed_frames_file(self):
+        path = save_checkpoint(self.directory, self.checkpoint(2, battle_log(2)))
+        os.remove(frames_path(self.directory, 2))
+        self.assertRaises(OSError, load_checkpoint, path)
+
+
+if battles is not None:
+    class CheckpointFightHandler(battles.BenchmarkFightHandler):
+        """
+        Bots are the code of items, they are kept with every checkpoint
+        and come back on resume as if the code continued.
+        """
+        bot_states = {}  # frame -> states of bots
+
+        def save_checkpoint(self):
+            super().save_checkpoint()
+            self.bot_states[self.current_frame] = [
+                (type(bot), bot.item.id,
+                 {key: callback.__name__ for key, callback in bot.callbacks.items()},
+                 copy.deepcopy(bot.events))
+                for bot in self.bots]
+
+        def restore_checkpoint(self, checkpoint):
+            super().restore_checkpoint(checkpoint)
+            for bot_class, item_id, callbacks, events in self.bot_states[self.current_frame]:
+                item = self.fighters[item_id]
+                bot = item._env = bot_class(item)
+                bot.callbacks = {key: getattr(bot, name) for key, name in callbacks.items()}
+                bot.events = copy.deepcopy(events)
+                self.bots.append(bot)
+
+
+@unittest.skipIf(battles is None, "checkio_referee is not installed")
+class ResumedBattleTest(unittest.TestCase):
+    INTERVAL = 40
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        referee.FightItem.ITEMS_COUNT = referee.CraftItem.ITEMS_COUNT = 0
+        self.battle_info = battles.generate_battle_info(seed=1, **battles.SCENARIOS['small'])
+        self.battle_info.update({INITIAL.HEADLESS: True, INITIAL.IS_STREAM: False,
+                                 INITIAL.SLEEPING_ITEMS: True})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_battle(self, initial, start_bots=True):
+        random.seed(1)
+        handler = CheckpointFightHandler(json.loads(json.dumps(dict(self.battle_info,
+                                                                    **initial))))
+        handler.start()
+        if start_bots:
+            handler.start_bots()
+        IOLoop.current().start()
+        # pending checkpoints are written
+        referee.FightHandler.shutdown_executors()
+        self.assertIsNone(referee.FightHandler.CHECKPOINT_EXECUTOR)
+        return handler
+
+    def test_resumed_battle_ends_the_same_way(self):
+        whole = self.run_battle({INITIAL.CHECKPOINT_INTERVAL: self.INTERVAL,
+                                 INITIAL.CHECKPOINT_DIR: self.directory})
+        self.assertGreater(whole.current_frame, self.INTERVAL * 3)
+        frame = self.INTERVAL * 2
+        for number in (1, 2):
+            with open(frames_path(self.directory, self.INTERVAL * number)) as frames_file:
+                self.assertEqual(len(frames_file.readlines()), self.INTERVAL)
+
+        resumed = self.run_battle({INITIAL.CHECKPOINT: checkpoint_path(self.directory, frame)},
+                                  start_bots=False)
+        self.assertEqual(resumed.current_frame, whole.current_frame)
+        # tuples of the log become lists in the checkpoint, the editor gets JSON anyway
+        self.assertEqual(json.loads(json.dumps(resumed.battle_log)),
+                         json.loads(json.dumps(whole.battle_log)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Coverage maps of static shooters answer as the euclidean check of the firing range.
+"""
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from tools import CoverageMap, COVERAGE_INSIDE, COVERAGE_OUTSIDE, COVERAGE_BORDER
+from tools.distances import euclidean_distance
+
+MAP_SIZE = (40, 40)
+SCALE = 2
+
+
+def is_in_range(coverage, center, radius, point):
+    """
+    The check of the referee: the map first, the distance for border cells.
+    """
+    found = coverage.lookup(point)
+    if found != COVERAGE_BORDER:
+        return found == COVERAGE_INSIDE
+    return euclidean_distance(point, center) <= radius
+
+
+def grid_points(step):
+    count = int(MAP_SIZE[0] / step)
+    return [(row * step, column * step) for row in range(count + 1)
+            for column in range(count + 1)]
+
+
+def edge_points(center, radius, count=360):
+    """
+    Points on the circle of the range and a bit inside and outside of it.
+    """
+    for number in range(count):
+        angle = 2 * math.pi * number / count
+        for distance in (radius, radius - 1e-7, radius + 1e-7):
+            yield (center[0] + distance * math.cos(angle),
+                   center[1] + distance * math.sin(angle))
+
+
+class CoverageMapTest(unittest.TestCase):
+
+    def check_range(self, center, radius):
+        coverage = CoverageMap(center, radius, MAP_SIZE, SCALE)
+        points = grid_points(0.25) + list(edge_points(center, radius))
+        for point in points:
+            distance = euclidean_distance(point, center)
+            found = coverage.lookup(point)
+            if found == COVERAGE_INSIDE:
+                self.assertLessEqual(distance, radius, point)
+            elif found == COVERAGE_OUTSIDE:
+                self.assertGreater(distance, radius, point)
+            self.assertEqual(is_in_range(coverage, center, radius, point), distance <= radius,
+                             point)
+        return coverage
+
+    def test_tower_range(self):
+        coverage = self.check_range((20, 20), 8.5)
+        # most of cells are answered without the distance
+        border = coverage.cells.count(COVERAGE_BORDER)
+        self.assertGreater(coverage.cells.count(COVERAGE_INSIDE), border)
+
+    def test_center_off_the_cells(self):
+        self.check_range((13.3, 27.85), 6.25)
+
+    def test_range_over_the_edge_of_the_map(self):
+        self.check_range((2, 38.5), 5)
+
+    def test_zero_range(self):
+        coverage = self.check_range((10, 10), 0)
+        self.assertEqual(coverage.cells.count(COVERAGE_INSIDE), 0)
+
+    def test_points_out_of_the_map_are_on_the_border(self):
+        coverage = CoverageMap((1, 1), 3, MAP_SIZE, SCALE)
+        for point in ((-0.1, 1), (1, -0.1), (MAP_SIZE[0], 1), (1, MAP_SIZE[1] + 5)):
+            self.assertEqual(coverage.lookup(point), COVERAGE_BORDER)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+"""
+Route graphs of grids of maps and searches on them.
+"""
+import json
+import os
+import random
+import sys
+import unittest
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from tools import fill_square, grid_to_graph, RouteSearch
+from tools.grid import SQRT_2
+
+SIZE = 40
+
+
+def random_grid(seed, obstacles=0.2):
+    """
+    A map with square obstacles of random sizes.
+    """
+    generator = random.Random(seed)
+    grid = [[1] * SIZE for _ in range(SIZE)]
+    for _ in range(int(SIZE * SIZE * obstacles / 4)):
+        fill_square(grid, generator.randrange(SIZE), generator.randrange(SIZE),
+                    generator.randint(1, 3), 0)
+    return grid
+
+
+def dict_graph(grid):
+    """
+    The graph as a dict of neighbours how grid_to_graph built it before RouteGraph.
+    """
+    height, width = len(grid), len(grid[0]) if grid else 0
+    graph = defaultdict(tuple)
+    for i, row in enumerate(grid):
+        for j, el in enumerate(row):
+            south_flag = east_flag = west_flag = False
+            if not el:
+                continue
+            if i < height - 1 and grid[i + 1][j]:
+                graph[(i, j)] += ((i + 1, j, 1),)
+                graph[(i + 1, j)] += ((i, j, 1),)
+                south_flag = True
+            if j < width - 1 and grid[i][j + 1]:
+                graph[(i, j)] += ((i, j + 1, 1),)
+                graph[(i, j + 1)] += ((i, j, 1),)
+                east_flag = True
+            if j > 0 and grid[i][j - 1]:
+                west_flag = True
+            if south_flag and east_flag and grid[i + 1][j + 1]:
+                graph[(i, j)] += ((i + 1, j + 1, SQRT_2),)
+                graph[(i + 1, j + 1)] += ((i, j, SQRT_2),)
+            if south_flag and west_flag and grid[i + 1][j - 1]:
+                graph[(i, j)] += ((i + 1, j - 1, SQRT_2),)
+                graph[(i + 1, j - 1)] += ((i, j, SQRT_2),)
+    return graph
+
+
+def open_cell(grid, generator):
+    while True:
+        cell = (generator.randrange(SIZE), generator.randrange(SIZE))
+        if grid[cell[0]][cell[1]]:
+            return cell
+
+
+class RouteGraphTest(unittest.TestCase):
+
+    def test_neighbours_are_the_same_as_in_the_dict_graph(self):
+        for seed in range(10):
+            grid = random_grid(seed, obstacles=0.4)
+            graph = grid_to_graph(grid)
+            expected = dict_graph(grid)
+            for row in range(-1, SIZE + 1):
+                for column in range(-1, SIZE + 1):
+                    # the order matters, searches go the same way
+                    self.assertEqual(graph[(row, column)], expected[(row, column)],
+                                     (row, column))
+            self.assertEqual(graph.edges_count,
+                             sum(len(neighbours) for neighbours in expected.values()))
+
+    def test_empty_and_narrow_grids(self):
+        for grid in ([], [[1]], [[1, 1, 0, 1]], [[1], [1], [0]]):
+            graph = grid_to_graph(grid)
+            expected = dict_graph(grid)
+            for row in range(len(grid)):
+                for column in range(len(grid[0])):
+                    self.assertEqual(graph[(row, column)], expected[(row, column)])
+
+
+class RouteSearchTest(unittest.TestCase):
+
+    def searches(self, count=20):
+        generator = random.Random(1)
+        for seed in range(count):
+            grid = random_grid(seed)
+            graph = grid_to_graph(grid)
+            # a goal can be a closed cell, the search goes to the nearest open ones
+            yield grid, graph, open_cell(grid, generator), (generator.randrange(SIZE),
+                                                            generator.randrange(SIZE))
+
+    def test_budget_does_not_change_the_route(self):
+        split_searches = 0
+        for grid, graph, start, goal in self.searches():
+            whole = RouteSearch(grid, graph, start, goal)
+            whole.step()
+            split = RouteSearch(grid, graph, start, goal)
+            steps = 0
+            while not split.finished:
+                self.assertLessEqual(split.step(7), 7)
+                steps += 1
+            split_searches += steps > 1
+            self.assertEqual(split.route, whole.route)
+            self.assertEqual(split.expanded, whole.expanded)
+        self.assertGreater(split_searches, 15)
+
+    def test_search_is_continued_from_the_state(self):
+        for grid, graph, start, goal in self.searches(5):
+            whole = RouteSearch(grid, graph, start, goal)
+            whole.step()
+            search = RouteSearch(grid, graph, start, goal)
+            while not search.finished:
+                search.step(11)
+                # the state goes to another process as JSON
+                state = json.loads(json.dumps(search.get_state()))
+                search = RouteSearch.from_state(graph, state)
+            self.assertEqual(search.route, whole.route)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+ALT heuristic of route searches on a map with walls.
+"""
+import os
+import sys
+import unittest
+from heapq import heappop, heappush
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from tools import fill_square, grid_to_graph, Landmarks, RouteSearch
+from tools.distances import euclidean_distance
+from tools.grid import find_possible_end
+
+SIZE = 30
+
+
+def walled_grid():
+    """
+    Two walls with gaps at the opposite ends and a building behind them.
+    """
+    grid = [[1] * SIZE for _ in range(SIZE)]
+    fill_square(grid, 0, 8, 1, 0)
+    for row in range(SIZE - 3):
+        grid[row][8] = 0
+        grid[SIZE - 1 - row][18] = 0
+    fill_square(grid, 12, 23, 4, 0)
+    return grid
+
+
+def distances_to(graph, cells):
+    """
+    Real lengths of ways from every cell to the nearest of the cells.
+    """
+    result = {}
+    heap = [(0, tuple(cell)) for cell in cells]
+    while heap:
+        distance, cell = heappop(heap)
+        if cell in result:
+            continue
+        result[cell] = distance
+        for row, column, cost in graph[cell]:
+            if (row, column) not in result:
+                heappush(heap, (distance + cost, (row, column)))
+    return result
+
+
+class LandmarksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.grid = walled_grid()
+        self.graph = grid_to_graph(self.grid)
+        self.landmarks = Landmarks(self.graph, SIZE, SIZE, 4)
+
+    def check_goal(self, goal, goals):
+        real = distances_to(self.graph, goals)
+        better = 0
+        for cell, distance in real.items():
+            estimate = self.landmarks.heuristic(cell, goal)
+            # SQRT_2 of diagonal edges is rounded down a bit
+            self.assertLessEqual(estimate, distance + 0.01, cell)
+            if estimate > euclidean_distance(cell, goal) + 1:
+                better += 1
+        self.assertGreater(better, len(real) // 4)
+
+    def test_admissible_and_tighter_for_an_open_goal(self):
+        self.check_goal((14, 4), [(14, 4)])
+
+    def test_admissible_and_tighter_for_a_building(self):
+        goal = (13, 24)
+        goals = find_possible_end(self.grid, goal)
+        self.assertEqual(set(self.landmarks.goal_cells(goal)), goals)
+        self.check_goal(goal, goals)
+
+    def test_search_expands_fewer_cells(self):
+        start, goal = (2, 2), (13, 24)
+        plain = RouteSearch(self.grid, self.graph, start, goal)
+        plain.step()
+        alt = RouteSearch(self.grid, self.graph, start, goal, self.landmarks.heuristic)
+        alt.step()
+        self.assertTrue(alt.route)
+        self.assertIn(alt.route[-1], find_possible_end(self.grid, goal))
+        self.assertLess(alt.expanded, plain.expanded)
+
+    def test_bounds_follow_opened_cells(self):
+        goal = (13, 24)
+        self.landmarks.heuristic((2, 2), goal)
+        fill_square(self.grid, 12, 23, 4, 1)
+        graph = grid_to_graph(self.grid)
+        self.landmarks.open_cells(graph, [(row, column) for row in range(12, 16)
+                                          for column in range(23, 27)])
+        self.landmarks.update()
+        self.assertEqual(self.landmarks.goal_cells(goal), [goal])
+        self.graph = graph
+        self.check_goal(goal, [goal])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+"""
+The on-disk cache of map precomputation.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from tools import fill_square, grid_to_graph, Landmarks, MapCache, map_key
+from tools.map_cache import HEADER
+
+SIZE = 20
+SCALE = 2
+MAP_SIZE = (10, 10)
+ELEMENTS = [([3, 4], 2), ([7.5, 2.5], 1)]
+
+
+def build_grid():
+    grid = [[1] * SIZE for _ in range(SIZE)]
+    for coordinates, size in ELEMENTS:
+        fill_square(grid, int(coordinates[0] * SCALE) - size // 2,
+                    int(coordinates[1] * SCALE) - size // 2, size * SCALE, 0)
+    return grid
+
+
+def graph_edges(graph):
+    return [graph[(row, column)] for row in range(graph.height) for column in range(graph.width)]
+
+
+class MapCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = MapCache(self.directory)
+        self.key = map_key(ELEMENTS, MAP_SIZE, SCALE, 2)
+        self.grid = build_grid()
+        self.graph = grid_to_graph(self.grid)
+        self.landmarks = Landmarks(self.graph, SIZE, SIZE, 2)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def save(self):
+        self.cache.save(self.key, self.grid, self.graph, self.landmarks.cells,
+                        self.landmarks.tables)
+
+    def test_round_trip(self):
+        self.save()
+        loaded = self.cache.load(self.key)
+        self.assertEqual(loaded['grid'], self.grid)
+        self.assertEqual(graph_edges(loaded['graph']), graph_edges(self.graph))
+        self.assertEqual(loaded['landmark_cells'], list(map(tuple, self.landmarks.cells)))
+        self.assertEqual([list(table) for table in loaded['landmark_tables']],
+                         [list(table) for table in self.landmarks.tables])
+
+    def test_key_follows_the_map(self):
+        self.assertEqual(map_key(list(reversed(ELEMENTS)), MAP_SIZE, SCALE, 2), self.key)
+        self.save()
+        # the cache of the map before a building was destroyed is not used
+        for other in (map_key(ELEMENTS[:1], MAP_SIZE, SCALE, 2),
+                      map_key(ELEMENTS, (10, 12), SCALE, 2),
+                      map_key(ELEMENTS, MAP_SIZE, 1, 2),
+                      map_key(ELEMENTS, MAP_SIZE, SCALE, 0)):
+            self.assertNotEqual(other, self.key)
+            self.assertIsNone(self.cache.load(other))
+
+    def test_missed_file_is_a_miss(self):
+        self.assertIsNone(self.cache.load(self.key))
+
+    def test_corrupt_file_is_a_miss(self):
+        self.save()
+        path = self.cache.path(self.key)
+        with open(path, 'rb') as cache_file:
+            content = cache_file.read()
+        for corrupt in (content[:HEADER.size - 1], content[:-8], content + b'\0'):
+            with open(path, 'wb') as cache_file:
+                cache_file.write(corrupt)
+            self.assertIsNone(self.cache.load(self.key))
+
+    def test_file_of_another_version_is_a_miss(self):
+        self.save()
+        path = self.cache.path(self.key)
+        with open(path, 'r+b') as cache_file:
+            cache_file.write(b'CMC\x01')
+        self.assertIsNone(self.cache.load(self.key))
+
+
+if __name__ == '__main__':
+    unittest.main()
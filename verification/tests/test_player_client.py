@@ -0,0 +1,183 @@
+"""
+The client of envs/python_3 against the real RefereeClient of checkio_executor_python,
+the referee side is a plain socket which is driven by the test.
+"""
+import json
+import os
+import socket
+import sys
+import unittest
+from select import select
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'envs',
+                                'python_3'))
+
+try:
+    import main
+except ImportError:  # checkio_executor_python is installed only in the environment image
+    main = None
+
+
+@unittest.skipIf(main is None, "checkio_executor_python is not installed")
+class PlayerRefereeClientTest(unittest.TestCase):
+
+    def setUp(self):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        self.client = main.PlayerRefereeClient(listener.getsockname()[1])
+        self.referee, _ = listener.accept()
+        listener.close()
+        self.referee.settimeout(5)
+        self.runner = main.PlayerRefereeRunner()
+        self.client.set_runner(self.runner)
+        self.runner.set_client(self.client)
+        self.client.wire_format = main.wire.JSON
+        self._received = b''
+
+    def tearDown(self):
+        self.referee.close()
+        self.client._client.close()
+
+    def send(self, *messages):
+        self.referee.sendall(b''.join(json.dumps(message).encode() + b'\0'
+                                      for message in messages))
+
+    def receive(self):
+        while b'\0' not in self._received:
+            self._received += self.referee.recv(4096)
+        message, self._received = self._received.split(b'\0', 1)
+        return json.loads(message.decode())
+
+    def assert_nothing_received(self):
+        self.referee.setblocking(False)
+        try:
+            self.assertRaises(BlockingIOError, self.referee.recv, 1)
+        finally:
+            self.referee.settimeout(5)
+
+    def test_set_action_without_confirmation(self):
+        self.assertIsNone(self.client.set_action('attack', {'id': 3}, confirm=False))
+        request = self.receive()
+        self.assertEqual(request['method'], 'set_action')
+        self.assertFalse(request['confirm'])
+
+    def test_pipelined_request_is_confirmed_later(self):
+        self.assertIsNone(self.client.set_action('attack', {'id': 3}, wait=False))
+        self.assertEqual(self.receive()['method'], 'set_action')
+        self.send({'status': 200}, {'status': 200, 'data': [{'id': 1}]})
+        self.assertEqual(self.client.select([{'field': 'my_info'}]), [{'id': 1}])
+        self.assertEqual(self.receive()['method'], 'select')
+        self.assertEqual(self.client._unconfirmed, {None: 0})
+
+    def test_run_in_context_result_is_not_waited(self):
+        self.client.events_call.put({'action': 'run_in_context', 'item_id': 7,
+                                     'code': 'x = 1'})
+        self.send({'status': 200, 'data': [{'id': 1}]})
+        self.assertEqual(self.client.select([{'field': 'my_info'}]), [{'id': 1}])
+        result = self.receive()
+        self.assertEqual((result['status'], result['item_id']), ('success', 7))
+        self.assertEqual(self.receive()['method'], 'select')
+        self.assert_nothing_received()
+
+    def test_items_of_multiplexed_environment_have_own_globals(self):
+        for item_id in (7, 8):
+            self.runner.action_run_in_context({'item_id': item_id,
+                                               'code': 'item = {}'.format(item_id)})
+        self.runner.action_run_in_context({'item_id': 7, 'code': 'seen = item'})
+        self.assertEqual(self.runner.globals['seen'], 7)
+        self.runner.switch_context(8)
+        self.assertNotIn('seen', self.runner.globals)
+        self.assertEqual(self.client.context_id, 8)
+
+    def test_events_of_idle_multiplexed_environment_are_acknowledged(self):
+        received = []
+        for item_id in (7, 8):
+            self.runner.action_run_in_context({'item_id': item_id,
+                                               'code': 'item = {}'.format(item_id)})
+            self.runner.subscribe(('death', item_id), lambda data: received.append(
+                (self.runner.globals['item'], data)))
+        events = {'action': 'events', 'events': [
+            {'item_id': 7, 'lookup_key': ['death', 7], 'data': 'first'},
+            {'item_id': 8, 'lookup_key': ['death', 8], 'data': 'second'}]}
+        next_message = {'action': 'run_in_context', 'item_id': 7, 'code': 'x = 1'}
+        self.send(next_message)
+        # one step of ClientLoop while the process is idle
+        self.assertEqual(self.client.request(self.runner.execute(events)), next_message)
+        self.assertEqual(received, [(7, 'first'), (8, 'second')])
+        ack = self.receive()
+        self.assertEqual(ack['item_id'], 8)
+        self.assertNotIn('method', ack)
+
+    def test_poll_applies_buffered_world_states(self):
+        # both states come in one packet, the second one stays in the buffer of the client
+        self.send({'action': 'world_state', 'full': True, 'frame': 1,
+                   'items': [{'id': 1}, {'id': 2}], 'removed': []},
+                  {'action': 'world_state', 'full': False, 'frame': 2,
+                   'items': [{'id': 3}], 'removed': [1]})
+        select([self.client.socket], [], [], 5)
+        self.client.poll()
+        self.assertEqual(self.client.world_frame, 2)
+        self.assertEqual(sorted(self.client.world), [2, 3])
+        self.client.poll()  # nothing is received, it doesn't block
+        self.assertEqual(self.client.world_frame, 2)
+
+    def test_world_older_than_the_last_event_is_not_used(self):
+        main.commander.Client.set_client(self.client)
+        commander = main.commander.Client.__new__(main.commander.Client)
+        commander._initial_info = {'id': 5, 'player_id': 1}
+        self.client.apply_world_state({'full': True, 'frame': 1, 'removed': [],
+                                       'items': [{'id': 3}, {'id': 4}]})
+        self.runner.action_events({'events': [{'lookup_key': ['death', 3], 'frame': 2,
+                                               'data': {'id': 3}}]})
+        # the referee is asked
+        self.assertIs(commander._local_select({'field': 'item_info', 'data': {'id': 4}}),
+                      main.commander._NOT_LOCAL)
+        # the state of the frame of the event is received
+        self.client.apply_world_state({'full': False, 'frame': 2, 'items': [], 'removed': [3]})
+        self.assertEqual(commander.ask_item_info(4), {'id': 4})
+        self.assert_nothing_received()
+
+    def test_action_errors_are_polled(self):
+        main.commander.Client.set_client(self.client)
+        commander = main.commander.Client.__new__(main.commander.Client)
+        commander._initial_info = {'id': 5, 'player_id': 1}
+        commander.set_async_actions()
+        commander.attack_item(3)
+        self.assertEqual(self.receive()['method'], 'set_action')
+        self.send({'action': 'action_error', 'item_id': 5, 'name': 'attack',
+                   'data': {'id': 3}, 'error': 'The enemy is dead'})
+        select([self.client.socket], [], [], 5)
+        errors = commander.ask_action_errors()
+        self.assertEqual([error['error'] for error in errors], ['The enemy is dead'])
+        self.assertEqual(self.client.action_errors, [])
+
+    def test_wire_format_is_switched_after_the_answer(self):
+        self.client.wire_format = None
+        wire = main.wire
+        # the answer and the next frames come in one packet
+        self.referee.sendall(
+            json.dumps({'status': 200, 'format': wire.STRUCT}).encode() + b'\0' +
+            wire.pack_frame({'action': 'world_state', 'full': True, 'frame': 1,
+                             'items': [{'id': 1}], 'removed': []}, wire.STRUCT) +
+            wire.pack_frame({'status': 200, 'data': [{'id': 1}]}, wire.STRUCT))
+        self.assertEqual(self.client.select([{'field': 'my_info'}]), [{'id': 1}])
+        self.assertEqual(self.client.wire_format, wire.STRUCT)
+        self.assertEqual(self.client.world, {1: {'id': 1}})
+        self.assertEqual(self.receive()['method'], 'protocol')
+        self.assertEqual(self.receive_frame(wire.STRUCT)['method'], 'select')
+
+    def receive_frame(self, wire_format):
+        header_size = main.wire.FRAME_HEADER.size
+        while len(self._received) < header_size:
+            self._received += self.referee.recv(4096)
+        length, = main.wire.FRAME_HEADER.unpack(self._received[:header_size])
+        while len(self._received) < header_size + length:
+            self._received += self.referee.recv(4096)
+        payload = self._received[header_size:header_size + length]
+        self._received = self._received[header_size + length:]
+        return main.wire.decode(payload, wire_format)
+
+
+if __name__ == '__main__':
+    unittest.main()
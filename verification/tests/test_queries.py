@@ -0,0 +1,113 @@
+"""
+Selects of items with filters and their cache within a frame.
+"""
+import json
+import os
+import random
+import sys
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from tools import ATTRIBUTE, INITIAL, PARTY, ROLE
+from tools.distances import euclidean_distance
+
+try:
+    from tornado.ioloop import IOLoop
+    import battles
+    import referee
+except ImportError:  # checkio_referee is installed only with the referee
+    battles = None
+
+ALL = {PARTY.REQUEST_NAME: PARTY.ALL, ROLE.REQUEST_NAME: ROLE.ALL}
+PLAYER_ID = 1
+
+
+@unittest.skipIf(battles is None, "checkio_referee is not installed")
+class QueriesTest(unittest.TestCase):
+
+    def setUp(self):
+        # frames are computed by the test, the callbacks of the started battle are dropped
+        self.io_loop = IOLoop()
+        self.io_loop.make_current()
+        referee.FightItem.ITEMS_COUNT = referee.CraftItem.ITEMS_COUNT = 0
+        battle_info = battles.generate_battle_info(seed=1, **battles.SCENARIOS['small'])
+        battle_info.update({INITIAL.HEADLESS: True, INITIAL.IS_STREAM: False})
+        random.seed(1)
+        self.handler = battles.BenchmarkFightHandler(json.loads(json.dumps(battle_info)))
+        self.handler.start()
+        self.unit = next(it for it in self.handler.fighters.values()
+                         if it.role == ROLE.UNIT)
+
+    def tearDown(self):
+        self.io_loop.clear_current()
+        self.io_loop.close()
+
+    def select(self, **filters):
+        return self.handler.get_group_item_info(dict(ALL, **filters), PLAYER_ID, self.unit.id)
+
+    def test_cache_hit_within_a_frame(self):
+        stats = self.handler.query_cache_stats
+        first = self.select(order_by_distance=True)
+        self.assertEqual(stats, {'hits': 0, 'misses': 1})
+        # fields are projected from the same found items
+        ids = self.select(order_by_distance=True, fields=[ATTRIBUTE.ID])
+        self.assertEqual(stats, {'hits': 1, 'misses': 1})
+        self.assertEqual(ids, [{ATTRIBUTE.ID: info[ATTRIBUTE.ID]} for info in first])
+
+    def test_cache_is_dropped_on_the_next_frame(self):
+        def found_ids():
+            return [info[ATTRIBUTE.ID] for info in self.select(types=[self.unit.item_type])]
+
+        ids = found_ids()
+        self.handler.fighters[ids[0]].hit_points = 0
+        # the same frame, the cached items
+        self.assertEqual(found_ids(), ids)
+        self.handler.compute_frame()
+        self.assertEqual(found_ids(), ids[1:])
+        self.assertEqual(self.handler.query_cache_stats, {'hits': 1, 'misses': 2})
+
+    def test_filters_against_the_plain_select(self):
+        plain = self.select()
+        fighters = self.handler.fighters
+        center = self.unit.coordinates
+
+        def distance(info, point=center):
+            return (euclidean_distance(info[ATTRIBUTE.COORDINATES], point) -
+                    info[ATTRIBUTE.SIZE] / 2)
+
+        tower_type = next(it.item_type for it in fighters.values() if it.role == ROLE.TOWER)
+        self.assertEqual(self.select(types=[tower_type]),
+                         [info for info in plain
+                          if fighters[info[ATTRIBUTE.ID]].item_type == tower_type])
+        self.assertEqual(self.select(hit_points_below=1000),
+                         [info for info in plain if info[ATTRIBUTE.HIT_POINTS] < 1000])
+        self.assertEqual(self.select(radius=20),
+                         [info for info in plain if distance(info) <= 20])
+        point = [20, 20]
+        self.assertEqual(
+            self.select(radius=10, coordinates=point),
+            [info for info in plain if distance(info, point) <= 10])
+        self.assertEqual(self.select(order_by_distance=True), sorted(plain, key=distance))
+        self.assertEqual(self.select(limit=3), plain[:3])
+        self.assertEqual(self.select(fields=[ATTRIBUTE.ID, ATTRIBUTE.ROLE]),
+                         [{ATTRIBUTE.ID: info[ATTRIBUTE.ID], ATTRIBUTE.ROLE: info[ATTRIBUTE.ROLE]}
+                          for info in plain])
+        self.assertEqual(
+            self.select(order_by_distance=True, limit=2, fields=[ATTRIBUTE.ID]),
+            [{ATTRIBUTE.ID: info[ATTRIBUTE.ID]} for info in sorted(plain, key=distance)[:2]])
+
+    def test_parties_and_roles(self):
+        plain = self.select()
+        enemy_towers = self.handler.get_group_item_info(
+            {PARTY.REQUEST_NAME: [PARTY.ENEMY], ROLE.REQUEST_NAME: [ROLE.TOWER]}, PLAYER_ID)
+        self.assertTrue(enemy_towers)
+        self.assertEqual(enemy_towers, [
+            info for info in plain if info[ATTRIBUTE.ROLE] == ROLE.TOWER and
+            info[ATTRIBUTE.PLAYER_ID] != PLAYER_ID])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+The sleeping-item scheduler runs only awake items on a frame,
+a battle must go the same way as when every item is run on every frame.
+"""
+import os
+import sys
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from tools import TimerWheel, INITIAL
+
+try:
+    import battles
+    import referee
+except ImportError:  # checkio_referee is installed only with the referee
+    battles = None
+
+
+class TimerWheelTest(unittest.TestCase):
+
+    def test_timers_farther_than_a_round(self):
+        wheel = TimerWheel(size=4)
+        wheel.schedule(1, 2)
+        wheel.schedule(2, 6)
+        self.assertEqual(wheel.pop_due(2), [1])
+        self.assertEqual(wheel.pop_due(6), [2])
+        self.assertEqual(len(wheel), 0)
+
+    def test_rescheduled_timer_fires_once(self):
+        wheel = TimerWheel(size=4)
+        wheel.schedule(1, 1)
+        wheel.schedule(1, 3)
+        self.assertEqual(wheel.pop_due(1), [])
+        self.assertEqual(wheel.pop_due(3), [1])
+
+
+def run_battle(scenario, initial):
+    # ids of items are counted by the classes, every battle starts them again
+    referee.FightItem.ITEMS_COUNT = referee.CraftItem.ITEMS_COUNT = 0
+    battle_info = battles.generate_battle_info(seed=1, **battles.SCENARIOS[scenario])
+    handler, _ = battles.run_battle(battle_info, initial, seed=1)
+    return handler
+
+
+@unittest.skipIf(battles is None, "checkio_referee is not installed")
+class SleepingItemsTest(unittest.TestCase):
+
+    def check_scenario(self, scenario):
+        awake = run_battle(scenario, {})
+        sleeping = run_battle(scenario, {INITIAL.SLEEPING_ITEMS: True})
+        # items really slept
+        self.assertLess(sleeping.scheduler.stats['runs'],
+                        len(sleeping.fighters) * sleeping.current_frame)
+        self.assertEqual(sleeping.battle_log, awake.battle_log)
+
+    def test_small(self):
+        self.check_scenario('small')
+
+    def test_towers(self):
+        self.check_scenario('towers')
+
+    def test_horde(self):
+        self.check_scenario('horde')
+
+
+if __name__ == '__main__':
+    unittest.main()
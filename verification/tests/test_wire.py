@@ -0,0 +1,41 @@
+"""
+The wire codec is kept in two copies, one for the referee and one for environments.
+"""
+import os
+import sys
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+REFEREE_WIRE = os.path.join(ROOT, 'src', 'tools', 'wire.py')
+ENVIRONMENT_WIRE = os.path.join(ROOT, 'envs', 'python_3', 'battle', 'wire.py')
+
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from tools import wire
+
+
+class WireCopiesTest(unittest.TestCase):
+
+    def test_copies_are_identical(self):
+        with open(REFEREE_WIRE, 'rb') as referee_wire, \
+                open(ENVIRONMENT_WIRE, 'rb') as environment_wire:
+            self.assertEqual(referee_wire.read(), environment_wire.read(),
+                             "src/tools/wire.py and envs/python_3/battle/wire.py differ")
+
+    def test_struct_is_chosen_only_when_offered(self):
+        self.assertNotIn(wire.STRUCT, wire.FORMATS)
+        self.assertEqual(wire.choose_format([wire.STRUCT, wire.JSON]), wire.STRUCT)
+        self.assertEqual(wire.choose_format([wire.JSON]), wire.JSON)
+
+    def test_frame_round_trip(self):
+        message = {'status': 200, 'data': [[{'id': 1, 'coordinates': [1.5, -2]},
+                                            {'id': 2, 'coordinates': [3, 4.25]}]]}
+        for wire_format in wire.SUPPORTED_FORMATS:
+            frame = wire.pack_frame(message, wire_format)
+            length, = wire.FRAME_HEADER.unpack_from(frame)
+            self.assertEqual(length, len(frame) - wire.FRAME_HEADER.size)
+            self.assertEqual(wire.decode(frame[wire.FRAME_HEADER.size:], wire_format), message)
+
+
+if __name__ == '__main__':
+    unittest.main()